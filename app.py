@@ -11,16 +11,54 @@ Setup:
     CLOUDINARY_API_KEY=...
     CLOUDINARY_API_SECRET=...
     CLOUDINARY_FOLDER=ImageGeneration   # optional (default shown)
+    JEWELGEN_DATA_DIR=./instance        # optional: local SQLite state (jobs, caches)
+    JOB_WORKERS=8                       # optional: background render threads per worker
+    HTTP_MAX_CONNECTIONS=20             # optional: pooled keep-alive connections per upstream
+
+Async mode:
+    POST /generate (and the other image endpoints) with `async: true` → 202 {job_id, status_url, events_url}
+    GET  /jobs/<id>                                                → status + the normal JSON result
+    GET  /jobs/<id>/events                                         → Server-Sent Events: stage progress, then `done`
+    POST /jobs/<id>/cancel                                         → stop it; remaining renders and uploads are skipped
+    Optional `callback_url` gets the finished job POSTed to it. `Accept: text/event-stream`
+    on the POST itself runs the job and streams its events in that same response.
+
+Render cache:
+    Identical (final prompt, model, size) renders reuse the earlier Cloudinary upload
+    (RENDER_CACHE_TTL / RENDER_CACHE_MAX); send `no_cache: true` to force a fresh image.
+
+Background uploads:
+    With UPLOAD_MODE=background (default) /generate and /api/vector-sprites return the image
+    immediately and upload it to Cloudinary from a local spool; poll GET /uploads/<id>.
+    `response: url` drops the inline base64 and uploads in the request instead, so the
+    Cloudinary URL is in the response; `response: png` returns the image body itself.
+
+Metrics:
+    GET /metrics (Prometheus text format): latency histograms per route, per stage (parse,
+    decode, sketch_preprocess, vectorize, serialize) and per upstream attempt (OpenAI model,
+    Cloudinary operation), plus retry counts and failure classes, summed over all workers.
+
+Serving:
+    gunicorn.conf.py picks threaded workers (default) or, with JEWELGEN_SERVE_MODE=async,
+    gevent workers that hold hundreds of concurrent upstream waits each. loadtest.py compares them.
+
+Batch vectorize:
+    POST /api/vectorize/batch with many `images` files or a `zip` → zip of SVGs + manifest.json
+    (or NDJSON per file with `stream=ndjson`). Runs on VECTORIZE_PROCS processes per worker.
 """
 
-import os, base64, json, io, time
+import os, base64, bisect, contextvars, functools, hashlib, heapq, itertools, json, io, mmap, time, random, select, socket, sqlite3, tempfile, threading, uuid, zipfile, multiprocessing
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from contextlib import closing, contextmanager
 import numpy as np, cv2, svgwrite
 from PIL import Image, ImageOps
-import os, json
-from flask import request, jsonify
 import cloudinary
 import cloudinary.uploader
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Request, Response, g, request, jsonify, render_template, send_from_directory, send_file, redirect
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 
@@ -31,11 +69,268 @@ load_dotenv(dotenv_path)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 print("API Key Loaded:", "✔️" if OPENAI_API_KEY else "❌")
 
+# ── Serving mode ────────────────────────────────────────────────────────────
+# JEWELGEN_SERVE_MODE=async (see gunicorn.conf.py) runs gevent workers, which
+# monkey-patch sockets, threads and locks before app.py is imported. Every
+# OpenAI/Cloudinary wait, single-flight wait and pool future then becomes a
+# greenlet switch, so one worker holds hundreds of upstream waits behind the same
+# routes and JSON. Pool defaults scale up because greenlets are cheap. CPU-heavy
+# stages (OpenCV tracing) run on gevent's native thread pool via _offload_cpu.
+try:
+    from gevent import monkey as _gevent_monkey
+    _GREEN = _gevent_monkey.is_module_patched("socket")
+except ImportError:
+    _GREEN = False
+
+def _pool_default(sync: int, green: int) -> str:
+    return str(green if _GREEN else sync)
+
+def _offload_cpu(fn, *args, **kwargs):
+    """Run CPU-bound work off the event loop under gevent; inline on threaded workers."""
+    if _GREEN:
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args, kwargs)
+    return fn(*args, **kwargs)
+
+# ── Metrics ─────────────────────────────────────────────────────────────────
+# In-process Prometheus-style counters and fixed-bucket histograms. Spans time
+# the in-process stages (request parse, image decode, sketch preprocessing,
+# vectorize, response serialization). Every upstream attempt is timed too:
+# OpenAI per model, Cloudinary per operation, with failure classes and retry
+# counts. Each worker flushes its totals to SQLite, and GET /metrics sums the
+# rows of all live workers (see "Metrics export" below).
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+_METRIC_INFO = {
+    "jewelgen_request_seconds": ("histogram", "Request latency until the response headers, by route, method and status."),
+    "jewelgen_stage_seconds": ("histogram", "Time spent in one in-process stage of a request."),
+    "jewelgen_upstream_seconds": ("histogram", "One upstream attempt: OpenAI per model, Cloudinary per operation."),
+    "jewelgen_upstream_failures_total": ("counter", "Failed or rejected upstream attempts by failure class."),
+    "jewelgen_upstream_retries_total": ("counter", "Retries made by the retry chain, per step (SDK + model)."),
+}
+
+class _Metrics:
+    """Thread-safe counters and histograms keyed by (name, sorted label pairs)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, list] = {}   # per-bucket counts, +Inf count, then the sum
+        self.dirty = False
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+            self.dirty = True
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        i = bisect.bisect_left(METRICS_BUCKETS, seconds)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(METRICS_BUCKETS) + 1) + [0.0]
+            h[i] += 1
+            h[-1] += seconds
+            self.dirty = True
+
+    def take_snapshot(self) -> list | None:
+        """[(name, labels, value)] of everything recorded so far, or None if nothing changed since the last call."""
+        with self._lock:
+            if not self.dirty:
+                return None
+            self.dirty = False
+            return ([(n, dict(l), v) for (n, l), v in self.counters.items()] +
+                    [(n, dict(l), list(h)) for (n, l), h in self.histograms.items()])
+
+_metrics = _Metrics()
+
+@contextmanager
+def _span(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _metrics.observe("jewelgen_stage_seconds", time.perf_counter() - t0, stage=stage)
+
+def _timed(stage: str):
+    """Decorator form of _span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def _failure_class(exc) -> str:
+    """Coarse, low-cardinality class of an upstream error (or an HTTP status code)."""
+    if isinstance(exc, int):
+        code = exc
+    elif isinstance(exc, _CircuitOpen):
+        return "concurrency_limit" if str(exc.detail).startswith("concurrency limit") else "circuit_open"
+    else:
+        code = _status_code(exc)
+    if code is not None:
+        return "http_429" if code == 429 else f"http_{code // 100}xx"
+    name, msg = type(exc).__name__.lower(), str(exc).lower()
+    if isinstance(exc, TimeoutError) or "timeout" in name or "timed out" in msg:
+        return "timeout"
+    if isinstance(exc, ConnectionError) or "connect" in name:
+        return "connection"
+    return "error"
+
+def _upstream_observe(upstream: str, seconds: float, error=None):
+    """Record one upstream attempt; `error` is the exception or HTTP status it failed with."""
+    _metrics.observe("jewelgen_upstream_seconds", seconds, upstream=upstream, outcome="ok" if error is None else "error")
+    if error is not None:
+        _upstream_failed(upstream, error)
+
+def _upstream_failed(upstream: str, error):
+    _metrics.inc("jewelgen_upstream_failures_total", upstream=upstream, **{"class": _failure_class(error)})
+
+# ── HTTP transport ──────────────────────────────────────────────────────────
+# One keep-alive connection pool per worker for each upstream: an httpx client
+# (HTTP/2 when the `h2` package is installed) shared by every OpenAI call, and a
+# urllib3 pool manager shared by Cloudinary upload/search/destroy. Both count
+# requests, new connections and time spent waiting for a pooled connection;
+# GET /http-pools reports them.
+import importlib.util
+import httpx
+import urllib3
+from cloudinary.api_client.tcp_keep_alive_manager import (
+    TCPKeepAlivePoolManager, TCPKeepAliveHTTPConnectionPool, TCPKeepAliveHTTPSConnectionPool,
+)
+
+HTTP_MAX_CONNECTIONS   = int(os.getenv("HTTP_MAX_CONNECTIONS", _pool_default(20, 200)))  # per upstream, per worker
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_CONNECT_TIMEOUT   = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT      = float(os.getenv("HTTP_POOL_TIMEOUT", "30"))        # max wait for a free connection
+HTTP_READ_TIMEOUT      = float(os.getenv("HTTP_READ_TIMEOUT", "90"))        # max silence from the upstream
+HTTP2 = (os.getenv("HTTP2", "1").strip().lower() not in ("0", "false", "no", "off")
+         and importlib.util.find_spec("h2") is not None)
+
+class _PoolStats:
+    """Thread-safe counters for one upstream connection pool."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = self.opened = 0
+        self.wait_total = self.wait_max = 0.0
+
+    def checkout(self, wait: float):
+        with self._lock:
+            self.requests += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def connection_opened(self):
+        with self._lock:
+            self.opened += 1
+
+    def snapshot(self, open_connections: int, idle_connections: int) -> dict:
+        with self._lock:
+            requests, opened, wait_total, wait_max = self.requests, self.opened, self.wait_total, self.wait_max
+        return {
+            "requests": requests,
+            "connections_opened": opened,
+            "connections_reused": max(0, requests - opened),
+            "connections_open": open_connections,
+            "connections_idle": idle_connections,
+            "wait_ms_total": round(wait_total * 1000, 1),
+            "wait_ms_avg": round(wait_total * 1000 / requests, 2) if requests else 0.0,
+            "wait_ms_max": round(wait_max * 1000, 1),
+        }
+
+_openai_stats = _PoolStats()
+_cloudinary_stats = _PoolStats()
+
+def _openai_trace_hook(req: httpx.Request):
+    # httpcore trace events: the first connect/send event marks the end of the pool wait
+    t0 = time.monotonic()
+    waited = []
+
+    def trace(event: str, info: dict):
+        if not waited and event in ("connection.connect_tcp.started", "http11.send_request_headers.started",
+                                    "http2.send_request_headers.started"):
+            waited.append(time.monotonic() - t0)
+            _openai_stats.checkout(waited[0])
+        if event == "connection.connect_tcp.complete":
+            _openai_stats.connection_opened()
+
+    req.extensions["trace"] = trace
+
+_openai_transport = httpx.HTTPTransport(
+    http2=HTTP2,
+    limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_SECONDS),
+)
+_openai_http = httpx.Client(
+    transport=_openai_transport,
+    timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT),
+    event_hooks={"request": [_openai_trace_hook]},
+)
+
+def _openai_pool_snapshot() -> dict:
+    conns = list(getattr(_openai_transport._pool, "connections", []))
+    return {"http2": HTTP2, **_openai_stats.snapshot(len(conns), sum(1 for c in conns if c.is_idle()))}
+
+class _CountingPool:
+    """Mixin for urllib3 connection pools: counts checkouts, pool waits and new connections."""
+    def _get_conn(self, timeout=None):
+        t0 = time.monotonic()
+        conn = super()._get_conn(timeout)
+        _cloudinary_stats.checkout(time.monotonic() - t0)
+        return conn
+
+    def _new_conn(self):
+        _cloudinary_stats.connection_opened()
+        return super()._new_conn()
+
+class _CountingHTTPPool(_CountingPool, TCPKeepAliveHTTPConnectionPool):
+    pass
+
+class _CountingHTTPSPool(_CountingPool, TCPKeepAliveHTTPSConnectionPool):
+    pass
+
+class _TimedPoolManager(TCPKeepAlivePoolManager):
+    """Times every Cloudinary API request as upstream "cloudinary:<operation>"."""
+    def urlopen(self, method, url, redirect=True, **kw):
+        op = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+        upstream = "cloudinary:" + (op if op in ("upload", "search", "destroy") else "api")
+        kw.setdefault("pool_timeout", HTTP_POOL_TIMEOUT)  # block=True: wait this long for a free connection
+        t0 = time.perf_counter()
+        try:
+            resp = super().urlopen(method, url, redirect=redirect, **kw)
+        except Exception as e:
+            _upstream_observe(upstream, time.perf_counter() - t0, e)
+            raise
+        _upstream_observe(upstream, time.perf_counter() - t0, resp.status if resp.status >= 400 else None)
+        return resp
+
+def _cloudinary_pool_manager() -> urllib3.PoolManager:
+    mgr = _TimedPoolManager(maxsize=HTTP_MAX_CONNECTIONS, block=True,
+                            timeout=urllib3.Timeout(connect=HTTP_CONNECT_TIMEOUT, read=HTTP_READ_TIMEOUT),
+                                  **cloudinary.CERT_KWARGS)
+    mgr.pool_classes_by_scheme = {"http": _CountingHTTPPool, "https": _CountingHTTPSPool}
+    return mgr
+
+def _cloudinary_pool_snapshot() -> dict:
+    idle = busy = 0
+    for key in list(_cloudinary_http.pools.keys()):
+        pool = _cloudinary_http.pools.get(key)
+        if pool is None:
+            continue
+        queued = list(pool.pool.queue) if pool.pool is not None else []
+        pooled = sum(1 for c in queued if c is not None)
+        idle += sum(1 for c in queued if c is not None and getattr(c, "sock", None) is not None)
+        busy += max(0, pool.num_connections - pooled)
+    return _cloudinary_stats.snapshot(idle + busy, idle)
+
 # ── OpenAI client (v1 preferred, legacy fallback) ───────────────────────────
 _client = None
 try:
     from openai import OpenAI  # v1+
-    _client = OpenAI(api_key=OPENAI_API_KEY or None)
+    _client = OpenAI(api_key=OPENAI_API_KEY or None, http_client=_openai_http)
 except Exception as e:
     print("⚠️ New OpenAI SDK not available:", e)
 
@@ -56,20 +351,31 @@ CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME", "")
 CLOUDINARY_API_KEY    = os.getenv("CLOUDINARY_API_KEY", "")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET", "")
 CLOUDINARY_FOLDER     = os.getenv("CLOUDINARY_FOLDER", "ImageGeneration")
+CLOUDINARY_UPLOAD_PREFIX = os.getenv("CLOUDINARY_UPLOAD_PREFIX", "")   # optional API host override
 
 cloudinary.config(
     cloud_name=CLOUDINARY_CLOUD_NAME or None,
     api_key=CLOUDINARY_API_KEY or None,
     api_secret=CLOUDINARY_API_SECRET or None,
     secure=True,
+    **({"upload_prefix": CLOUDINARY_UPLOAD_PREFIX} if CLOUDINARY_UPLOAD_PREFIX else {}),
 )
 
+# upload/destroy (uploader) and search/admin (api_client) share one pooled manager
+import cloudinary.api_client.call_api
+_cloudinary_http = _cloudinary_pool_manager()
+cloudinary.uploader._http = _cloudinary_http
+cloudinary.api_client.call_api._http = _cloudinary_http
+
 # ── Flask ───────────────────────────────────────────────────────────────────
 # We serve /static ourselves via a route below, so static_folder=None here.
 app = Flask(__name__, static_folder=None, template_folder="templates")
 CORS(app)
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # 10MB
 
+# Local state (job table, caches, indexes) lives here; shared by all gunicorn workers on the box.
+DATA_DIR = os.getenv("JEWELGEN_DATA_DIR") or app.instance_path
+
 # Serve files from ./static as /static/...
 @app.get("/static/<path:filename>")
 def static_files(filename):
@@ -138,20 +444,12 @@ def _build_constraint_text(*, allow_solitaires=False, force_cluster=True, attrs=
         " heavy shadows, perspective drift, props/mannequins, and environment scenes."
     )
 
-
-def _prep_sketch_1024(sketch_bytes: bytes, thresh: int = 200) -> str:
-    img = Image.open(io.BytesIO(sketch_bytes)).convert("L")
-    img = ImageOps.autocontrast(img)
-    bw = img.point(lambda p: 255 if p > thresh else 0, mode="1")
-    bbox = bw.getbbox() or (0, 0, img.width, img.height)
-    cropped = img.crop(bbox)
-    w, h = cropped.size
-    side = max(w, h)
-    canvas = Image.new("L", (side, side), 255)
-    canvas.paste(cropped, ((side - w) // 2, (side - h) // 2))
-    canvas = canvas.resize((1024, 1024), Image.LANCZOS)
-    buf = io.BytesIO(); canvas.save(buf, format="PNG")
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+# Guardrail sentence appended to design-variant prompts.
+LIGHT_RULES = (
+    "Lightweight and production-friendly for daily wear: slim forms, no bulky metal masses, "
+    "clustered melee diamonds instead of a solitaire center stone. Front elevation, centered, "
+    "pure white seamless background, soft studio lighting, no text, watermarks, props or mannequins."
+)
 
 def _extract_structure_json(sketch_data_url: str, jewelry_type_hint: str | None) -> dict:
     if _client is None:
@@ -166,20 +464,25 @@ def _extract_structure_json(sketch_data_url: str, jewelry_type_hint: str | None)
               "record symmetry and any critical spacing/curve constraints.")},
         {"type":"image_url","image_url":{"url": sketch_data_url}},
     ]
-    resp = _client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role":"system","content":sys},{"role":"user","content":ask}],
-        temperature=0.2, max_tokens=600
-    )
-    raw = (resp.choices[0].message.content or "").strip()
-    if raw.startswith("```"):
-        if raw.startswith("```json"): raw = raw[7:]
-        else: raw = raw[3:]
-        if raw.endswith("```"): raw = raw[:-3]
-        raw = raw.strip()
-    try:
+
+    def analyse():
+        resp = _chat_completion(
+            model="gpt-4o",
+            messages=[{"role":"system","content":sys},{"role":"user","content":ask}],
+            temperature=0.2, max_tokens=600
+        )
+        raw = (resp.choices[0].message.content or "").strip()
+        if raw.startswith("```"):
+            if raw.startswith("```json"): raw = raw[7:]
+            else: raw = raw[3:]
+            if raw.endswith("```"): raw = raw[:-3]
+            raw = raw.strip()
         return json.loads(raw)
-    except Exception:
+
+    try:
+        return _vision_cached("structure", sketch_data_url.encode("utf-8"),
+                              {"jewelry_type_hint": jewelry_type_hint}, analyse)
+    except ValueError:  # unparseable JSON; not cached
         return {}
 
 def _make_prompt_from_structure(struct: dict, metal: str, stones: str, background: str, lighting: str) -> str:
@@ -222,7 +525,7 @@ def _critique_and_rewrite_prompt(sketch_b64_png: str, gen_b64_png: str, prev_pro
         {"type":"text","text":f"Previous prompt:\n{prev_prompt}"},
     ]
     try:
-        r = _client.chat.completions.create(
+        r = _chat_completion(
             model="gpt-4o",
             messages=[{"role":"system","content":sys},{"role":"user","content":user}],
             temperature=0.2, max_tokens=350
@@ -232,44 +535,821 @@ def _critique_and_rewrite_prompt(sketch_b64_png: str, gen_b64_png: str, prev_pro
     except Exception:
         return prev_prompt
 
-def _binarize_and_center(sketch_bytes: bytes, out_size: int = 1024, thresh: int = 200) -> str:
-    img = Image.open(io.BytesIO(sketch_bytes)).convert("L")
-    img = ImageOps.autocontrast(img)
-    bw = img.point(lambda p: 255 if p > thresh else 0, mode="1")
-    bbox = bw.getbbox() or (0, 0, img.width, img.height)
-    cropped = img.crop(bbox)
-    w, h = cropped.size
-    side = max(w, h)
-    canvas = Image.new("L", (side, side), 255)
-    canvas.paste(cropped, ((side - w) // 2, (side - h) // 2))
-    canvas = canvas.resize((out_size, out_size), Image.LANCZOS)
-    buf = io.BytesIO()
-    canvas.save(buf, format="PNG")
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
-
-def _sketch_geometry_hints(sketch_bytes: bytes, thresh: int = 200) -> str:
-    img = Image.open(io.BytesIO(sketch_bytes)).convert("L")
-    bw = ImageOps.autocontrast(img).point(lambda p: 255 if p > thresh else 0, mode="1")
-    bbox = bw.getbbox() or (0, 0, img.width, img.height)
-    x0, y0, x1, y1 = bbox
-    W, H = img.width, img.height
-    left   = round((x0 / W) * 100, 1)
-    right  = round(((W - x1) / W) * 100, 1)
-    top    = round((y0 / H) * 100, 1)
-    bottom = round(((H - y1) / H) * 100, 1)
-    aw, ah = x1 - x0, y1 - y0
-    ar = round((aw / ah) if ah else 1.0, 3)
-    return (
-        f"Canvas {W}x{H}px. Content bbox margins ≈ L{left}%, R{right}%, T{top}%, B{bottom}%. "
-        f"Content aspect ratio ≈ {ar}:1 (width:height). Keep these margins and aspect."
-    )
+# ── Sketch preprocessing ────────────────────────────────────────────────────
+# One decode per sketch upload. Autocontrast runs once. The content bbox comes
+# from row/column maxima of the pixel array (no mode-"1" threshold image).
+# Callers share the result object: centered square crops (cached per output
+# size), base64 PNGs and margin/aspect hints all come from that one decode.
+class _SketchPrep:
+    def __init__(self, sketch_bytes: bytes | None = None, thresh: int = 200, *, gray: Image.Image | None = None):
+        with _span("sketch_preprocess"):
+            self.thresh = thresh
+            self.gray = gray if gray is not None else ImageOps.autocontrast(
+                Image.open(io.BytesIO(sketch_bytes)).convert("L"))
+            self.width, self.height = self.gray.size
+            a = np.asarray(self.gray)
+            # bbox of pixels brighter than `thresh` (what getbbox() of the thresholded image gave)
+            rows = np.flatnonzero(a.max(axis=1) > thresh)
+            cols = np.flatnonzero(a.max(axis=0) > thresh)
+            self.bbox = ((int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1) if rows.size
+                         else (0, 0, self.width, self.height))
+            self._png: dict[int, bytes] = {}
+
+    def centered_png(self, out_size: int = 1024) -> bytes:
+        """Content crop pasted centered on a white square, resized to out_size (PNG bytes)."""
+        png = self._png.get(out_size)
+        if png is None:
+            with _span("sketch_preprocess"):
+                cropped = self.gray.crop(self.bbox)
+                w, h = cropped.size
+                side = max(w, h)
+                canvas = Image.new("L", (side, side), 255)
+                canvas.paste(cropped, ((side - w) // 2, (side - h) // 2))
+                canvas = canvas.resize((out_size, out_size), Image.LANCZOS)
+                buf = io.BytesIO()
+                canvas.save(buf, format="PNG")
+                png = self._png[out_size] = buf.getvalue()
+        return png
+
+    def centered_b64(self, out_size: int = 1024) -> str:
+        return base64.b64encode(self.centered_png(out_size)).decode("utf-8")
+
+    def geometry_hints(self) -> str:
+        x0, y0, x1, y1 = self.bbox
+        W, H = self.width, self.height
+        left   = round((x0 / W) * 100, 1)
+        right  = round(((W - x1) / W) * 100, 1)
+        top    = round((y0 / H) * 100, 1)
+        bottom = round(((H - y1) / H) * 100, 1)
+        aw, ah = x1 - x0, y1 - y0
+        ar = round((aw / ah) if ah else 1.0, 3)
+        return (
+            f"Canvas {W}x{H}px. Content bbox margins ≈ L{left}%, R{right}%, T{top}%, B{bottom}%. "
+            f"Content aspect ratio ≈ {ar}:1 (width:height). Keep these margins and aspect."
+        )
+
+def _sketch_prep(sketch, thresh: int = 200) -> _SketchPrep:
+    """Accept raw sketch bytes or an already prepared _SketchPrep (reused when the threshold matches)."""
+    if isinstance(sketch, _SketchPrep):
+        return sketch if sketch.thresh == thresh else _SketchPrep(thresh=thresh, gray=sketch.gray)
+    return _SketchPrep(sketch, thresh)
+
+def _prep_sketch_1024(sketch, thresh: int = 200) -> str:
+    return _sketch_prep(sketch, thresh).centered_b64(1024)
+
+def _binarize_and_center(sketch, out_size: int = 1024, thresh: int = 200) -> str:
+    return _sketch_prep(sketch, thresh).centered_b64(out_size)
+
+def _sketch_geometry_hints(sketch, thresh: int = 200) -> str:
+    return _sketch_prep(sketch, thresh).geometry_hints()
 
 def _tiny_png_b64() -> str:
     return ("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAA"
             "AAC0lEQVR42mP8/wwAAwMB/ax0eQAAAABJRU5ErkJggg==")
 
-def _err(message, status=400, detail=None):
-    return jsonify({"ok": False, "error": {"message": message, "detail": detail}}), status
+def _err(message, status=400, detail=None, headers=None):
+    body = jsonify({"ok": False, "error": {"message": message, "detail": detail}})
+    return (body, status, headers) if headers else (body, status)
+
+class _JobError(Exception):
+    """Raised from endpoint work functions; carries the same fields as _err()."""
+    def __init__(self, message, status=400, detail=None, headers=None):
+        super().__init__(message)
+        self.message, self.status, self.detail, self.headers = message, status, detail, headers
+
+    def body(self) -> dict:
+        return {"ok": False, "error": {"message": self.message, "detail": self.detail}}
+
+    def response(self):
+        return _err(self.message, self.status, self.detail, self.headers)
+
+_sqlite_ready: set[str] = set()
+_sqlite_lock = threading.Lock()
+
+def _sqlite(name: str, schema: str = "") -> sqlite3.Connection:
+    """
+    Open a small SQLite database under DATA_DIR (autocommit, WAL).
+    `schema` is executed once per process the first time `name` is opened.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    db = sqlite3.connect(os.path.join(DATA_DIR, name), timeout=10, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    if name not in _sqlite_ready:
+        with _sqlite_lock:
+            if name not in _sqlite_ready:
+                db.execute("PRAGMA journal_mode=WAL")
+                if schema:
+                    db.executescript(schema)
+                _sqlite_ready.add(name)
+    return db
+
+# ── Metrics export ──────────────────────────────────────────────────────────
+# Request latency comes from before/after_request hooks. JSON parsing and
+# serialization, and multipart form parsing, are timed through the app's JSON
+# provider and request class. Each worker writes its cumulative totals to
+# metrics.sqlite3 every METRICS_FLUSH_SECONDS, one row per (process, series),
+# and a heartbeat row even when nothing changed. GET /metrics sums the rows of
+# live workers: a process whose heartbeat is older than METRICS_STALE_SECONDS
+# (exited or restarted) has its rows deleted, so its totals stop counting.
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", str(max(60.0, 6 * METRICS_FLUSH_SECONDS))))
+
+_METRICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    proc       TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    labels     TEXT NOT NULL,
+    value      TEXT NOT NULL,          -- JSON: counter value, or histogram bucket counts + sum
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (proc, name, labels)
+);
+CREATE TABLE IF NOT EXISTS metrics_procs (
+    proc    TEXT PRIMARY KEY,
+    pid     INTEGER NOT NULL,
+    seen_at REAL NOT NULL               -- last flush (heartbeat)
+);
+"""
+
+def _metrics_db() -> sqlite3.Connection:
+    return _sqlite("metrics.sqlite3", _METRICS_SCHEMA)
+
+_metrics_proc_id = uuid.uuid4().hex
+_metrics_flusher_started = False
+_metrics_flusher_lock = threading.Lock()
+
+def _metrics_after_fork():
+    # a forked worker (gunicorn --preload) starts its own series; the parent's rows stay the parent's
+    global _metrics, _metrics_proc_id, _metrics_flusher_started
+    _metrics, _metrics_proc_id, _metrics_flusher_started = _Metrics(), uuid.uuid4().hex, False
+
+os.register_at_fork(after_in_child=_metrics_after_fork)
+
+def _metrics_flush():
+    snap = _metrics.take_snapshot() or []
+    now = time.time()
+    rows = [(_metrics_proc_id, name, json.dumps(labels, sort_keys=True), json.dumps(value), now)
+            for name, labels, value in snap]
+    with closing(_metrics_db()) as db:
+        db.execute("BEGIN")
+        db.execute("INSERT OR REPLACE INTO metrics_procs (proc, pid, seen_at) VALUES (?, ?, ?)",
+                   (_metrics_proc_id, os.getpid(), now))
+        db.executemany("INSERT OR REPLACE INTO metrics (proc, name, labels, value, updated_at) VALUES (?, ?, ?, ?, ?)",
+                       rows)
+        db.execute("COMMIT")
+
+def _metrics_prune(db: sqlite3.Connection):
+    """Delete the rows of processes that stopped flushing (exited workers, earlier runs)."""
+    cutoff = time.time() - METRICS_STALE_SECONDS
+    db.execute("BEGIN")
+    db.execute("DELETE FROM metrics_procs WHERE seen_at < ?", (cutoff,))
+    db.execute("DELETE FROM metrics WHERE proc NOT IN (SELECT proc FROM metrics_procs)")
+    db.execute("COMMIT")
+
+def _metrics_flusher():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            _metrics_flush()
+        except Exception as e:
+            print("⚠️ metrics flush:", e)
+
+@app.before_request
+def _metrics_request_start():
+    global _metrics_flusher_started
+    g.metrics_t0 = time.perf_counter()
+    if not _metrics_flusher_started:
+        with _metrics_flusher_lock:
+            if not _metrics_flusher_started:
+                threading.Thread(target=_metrics_flusher, name="metrics-flusher", daemon=True).start()
+                _metrics_flusher_started = True
+
+@app.after_request
+def _metrics_request_end(resp):
+    t0 = g.get("metrics_t0")
+    if t0 is not None:
+        _metrics.observe("jewelgen_request_seconds", time.perf_counter() - t0,
+                         route=request.url_rule.rule if request.url_rule else "unmatched",
+                         method=request.method, status=str(resp.status_code))
+    return resp
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with _span("serialize"):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with _span("parse"):
+            return super().loads(s, **kwargs)
+
+class _TimedRequest(Request):
+    def _load_form_data(self):
+        if "form" in self.__dict__ or self.mimetype not in ("multipart/form-data", "application/x-www-form-urlencoded"):
+            return super()._load_form_data()  # already parsed, or nothing to parse
+        with _span("parse"):
+            super()._load_form_data()
+
+app.json = _TimedJSONProvider(app)
+
+def _prom_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+def _metrics_text() -> str:
+    """Prometheus text exposition of every live worker's flushed totals."""
+    totals: dict[tuple, object] = {}
+    with closing(_metrics_db()) as db:
+        _metrics_prune(db)
+        for r in db.execute("SELECT name, labels, value FROM metrics"):
+            key, value = (r["name"], r["labels"]), json.loads(r["value"])
+            prev = totals.get(key)
+            if prev is None:
+                totals[key] = value
+            elif isinstance(value, list):
+                totals[key] = [a + b for a, b in zip(prev, value)]
+            else:
+                totals[key] = prev + value
+
+    lines = []
+    for name, (kind, help_text) in _METRIC_INFO.items():
+        series = sorted((labels, v) for (n, labels), v in totals.items() if n == name)
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for labels_json, v in series:
+            labels = json.loads(labels_json)
+            if kind == "counter":
+                lines.append(f"{name}{_prom_labels(labels)} {v:g}")
+                continue
+            cumulative = 0
+            for le, n in zip([*map(str, METRICS_BUCKETS), "+Inf"], v[:-1]):
+                cumulative += n
+                lines.append(f"{name}_bucket{_prom_labels({**labels, 'le': le})} {cumulative}")
+            lines.append(f"{name}_sum{_prom_labels(labels)} {v[-1]:.6f}")
+            lines.append(f"{name}_count{_prom_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+# ── Upload ingestion ────────────────────────────────────────────────────────
+# Werkzeug already parses multipart bodies in small chunks. Here each file part
+# lands in an unlinked temp file (or in memory when the whole body is at most
+# INGEST_SPOOL_BYTES). Handlers then read uploads through _upload_buffer(): a
+# zero-copy view (mmap of the spool file, or the in-memory buffer) that
+# OpenCV/PIL/hashlib consume directly. A 10 MB upload therefore no longer
+# turns into 10 MB of bytes objects plus copies per request. Views are
+# released at request teardown. Work that outlives the request (async jobs)
+# must copy what it needs.
+INGEST_SPOOL_BYTES = int(os.getenv("INGEST_SPOOL_BYTES", str(512 * 1024)))
+INGEST_SPOOL_DIR   = os.getenv("INGEST_SPOOL_DIR") or None   # default: the system temp dir
+
+class _SpoolingRequest(_TimedRequest):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= INGEST_SPOOL_BYTES:
+            return io.BytesIO()
+        return tempfile.TemporaryFile(dir=INGEST_SPOOL_DIR)
+
+app.request_class = _SpoolingRequest
+
+def _upload_buffer(f):
+    """Read-only view of an uploaded file (FileStorage or stream) that stays valid until the request ends."""
+    stream = getattr(f, "stream", f)
+    if isinstance(stream, io.BytesIO):
+        view = stream.getbuffer()
+    else:
+        try:
+            fd = stream.fileno()
+            size = os.fstat(fd).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            stream.seek(0)
+            return stream.read()
+        if not size:
+            return b""
+        view = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    g.setdefault("upload_buffers", []).append(view)
+    return view
+
+def _buffer_file(buf):
+    """File-like reader over an _upload_buffer() view without copying an mmap."""
+    if isinstance(buf, mmap.mmap):
+        buf.seek(0)
+        return buf
+    return io.BytesIO(buf)
+
+@app.teardown_request
+def _release_upload_buffers(exc=None):
+    for view in g.pop("upload_buffers", ()):
+        try:
+            view.release() if isinstance(view, memoryview) else view.close()
+        except BufferError:
+            pass  # still exported (e.g. by a live numpy array); freed along with it
+
+# ── Cancellation ────────────────────────────────────────────────────────────
+# Renders for a client that has gone away cost money and hold pool threads. Each
+# job and each sync request runs under a _CancelToken. The token lives in a
+# contextvar, which _in_context copies onto pool threads. A watcher thread
+# checks every CANCEL_POLL seconds whether the client socket has closed, or
+# whether /jobs/<id>/cancel was called from any worker (job_cancels in SQLite).
+# If so it fires the token:
+# - retry chains stop: a backoff wait ends at once, and no further attempt starts;
+# - _fan_out starts nothing new and returns;
+# - Cloudinary uploads are skipped.
+# An HTTP call already on the wire finishes on its render thread, and its
+# result is dropped.
+CANCEL_POLL = float(os.getenv("CANCEL_POLL", "0.25"))
+
+class _Cancelled(_JobError):
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(f"Request cancelled ({reason}).", 499, reason)
+
+class _CancelToken:
+    def __init__(self, *, sock=None, job_id: str | None = None):
+        self.sock, self.job_id = sock, job_id
+        self.reason = None
+        self._lock = threading.Lock()
+        self._callbacks: list = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason, callbacks, self._callbacks = reason, self._callbacks, []
+        print(f"🛑 cancelling {'job ' + self.job_id if self.job_id else 'request'}: {reason}")
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                print("⚠️ cancel callback failed:", repr(e))
+
+    def on_cancel(self, fn):
+        """Call fn() when the token fires (right away if it already has)."""
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def check(self):
+        if self.reason is not None:
+            raise _Cancelled(self.reason)
+
+_cancel_ctx: contextvars.ContextVar = contextvars.ContextVar("cancel", default=None)
+
+def _check_cancelled():
+    """Raise _Cancelled (499) if the work running in this context was cancelled."""
+    token = _cancel_ctx.get()
+    if token is not None:
+        token.check()
+
+def _wait_event(event: threading.Event, timeout: float | None) -> bool:
+    """event.wait(timeout), except that it raises _Cancelled soon after this context is cancelled."""
+    token = _cancel_ctx.get()
+    if token is None:
+        return event.wait(timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        token.check()
+        left = CANCEL_POLL if deadline is None else min(CANCEL_POLL, deadline - time.monotonic())
+        if left <= 0:
+            return event.is_set()
+        if event.wait(left):
+            return True
+
+def _peer_closed(sock) -> bool:
+    """True once the client has closed its end (EOF or reset). Peeks, so no request bytes are consumed."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and not sock.recv(1, socket.MSG_PEEK)
+    except (OSError, ValueError):  # reset, or already closed on our side
+        return True
+
+class _CancelWatcher:
+    """One daemon thread per worker polling the client sockets and job_cancels rows of live tokens."""
+    def __init__(self):
+        self._tokens: set = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, token: _CancelToken):
+        with self._cond:
+            self._tokens.add(token)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cancel-watcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def discard(self, token: _CancelToken):
+        with self._cond:
+            self._tokens.discard(token)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._tokens:
+                    self._cond.wait()
+                tokens = [t for t in self._tokens if not t.cancelled]
+            try:
+                self._poll(tokens)
+            except Exception as e:
+                print("⚠️ cancel watcher:", repr(e))
+            time.sleep(CANCEL_POLL)
+
+    def _poll(self, tokens: list):
+        for t in tokens:
+            if t.sock is not None and _peer_closed(t.sock):
+                t.cancel("client disconnected")
+        jobs = {t.job_id: t for t in tokens if t.job_id and not t.cancelled}
+        if jobs:
+            with closing(_jobs_db()) as db:
+                rows = db.execute(f"SELECT job_id, reason FROM job_cancels WHERE job_id IN ({','.join('?' * len(jobs))})",
+                                  list(jobs)).fetchall()
+            for row in rows:
+                jobs[row["job_id"]].cancel(row["reason"])
+
+_cancel_watcher = _CancelWatcher()
+
+@contextmanager
+def _cancel_scope(*, sock=None, job_id: str | None = None):
+    """Run the block under a new _CancelToken, fired on client disconnect (sock) or /jobs/<job_id>/cancel."""
+    token = _CancelToken(sock=sock, job_id=job_id)
+    reset = _cancel_ctx.set(token)
+    _cancel_watcher.add(token)
+    try:
+        yield token
+    finally:
+        _cancel_watcher.discard(token)
+        _cancel_ctx.reset(reset)
+
+def _client_socket():
+    return request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+
+# ── Single-flight ───────────────────────────────────────────────────────────
+# Concurrent identical requests (double-clicks, several tabs, demos) share one
+# upstream call: the first caller runs it, the others wait for its result.
+class _SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[str, dict] = {}
+
+    def do(self, key: str, fn, *, timeout: float | None = None):
+        """
+        Run fn() once per key at a time. Followers wait up to `timeout` seconds for the
+        leader and get its return value or exception (TimeoutError if it takes longer).
+        If the leader was cancelled, a waiting follower runs fn() itself.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = {"done": threading.Event(), "value": None, "error": None}
+            if leader:
+                break
+            if not _wait_event(flight["done"], timeout):
+                raise TimeoutError(f"timed out after {timeout:g}s waiting for an identical in-flight request")
+            if isinstance(flight["error"], _Cancelled):
+                continue  # the leader's client went away, not ours
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["value"]
+
+        try:
+            flight["value"] = fn()
+            return flight["value"]
+        except BaseException as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight["done"].set()
+
+_inflight = _SingleFlight()
+
+CHAT_WAIT_TIMEOUT = float(os.getenv("CHAT_WAIT_TIMEOUT", "120"))
+
+def _chat_completion(**kwargs):
+    """_client.chat.completions.create; identical concurrent calls share one upstream request."""
+    key = "chat:" + hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    call = lambda: _guarded_call(f"chat:{kwargs.get('model')}", lambda: _client.chat.completions.create(**kwargs))
+    return _inflight.do(key, call, timeout=CHAT_WAIT_TIMEOUT)
+
+# ── Retry scheduler ─────────────────────────────────────────────────────────
+# A failed attempt computes its jittered backoff (at least the server's
+# Retry-After); each retry chain has an overall deadline budget.
+# - Renders (_retry_chain) run their attempts on the thread that needs the
+#   result, so renders in flight are bounded by the job/render pools alone, and
+#   wait out a backoff on an Event that a cancellation sets early. With gevent
+#   workers (JEWELGEN_SERVE_MODE=async) that wait parks a greenlet, not a
+#   thread. With threaded workers the request/job thread blocks through it, as it
+#   already does for the upstream call itself.
+# - Background work (upload retries, webhooks) never waits on a thread: the next
+#   attempt goes onto a timer heap, and one scheduler thread hands due attempts
+#   to the small retry pool.
+RETRY_WORKERS    = int(os.getenv("RETRY_WORKERS", _pool_default(8, 500)))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1.5"))   # seconds; doubles per retry
+RETRY_MAX_DELAY  = float(os.getenv("RETRY_MAX_DELAY", "30"))
+RETRY_STATUSES   = (408, 409, 429, 500, 502, 503, 504)
+
+_retry_pool = ThreadPoolExecutor(max_workers=RETRY_WORKERS, thread_name_prefix="retry")
+
+class _Scheduler:
+    """Run callables on an executor after a delay: one daemon thread + a heap, no sleeping workers."""
+    def __init__(self, executor):
+        self._executor = executor
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def call_later(self, delay: float, fn, *args):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + max(0.0, delay), next(self._seq), fn, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, fn, args = heapq.heappop(self._heap)
+            try:
+                self._executor.submit(fn, *args)
+            except RuntimeError as e:  # executor shut down
+                print("⚠️ scheduler dropped a task:", e)
+
+_scheduler = _Scheduler(_retry_pool)
+
+def _status_code(exc) -> int | None:
+    code = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+def _retry_after(exc) -> float | None:
+    """Seconds from Retry-After / retry-after-ms on the error's HTTP response, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+def _is_transient(exc) -> bool:
+    if isinstance(exc, _JobError):  # incl. an open circuit: move on instead of backing off
+        return False
+    code = _status_code(exc)
+    if code is not None:
+        return code in RETRY_STATUSES
+    msg = str(exc).lower()
+    return isinstance(exc, (TimeoutError, ConnectionError)) or any(
+        x in msg for x in ["502", "503", "504", "timeout", "timed out", "bad gateway", "temporar", "connection"])
+
+def _backoff(n: int) -> float:
+    """Equal-jitter exponential backoff for the n-th retry (0-based)."""
+    d = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** n)
+    return d / 2 + random.uniform(0, d / 2)
+
+def _backoff_wait(delay: float):
+    """
+    Wait out a retry backoff in the caller (a greenlet under gevent, else its thread);
+    cancelling its context ends the wait at once.
+    """
+    wake = threading.Event()
+    token = _cancel_ctx.get()
+    if token is not None:
+        token.on_cancel(wake.set)
+    wake.wait(delay)
+    _check_cancelled()
+
+def _retry_chain(steps: list, *, budget: float):
+    """
+    Try `steps` = [(label, fn(timeout) -> result or None, tries)] in order in the caller.
+    A step succeeds when fn returns something truthy. A transient error is retried after a
+    backoff (at least the Retry-After), waited out in place (see _backoff_wait). Other
+    errors, or running out of tries, move on to the next step. Each call gets the remaining budget as its timeout. Returns the
+    first result, or None once steps or budget run out. If every step was rejected by an
+    open circuit (_CircuitOpen), raises that error instead. Raises _Cancelled between
+    attempts once the calling context is cancelled.
+    """
+    deadline = time.monotonic() + budget
+    open_error, tried, retries = None, False, 0
+
+    def fallback(i: int, reason: str):
+        if i + 1 < len(steps):
+            _job_event("fallback", step=steps[i][0], to=steps[i + 1][0], reason=reason)
+
+    for i, (label, fn, tries) in enumerate(steps):
+        n = 0
+        while True:
+            if n >= tries:
+                fallback(i, "no result")
+                break
+            _check_cancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"⚠️ {label}: retry budget exhausted ({budget:g}s)")
+                return None
+            n += 1
+            _job_event("attempt", step=label, attempt=n, tries=tries)
+            try:
+                result = fn(remaining)
+            except _CircuitOpen as e:
+                open_error = e
+                fallback(i, _failure_class(e))
+                break
+            except Exception as e:
+                tried = True
+                print(f"⚠️ {label} attempt {n}/{tries} failed:", e)
+                if not _is_transient(e) or n >= tries:
+                    fallback(i, _failure_class(e))
+                    break
+                delay = max(_backoff(retries), _retry_after(e) or 0.0)
+                retries += 1
+                _metrics.inc("jewelgen_upstream_retries_total", step=label)
+                if time.monotonic() + delay >= deadline:
+                    print(f"⚠️ {label}: retry budget exhausted ({budget:g}s)")
+                    return None
+                _job_event("retry", step=label, attempt=n, error=_failure_class(e), delay_s=round(delay, 2))
+                _backoff_wait(delay)
+                continue
+            if result:
+                return result
+            tried = True
+    if open_error is not None and not tried:
+        raise open_error  # every step was short-circuited: fail fast with 503
+    return None
+
+# ── Vision cache ────────────────────────────────────────────────────────────
+# GPT-4o image analyses keyed on (sha256(image), endpoint, prompt-template version,
+# form params). Memory-bounded LRU; set VISION_CACHE_PERSIST=1 to also keep
+# results in SQLite so they survive restarts and are shared between workers.
+VISION_CACHE_MAX_BYTES = int(os.getenv("VISION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+VISION_CACHE_PERSIST   = _coerce_bool(os.getenv("VISION_CACHE_PERSIST", "0"))
+VISION_CACHE_TTL       = int(os.getenv("VISION_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Bump an entry whenever that endpoint's instructions change so old analyses are not reused.
+VISION_PROMPT_VERSIONS = {
+    "generate_prompts": 1,
+    "text_from_image":  1,
+    "vector_sprites":   1,
+    "structure":        1,
+}
+
+_VISION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vision (
+    key        TEXT PRIMARY KEY,
+    value      TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+class _LRUCache:
+    """Thread-safe LRU of JSON-able values, bounded by the size of their JSON encoding."""
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, tuple[object, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: str, value, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, sz) = self._items.popitem(last=False)
+                self._bytes -= sz
+
+_vision_mem = _LRUCache(VISION_CACHE_MAX_BYTES)
+
+def _vision_cache_key(endpoint: str, image_bytes, params: dict | None = None) -> str:
+    # image_bytes: the uploaded bytes (any buffer), or their sha256 hexdigest
+    h = image_bytes if isinstance(image_bytes, str) else hashlib.sha256(image_bytes).hexdigest()
+    meta = json.dumps([endpoint, VISION_PROMPT_VERSIONS.get(endpoint, 0), params or {}], sort_keys=True)
+    return f"{endpoint}:{h}:{hashlib.sha256(meta.encode('utf-8')).hexdigest()[:16]}"
+
+def _vision_cached(endpoint: str, image_bytes, params: dict | None, compute, *, refresh: bool = False):
+    """
+    Return compute() for this image/endpoint/params, reusing an earlier result when possible.
+    `image_bytes` is the original upload (or its sha256 hexdigest), never the normalized copy.
+    Exceptions from compute() propagate and are not cached. `refresh` skips the lookup.
+    """
+    key = _vision_cache_key(endpoint, image_bytes, params)
+    if not refresh:
+        hit = _vision_mem.get(key)
+        if hit is not None:
+            return hit
+        if VISION_CACHE_PERSIST:
+            try:
+                with closing(_sqlite("vision_cache.sqlite3", _VISION_SCHEMA)) as db:
+                    row = db.execute("SELECT value FROM vision WHERE key=? AND created_at>=?",
+                                     (key, time.time() - VISION_CACHE_TTL)).fetchone()
+                if row is not None:
+                    value = json.loads(row["value"])
+                    _vision_mem.put(key, value, len(row["value"]))
+                    return value
+            except Exception as e:
+                print("⚠️ vision cache read failed:", e)
+
+    value = compute()
+    encoded = json.dumps(value)
+    _vision_mem.put(key, value, len(encoded))
+    if VISION_CACHE_PERSIST:
+        try:
+            with closing(_sqlite("vision_cache.sqlite3", _VISION_SCHEMA)) as db:
+                db.execute("INSERT OR REPLACE INTO vision(key, value, created_at) VALUES (?, ?, ?)",
+                           (key, encoded, time.time()))
+        except Exception as e:
+            print("⚠️ vision cache write failed:", e)
+    return value
+
+# ── Vision input ────────────────────────────────────────────────────────────
+# GPT-4o fits every image into 2048×2048 and then scales the short side to
+# 768px before looking at it, so pixels beyond that only add upload bytes and
+# latency. Uploads are EXIF-rotated, downscaled to those bounds (JPEGs are
+# decoded straight at 1/2–1/8 scale), and re-encoded as compact JPEG (or WebP).
+# The data URL carries the real MIME type. Small JPEG/PNG/WebP/GIF files that
+# are already in bounds go through unchanged. The vision cache keys on the
+# original upload for every endpoint, so generate_prompts and text-from-image
+# skip this step on a hit.
+VISION_LONG_SIDE         = int(os.getenv("VISION_LONG_SIDE", "2048"))
+VISION_SHORT_SIDE        = int(os.getenv("VISION_SHORT_SIDE", "768"))
+VISION_FORMAT            = (os.getenv("VISION_FORMAT") or "jpeg").strip().lower()   # jpeg | webp
+VISION_QUALITY           = int(os.getenv("VISION_QUALITY", "85"))
+VISION_PASSTHROUGH_BYTES = int(os.getenv("VISION_PASSTHROUGH_BYTES", str(256 * 1024)))
+
+_VISION_MIME = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+def _vision_image(data: bytes) -> tuple[bytes, str]:
+    """(image bytes, MIME type) to send to a vision model for one upload."""
+    with _span("vision_normalize"):
+        try:
+            img = Image.open(_buffer_file(data))
+            fmt, (w, h) = img.format, img.size
+            orientation = img.getexif().get(0x0112, 1)
+            if orientation in (5, 6, 7, 8):
+                w, h = h, w
+            scale = min(1.0, VISION_LONG_SIDE / max(w, h), VISION_SHORT_SIDE / min(w, h))
+            sendable = fmt in _VISION_MIME and orientation == 1 and not getattr(img, "is_animated", False)
+            if sendable and scale >= 1.0 and len(data) <= VISION_PASSTHROUGH_BYTES:
+                return bytes(data), _VISION_MIME[fmt]
+
+            target = (max(1, round(w * scale)), max(1, round(h * scale)))
+            if fmt == "JPEG":
+                img.draft("RGB", target if orientation not in (5, 6, 7, 8) else target[::-1])
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))  # motifs are shot on white
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            if img.size != target:
+                img = img.resize(target, Image.LANCZOS, reducing_gap=3.0)
+
+            buf = io.BytesIO()
+            if VISION_FORMAT == "webp":
+                img.save(buf, format="WEBP", quality=VISION_QUALITY, method=4)
+                mime = "image/webp"
+            else:
+                img.save(buf, format="JPEG", quality=VISION_QUALITY)
+                mime = "image/jpeg"
+        except Exception as e:
+            raise _JobError("Unsupported or corrupt image.", 400, str(e))
+        if sendable and buf.tell() >= len(data):
+            return bytes(data), _VISION_MIME[fmt]  # re-encoding didn't help (flat art, tiny files)
+        return buf.getvalue(), mime
+
+def _data_url(body: bytes, mime: str) -> str:
+    return f"data:{mime};base64,{base64.b64encode(body).decode('ascii')}"
+
+def _vision_data_url(data) -> str:
+    return _data_url(*_vision_image(data))
 
 def _safe_prompt_for_context(prompt: str, max_len: int = 950) -> str:
     """
@@ -290,13 +1370,15 @@ def _safe_prompt_for_context(prompt: str, max_len: int = 950) -> str:
         s = s[: max_len - 1].rstrip() + "…"
     return s
 
-def _upload_to_cloudinary(*, b64_png: str = None, remote_url: str = None,
+def _upload_to_cloudinary(*, png: bytes = None, remote_url: str = None,
                           folder=CLOUDINARY_FOLDER, prompt_ctx: str = "",
                           album: str = "") -> dict:
     """
-    Upload PNG (base64) OR remote URL to Cloudinary.
+    Upload PNG bytes OR remote URL to Cloudinary (bytes go up as-is, no base64).
     Saves prompt and album into `context` so the Gallery can show it later.
+    Raises _Cancelled instead of uploading once the request/job was cancelled.
     """
+    _check_cancelled()
     if not (CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET):
         raise RuntimeError("Cloudinary environment variables are not configured")
 
@@ -311,7 +1393,7 @@ def _upload_to_cloudinary(*, b64_png: str = None, remote_url: str = None,
         tags.append(album)
 
     if remote_url:
-        return cloudinary.uploader.upload(
+        up = cloudinary.uploader.upload(
             remote_url,
             folder=folder,
             resource_type="image",
@@ -320,80 +1402,1003 @@ def _upload_to_cloudinary(*, b64_png: str = None, remote_url: str = None,
             unique_filename=True,
             overwrite=False,
         )
+    else:
+        if png is None:
+            raise ValueError("Provide either png or remote_url")
 
-    if b64_png is None:
-        raise ValueError("Provide either b64_png or remote_url")
+        file_obj = io.BytesIO(png)  # shares the bytes buffer; no copy until written to
 
-    if b64_png.startswith("data:image"):
-        b64_png = b64_png.split(",", 1)[-1]
+        up = cloudinary.uploader.upload(
+            file_obj,
+            folder=folder,
+            resource_type="image",
+            format="png",
+            tags=tags,
+            context=context,
+            unique_filename=True,
+            overwrite=False,
+        )
 
-    data = base64.b64decode(b64_png)
-    file_obj = io.BytesIO(data)
+    _job_event("upload", status="done", url=up.get("secure_url"), public_id=up.get("public_id"))
+    if folder == CLOUDINARY_FOLDER:
+        _gallery_add(up, prompt=context.get("prompt", ""), album=album)
+    return up
 
+def _cloudinary_upload_fileobj(f, *, folder=CLOUDINARY_FOLDER, context=None, tags=None) -> dict:
+    """
+    Upload a user-supplied file (werkzeug FileStorage or any file-like) to Cloudinary as-is.
+    """
+    if not (CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET):
+        raise RuntimeError("Cloudinary environment variables are not configured")
+
+    stream = getattr(f, "stream", f)
+    stream.seek(0)
     return cloudinary.uploader.upload(
-        file_obj,
+        stream,
         folder=folder,
         resource_type="image",
-        format="png",
-        tags=tags,
-        context=context,
+        tags=["jewelgen"] + list(tags or []),
+        context=context or {},
         unique_filename=True,
         overwrite=False,
     )
 
-def _images_generate_with_retries(prompt: str, model_pref: str = "auto", *, tries=3, timeout=90):
-    b64 = None
-    url = None
-    backoff = 1.5
+# ── Upstream guard (circuit breaker + adaptive concurrency) ─────────────────
+# One guard per upstream model ("image:dall-e-3", "chat:gpt-4o"), per worker.
+# - Circuit breaker: BREAKER_FAILURES consecutive transient failures, or a
+#   BREAKER_ERROR_RATE share of the last BREAKER_WINDOW calls, opens it. While
+#   open, calls fail fast with 503 + Retry-After. After BREAKER_COOLDOWN one
+#   half-open probe decides whether to close it again.
+# - AIMD limiter: concurrent calls are capped at `limit`. Each healthy response
+#   adds 1/limit. A 429/5xx/timeout halves it, and so does latency above
+#   LIMIT_LATENCY_FACTOR × the observed baseline. Callers over the cap wait up
+#   to LIMIT_WAIT_SECONDS, then get a 503.
+# Non-transient errors (400s, content policy) count as healthy responses.
+BREAKER_FAILURES     = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_ERROR_RATE   = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_WINDOW       = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_COOLDOWN     = float(os.getenv("BREAKER_COOLDOWN", "30"))
+LIMIT_INITIAL        = int(os.getenv("LIMIT_INITIAL", "8"))
+LIMIT_MIN            = int(os.getenv("LIMIT_MIN", "1"))
+LIMIT_MAX            = int(os.getenv("LIMIT_MAX", "32"))
+LIMIT_WAIT_SECONDS   = float(os.getenv("LIMIT_WAIT_SECONDS", "10"))
+LIMIT_LATENCY_FACTOR = float(os.getenv("LIMIT_LATENCY_FACTOR", "2.5"))
+
+class _CircuitOpen(_JobError):
+    def __init__(self, key: str, retry_in: float, reason: str = "circuit open"):
+        wait = max(1, int(retry_in + 0.999))
+        super().__init__(f"Upstream {key} is temporarily unavailable ({reason}). Please retry in {wait}s.", 503,
+                         reason, headers={"Retry-After": str(wait)})
+
+class _UpstreamGuard:
+    def __init__(self, key: str):
+        self.key = key
+        self._cond = threading.Condition()
+        self.state = "closed"              # closed | open | half_open
+        self.opened_at = 0.0
+        self.consecutive = 0
+        self.window: list[bool] = []       # recent outcomes, True = failure
+        self.probing = False
+        self.limit = float(LIMIT_INITIAL)
+        self.in_flight = 0
+        self.baseline = None               # slow-moving low-water latency (s)
+        self.ewma = None
+        self.last_decrease = 0.0
+        self.calls = self.failures = self.rejected = 0
+
+    def acquire(self) -> bool:
+        """Admit one call (returns True if it is the half-open probe) or raise _CircuitOpen."""
+        with self._cond:
+            now = time.monotonic()
+            if self.state == "open":
+                if now - self.opened_at < BREAKER_COOLDOWN:
+                    self.rejected += 1
+                    raise _CircuitOpen(self.key, self.opened_at + BREAKER_COOLDOWN - now)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self.probing:
+                    self.rejected += 1
+                    raise _CircuitOpen(self.key, 1.0, "recovery probe in flight")
+                self.probing = True
+                self.in_flight += 1
+                return True
+            deadline = now + LIMIT_WAIT_SECONDS
+            while self.in_flight >= int(self.limit):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    self.rejected += 1
+                    raise _CircuitOpen(self.key, 1.0, f"concurrency limit {int(self.limit)} reached")
+                self._cond.wait(left)
+            self.in_flight += 1
+            return False
+
+    def check(self):
+        """Raise _CircuitOpen while the breaker is open, without taking the half-open probe."""
+        with self._cond:
+            left = self.opened_at + BREAKER_COOLDOWN - time.monotonic()
+            if self.state == "open" and left > 0:
+                raise _CircuitOpen(self.key, left)
+
+    def release(self, healthy: bool, latency: float, probe: bool):
+        with self._cond:
+            now = time.monotonic()
+            self.in_flight -= 1
+            self.calls += 1
+            if probe:
+                self.probing = False
+            self.window = (self.window + [not healthy])[-BREAKER_WINDOW:]
+            if healthy:
+                self.consecutive = 0
+                if self.state == "half_open":
+                    self.state, self.window = "closed", []
+                self.ewma = latency if self.ewma is None else 0.8 * self.ewma + 0.2 * latency
+                self.baseline = latency if self.baseline is None else min(latency, self.baseline * 1.01)
+                if latency > LIMIT_LATENCY_FACTOR * self.baseline:
+                    self._decrease(now)
+                else:
+                    self.limit = min(float(LIMIT_MAX), self.limit + 1.0 / self.limit)
+            else:
+                self.failures += 1
+                self.consecutive += 1
+                rate = sum(self.window) / len(self.window)
+                if (self.state == "half_open" or self.consecutive >= BREAKER_FAILURES
+                        or (len(self.window) >= BREAKER_WINDOW // 2 and rate >= BREAKER_ERROR_RATE)):
+                    if self.state != "open":
+                        print(f"⚠️ circuit {self.key} opened ({self.consecutive} consecutive failures, {rate:.0%} of recent calls)")
+                    self.state, self.opened_at, self.window = "open", now, []
+                self._decrease(now)
+            self._cond.notify_all()
+
+    def _decrease(self, now: float):
+        # at most one multiplicative decrease per second so a burst of failures doesn't collapse to 1
+        if now - self.last_decrease >= 1.0:
+            self.limit = max(float(LIMIT_MIN), self.limit / 2)
+            self.last_decrease = now
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            retry_in = max(0.0, self.opened_at + BREAKER_COOLDOWN - time.monotonic()) if self.state == "open" else 0.0
+            return {
+                "state": self.state,
+                "retry_in_s": round(retry_in, 1),
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "latency_ewma_ms": round(self.ewma * 1000) if self.ewma is not None else None,
+                "latency_baseline_ms": round(self.baseline * 1000) if self.baseline is not None else None,
+                "calls": self.calls,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "consecutive_failures": self.consecutive,
+            }
 
-    if _client:
-        client = _client.with_options(timeout=timeout)
-        models = [model_pref] if model_pref in ("gpt-image-1", "dall-e-3") else ["dall-e-3", "gpt-image-1"]
-        for m in models:
-            for attempt in range(tries):
-                try:
-                    resp = client.images.generate(
-                        model=m,
-                        prompt=prompt,
-                        size="1024x1024",
-                        n=1,
-                        response_format="b64_json",
-                    )
-                    d = resp.data[0]
-                    b64 = getattr(d, "b64_json", None) or (d.get("b64_json") if isinstance(d, dict) else None)
-                    url = getattr(d, "url", None) or (d.get("url") if isinstance(d, dict) else None)
-                    if b64 or url:
-                        return b64, url
-                except Exception as e:
-                    msg = str(e).lower()
-                    print(f"⚠️ newSDK {m} attempt {attempt+1}/{tries} failed:", e)
-                    if any(x in msg for x in ["502", "503", "504", "timeout", "bad gateway", "temporar"]):
-                        time.sleep(backoff); backoff *= 2
-                        continue
-                    break
+_guards: dict[str, _UpstreamGuard] = {}
+_guards_lock = threading.Lock()
 
+def _guard(key: str) -> _UpstreamGuard:
+    with _guards_lock:
+        guard = _guards.get(key)
+        if guard is None:
+            guard = _guards[key] = _UpstreamGuard(key)
+        return guard
+
+def _all_shed(errors: list):
+    """
+    Batch endpoints: if every item failed because a breaker shed it, raise the
+    longest-wait _CircuitOpen (503 + Retry-After) instead of answering 200.
+    `errors` holds one entry per item, None for items that worked.
+    """
+    if errors and all(isinstance(e, _CircuitOpen) for e in errors):
+        raise max(errors, key=lambda e: int(e.headers["Retry-After"]))
+
+def _guarded_call(key: str, fn):
+    """Run fn() under the breaker/limiter for `key`; raises _CircuitOpen (503) instead of calling when tripped."""
+    guard = _guard(key)
+    try:
+        probe = guard.acquire()
+    except _CircuitOpen as e:
+        _upstream_failed(key, e)
+        raise
+    t0 = time.monotonic()
+    try:
+        result = fn()
+    except Exception as e:
+        guard.release(not _is_transient(e), time.monotonic() - t0, probe)
+        _upstream_observe(key, time.monotonic() - t0, e)
+        raise
+    guard.release(True, time.monotonic() - t0, probe)
+    _upstream_observe(key, time.monotonic() - t0)
+    return result
+
+IMAGE_SIZE = "1024x1024"
+IMAGE_RETRY_BUDGET = float(os.getenv("IMAGE_RETRY_BUDGET", "180"))   # seconds for all attempts of one render
+
+# our retry chain owns retries/backoff for images; the SDK's own retries would stack
+# on top of it and ignore cancellation
+_images_client_for = (None, None)   # (_client, its no-retry copy)
+
+def _images_client():
+    """_client with SDK retries off, derived on use so a replaced _client (tests, bench.py) is honoured."""
+    global _images_client_for
+    base, derived = _images_client_for
+    if base is not _client:
+        derived = _client.with_options(max_retries=0) if _client else None
+        _images_client_for = (_client, derived)
+    return derived
+
+def _images_generate_with_retries(prompt: str, model_pref: str = "auto", *, tries=3, timeout=90,
+                                  budget: float = IMAGE_RETRY_BUDGET):
+    """
+    Returns (png_bytes, url) or (None, None). The b64_json payload is decoded exactly once
+    here; callers upload/serve the bytes. Concurrent calls with the same prompt and model
+    share one upstream render (and its bytes); a caller joining one waits at most `budget` seconds.
+    """
+    key = "image:" + _render_cache_key(prompt, model_pref)
+    fn = lambda: _images_generate(prompt, model_pref, tries=tries, timeout=timeout, budget=budget)
+    return _inflight.do(key, fn, timeout=budget) or (None, None)
+
+def _image_from_response(resp):
+    d = resp.data[0]
+    b64 = getattr(d, "b64_json", None) or (d.get("b64_json") if isinstance(d, dict) else None)
+    url = getattr(d, "url", None) or (d.get("url") if isinstance(d, dict) else None)
+    if b64:
+        with _span("decode"):
+            png = base64.b64decode(b64)
+        _job_event("image", bytes=len(png))
+        return png, url
+    if url:
+        _job_event("image", url=url)
+        return None, url
+    return None
+
+def _images_generate(prompt: str, model_pref: str = "auto", *, tries=3, timeout=90,
+                     budget: float = IMAGE_RETRY_BUDGET):
+    """
+    Retry chain over (v1 SDK, legacy SDK) × models, `tries` attempts each, within `budget`
+    seconds, on the calling thread. Returns (png_bytes, url) or None.
+    """
+    models = [model_pref] if model_pref in ("gpt-image-1", "dall-e-3") else ["dall-e-3", "gpt-image-1"]
+    steps, client = [], _images_client()
+    if client:
+        for m in models:
+            steps.append((f"newSDK {m}", lambda left, m=m: _guarded_call(f"image:{m}", lambda: _image_from_response(
+                client.images.generate(
+                    model=m, prompt=prompt, size=IMAGE_SIZE, n=1, response_format="b64_json",
+                    timeout=min(timeout, left),  # per request; the pooled client is shared
+                ))), tries))
     if _legacy:
-        models = [model_pref] if model_pref in ("gpt-image-1", "dall-e-3") else ["dall-e-3", "gpt-image-1"]
         for m in models:
-            for attempt in range(tries):
-                try:
-                    resp = _legacy.images.generate(
-                        model=m, prompt=prompt, size="1024x1024", n=1, response_format="b64_json"
-                    )
-                    d = resp.data[0]
-                    b64 = getattr(d, "b64_json", None) or (d.get("b64_json") if isinstance(d, dict) else None)
-                    url = getattr(d, "url", None) or (d.get("url") if isinstance(d, dict) else None)
-                    if b64 or url:
-                        return b64, url
-                except Exception as e:
-                    msg = str(e).lower()
-                    print(f"⚠️ legacy {m} attempt {attempt+1}/{tries} failed:", e)
-                    if any(x in msg for x in ["502", "503", "504", "timeout", "bad gateway", "temporar"]):
-                        time.sleep(backoff); backoff *= 2
-                        continue
-                    break
+            steps.append((f"legacy {m}", lambda left, m=m: _guarded_call(f"image:{m}", lambda: _image_from_response(
+                _legacy.images.generate(model=m, prompt=prompt, size=IMAGE_SIZE, n=1, response_format="b64_json")
+            )), tries))
+    return _retry_chain(steps, budget=budget)
+
+# ── Background jobs ─────────────────────────────────────────────────────────
+# Image endpoints accept `async` (JSON body, form field or ?async=1). The request
+# thread then only parses input and returns 202 + job id; the OpenAI render and
+# Cloudinary upload run on a bounded in-process pool. Job state lives in SQLite
+# so /jobs/<id> can be polled through any gunicorn worker.
+JOB_WORKERS     = int(os.getenv("JOB_WORKERS", _pool_default(8, 200)))
+JOB_QUEUE_MAX   = int(os.getenv("JOB_QUEUE_MAX", "200"))   # queued + running
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+
+_JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    status       TEXT NOT NULL,          -- queued | running | succeeded | failed | cancelled
+    status_code  INTEGER,
+    result       TEXT,                   -- JSON body the sync endpoint would have returned
+    callback_url TEXT,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs(updated_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq    INTEGER NOT NULL,
+    ts     REAL NOT NULL,
+    type   TEXT NOT NULL,            -- queued | running | prompt | attempt | retry | fallback | image | upload | ...
+    data   TEXT NOT NULL,            -- JSON object
+    PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS job_cancels (
+    job_id     TEXT PRIMARY KEY,
+    reason     TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+_JOB_DONE = ("succeeded", "failed", "cancelled")
+
+_job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_job_slots = threading.BoundedSemaphore(JOB_QUEUE_MAX)
+
+def _jobs_db() -> sqlite3.Connection:
+    return _sqlite("jobs.sqlite3", _JOBS_SCHEMA)
+
+def _wants_ndjson() -> bool:
+    fmt = (request.args.get("stream") or request.form.get("stream") or "").strip().lower()
+    return fmt == "ndjson" or "application/x-ndjson" in (request.headers.get("Accept") or "")
+
+def _wants_async(data: dict | None = None) -> bool:
+    v = request.args.get("async") or (data or {}).get("async") or request.form.get("async")
+    return _coerce_bool(v or False)
+
+def _callback_url(data: dict | None = None) -> str:
+    url = ((data or {}).get("callback_url") or request.form.get("callback_url") or "").strip()
+    if url and not url.lower().startswith(("http://", "https://")):
+        raise _JobError("callback_url must be an http(s) URL.", 400)
+    return url
+
+CALLBACK_TRIES  = 3
+CALLBACK_BUDGET = 60.0   # seconds for all attempts of one webhook
+
+def _post_callback(url: str, body: dict):
+    """
+    Best-effort webhook: POST the finished job as JSON on the retry pool. A transient
+    failure puts the next attempt on the scheduler's timer heap; no thread waits out a backoff.
+    """
+    data = json.dumps(body).encode("utf-8")
+    deadline = time.monotonic() + CALLBACK_BUDGET
+
+    def attempt(n: int):
+        left = deadline - time.monotonic()
+        try:
+            req = urllib.request.Request(url, data=data, method="POST",
+                                         headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(req, timeout=max(0.1, min(10, left))) as r:
+                r.read()
+            return
+        except Exception as e:
+            print(f"⚠️ job callback attempt {n}/{CALLBACK_TRIES} failed:", e)
+            if n >= CALLBACK_TRIES or not _is_transient(e):
+                return
+            delay = max(_backoff(n - 1), _retry_after(e) or 0.0)
+            if time.monotonic() + delay >= deadline:
+                print(f"⚠️ job callback: retry budget exhausted ({CALLBACK_BUDGET:g}s)")
+                return
+            _metrics.inc("jewelgen_upstream_retries_total", step="job callback")
+            _scheduler.call_later(delay, attempt, n + 1)
+
+    _retry_pool.submit(attempt, 1)
+
+# ── Job progress events ─────────────────────────────────────────────────────
+# While a job runs, code along its path calls _job_event("attempt", ...) etc. The
+# current job travels in a contextvar. The fan-out pool copies it into its
+# threads, so upstream attempts made on the job's behalf are attributed to it.
+# Events go to SQLite, where /jobs/<id>/events can stream them as SSE from any
+# gunicorn worker. Outside a job (sync requests) _job_event is a no-op.
+JOB_EVENTS_POLL      = float(os.getenv("JOB_EVENTS_POLL", "0.25"))      # seconds between SQLite polls
+JOB_EVENTS_HEARTBEAT = float(os.getenv("JOB_EVENTS_HEARTBEAT", "15"))   # SSE comment when idle, for proxies
+
+class _JobEvents:
+    def __init__(self, job_id: str, seq: int = 0):
+        self.job_id = job_id
+        self._seq = seq
+        self._lock = threading.Lock()  # fan-out threads emit concurrently; keep seq order == commit order
+
+    def emit(self, type: str, data: dict):
+        try:
+            with self._lock, closing(_jobs_db()) as db:
+                self._seq += 1
+                db.execute("INSERT INTO job_events(job_id, seq, ts, type, data) VALUES (?, ?, ?, ?, ?)",
+                           (self.job_id, self._seq, time.time(), type, json.dumps(data, default=str)))
+        except Exception as e:
+            print(f"⚠️ job {self.job_id} event {type!r} dropped:", repr(e))
+
+_job_ctx: contextvars.ContextVar = contextvars.ContextVar("job_events", default=None)
+
+def _job_event(type: str, **data):
+    """Record a progress event for the job running in this context (no-op otherwise)."""
+    events = _job_ctx.get()
+    if events is not None:
+        events.emit(type, data)
+
+def _in_context(fn):
+    """fn bound to a copy of the caller's contextvars, for handing to a pool thread."""
+    ctx = contextvars.copy_context()
+    return lambda *args: ctx.copy().run(fn, *args)
+
+def _sse(type: str, data: dict, event_id=None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _job_event_stream(job_id: str, after: int = 0):
+    """
+    SSE for one job: every stored event after `after` (event id = seq), a comment
+    every JOB_EVENTS_HEARTBEAT idle seconds, and finally `done` with the job record.
+    """
+    yield "retry: 2000\n\n"
+    last_sent = time.monotonic()
+    while True:
+        with closing(_jobs_db()) as db:
+            row = db.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+            events = db.execute("SELECT seq, ts, type, data FROM job_events WHERE job_id=? AND seq>? ORDER BY seq",
+                                (job_id, after)).fetchall()
+        if row is None:
+            yield _sse("error", {"ok": False, "error": {"message": "Unknown or expired job id."}})
+            return
+        for ev in events:
+            after = ev["seq"]
+            yield _sse(ev["type"], {"ts": ev["ts"], **json.loads(ev["data"])}, after)
+            last_sent = time.monotonic()
+        if row["status"] in _JOB_DONE:
+            yield _sse("done", _job_record(row), after + 1)
+            return
+        if time.monotonic() - last_sent >= JOB_EVENTS_HEARTBEAT:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        time.sleep(JOB_EVENTS_POLL)
+
+def _job_events_response(job_id: str, after: int = 0) -> Response:
+    return Response(_job_event_stream(job_id, after), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _wants_sse() -> bool:
+    return "text/event-stream" in (request.headers.get("Accept") or "")
+
+def _job_record(row: sqlite3.Row) -> dict:
+    out = {
+        "ok": True,
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+    if row["result"] is not None:
+        out["status_code"] = row["status_code"]
+        out["result"] = json.loads(row["result"])
+    return out
+
+def _run_job(job_id: str, kind: str, work, callback_url: str, error_message: str, sock=None):
+    events = _JobEvents(job_id, seq=1)  # seq 1 = "queued", written by _submit_job
+    token = _job_ctx.set(events)
+    try:
+        with _cancel_scope(sock=sock, job_id=job_id) as cancel:
+            cancel.on_cancel(lambda: events.emit("cancelling", {"reason": cancel.reason}))
+            with closing(_jobs_db()) as db:
+                db.execute("UPDATE jobs SET status='running', updated_at=? WHERE id=?", (time.time(), job_id))
+                cancelled = db.execute("SELECT reason FROM job_cancels WHERE job_id=?", (job_id,)).fetchone()
+            if cancelled:
+                cancel.cancel(cancelled["reason"])  # cancelled while queued
+            _job_event("running")
+            try:
+                cancel.check()
+                result = work()
+                cancel.check()  # e.g. a cancelled upload that the endpoint treats as non-fatal
+                code, status = 200, "succeeded"
+            except _Cancelled as e:
+                result, code, status = e.body(), e.status, "cancelled"
+            except _JobError as e:
+                result, code, status = e.body(), e.status, "failed"
+            except Exception as e:
+                import traceback; traceback.print_exc()
+                result, code, status = _JobError(error_message, 500, str(e)).body(), 500, "failed"
+        _job_ctx.reset(token)
+        token = None
+
+        with closing(_jobs_db()) as db:
+            db.execute("UPDATE jobs SET status=?, status_code=?, result=?, updated_at=? WHERE id=?",
+                       (status, code, json.dumps(result), time.time(), job_id))
+            row = db.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if callback_url and row is not None:
+            _post_callback(callback_url, _job_record(row))
+    except Exception as e:
+        print(f"❌ job {job_id} bookkeeping failed:", repr(e))
+    finally:
+        if token is not None:
+            _job_ctx.reset(token)
+        _job_slots.release()
+
+def _submit_job(kind: str, work, *, callback_url: str = "", error_message: str = "", sock=None) -> str:
+    """
+    Queue `work()` (returns the JSON payload or raises _JobError) and return the job id.
+    With `sock` the job is cancelled when that client connection closes.
+    """
+    if not _job_slots.acquire(blocking=False):
+        raise _JobError("Job queue is full. Please retry shortly.", 503)
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    try:
+        with closing(_jobs_db()) as db:
+            db.execute("DELETE FROM jobs WHERE updated_at < ?", (now - JOB_TTL_SECONDS,))
+            db.execute("DELETE FROM job_events WHERE ts < ?", (now - JOB_TTL_SECONDS,))
+            db.execute("DELETE FROM job_cancels WHERE created_at < ?", (now - JOB_TTL_SECONDS,))
+            db.execute("INSERT INTO jobs(id, kind, status, callback_url, created_at, updated_at) "
+                       "VALUES (?, ?, 'queued', ?, ?, ?)", (job_id, kind, callback_url or None, now, now))
+            db.execute("INSERT INTO job_events(job_id, seq, ts, type, data) VALUES (?, 1, ?, 'queued', ?)",
+                       (job_id, now, json.dumps({"kind": kind})))
+        _job_pool.submit(_run_job, job_id, kind, work, callback_url, error_message or f"{kind} job failed", sock)
+    except Exception:
+        _job_slots.release()
+        raise
+    return job_id
+
+def _respond(kind: str, work, *, data: dict | None = None, error_message: str = ""):
+    """
+    Run `work` inline, or queue it and return 202 when the client asked for async.
+    With `Accept: text/event-stream` the job is queued too, and this response streams
+    its progress events (see /jobs/<id>/events). `error_message` is what a failed job
+    reports for unexpected exceptions (the sync path keeps using the route's own
+    except block). Sync and SSE work is cancelled if the client disconnects.
+    """
+    if _wants_sse():
+        return _job_events_response(_submit_job(kind, work, callback_url=_callback_url(data),
+                                                error_message=error_message, sock=_client_socket()))
+    if _wants_async(data):
+        job_id = _submit_job(kind, work, callback_url=_callback_url(data), error_message=error_message)
+        status_url = f"/jobs/{job_id}"
+        return jsonify({"ok": True, "job_id": job_id, "status": "queued", "status_url": status_url,
+                        "events_url": f"{status_url}/events"}), 202, {"Location": status_url}
+    with _cancel_scope(sock=_client_socket()) as cancel:
+        result = work()
+        cancel.check()
+    return jsonify(result)
+
+# ── Render cache ────────────────────────────────────────────────────────────
+# Identical (final prompt, model, size) renders are served from the Cloudinary
+# asset we already uploaded instead of paying for a new OpenAI image. The index
+# is a small SQLite table with TTL + LRU eviction; `no_cache` bypasses it.
+RENDER_CACHE_TTL  = int(os.getenv("RENDER_CACHE_TTL", str(7 * 24 * 3600)))
+RENDER_CACHE_MAX  = int(os.getenv("RENDER_CACHE_MAX", "5000"))
+
+_RENDER_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS renders (
+    key          TEXT PRIMARY KEY,       -- sha256 of (prompt, model, size)
+    model        TEXT NOT NULL,
+    size         TEXT NOT NULL,
+    public_id    TEXT,
+    upload       TEXT NOT NULL,          -- JSON subset of the Cloudinary upload result
+    created_at   REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS renders_last_used ON renders(last_used_at);
+CREATE INDEX IF NOT EXISTS renders_public_id ON renders(public_id);
+"""
 
-    return None, None
+_UPLOAD_FIELDS = ("secure_url", "public_id", "bytes", "format", "width", "height", "created_at")
+
+def _render_cache_db() -> sqlite3.Connection:
+    return _sqlite("render_cache.sqlite3", _RENDER_CACHE_SCHEMA)
+
+def _render_cache_key(prompt: str, model: str, size: str = IMAGE_SIZE) -> str:
+    return hashlib.sha256(json.dumps([prompt, model, size]).encode("utf-8")).hexdigest()
+
+def _no_cache(data: dict | None = None) -> bool:
+    v = request.args.get("no_cache") or (data or {}).get("no_cache") or request.form.get("no_cache")
+    return _coerce_bool(v or False)
+
+def _render_cache_get(prompt: str, model: str) -> dict | None:
+    """Cached upload dict (with `cached: True`) or None. Never raises."""
+    try:
+        key, now = _render_cache_key(prompt, model), time.time()
+        with closing(_render_cache_db()) as db:
+            row = db.execute("SELECT upload FROM renders WHERE key=? AND created_at>=?",
+                             (key, now - RENDER_CACHE_TTL)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE renders SET last_used_at=?, hits=hits+1 WHERE key=?", (now, key))
+        up = {**json.loads(row["upload"]), "cached": True}
+        _job_event("cache_hit", model=model, url=up.get("secure_url"))
+        return up
+    except Exception as e:
+        print("⚠️ render cache read failed:", e)
+        return None
+
+def _render_cache_put(prompt: str, model: str, up: dict):
+    if not (up and up.get("secure_url")):
+        return
+    try:
+        key, now = _render_cache_key(prompt, model), time.time()
+        upload = {k: up.get(k) for k in _UPLOAD_FIELDS}
+        with closing(_render_cache_db()) as db:
+            db.execute("INSERT OR REPLACE INTO renders(key, model, size, public_id, upload, created_at, last_used_at) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (key, model, IMAGE_SIZE, up.get("public_id"), json.dumps(upload), now, now))
+            db.execute("DELETE FROM renders WHERE created_at < ?", (now - RENDER_CACHE_TTL,))
+            db.execute("DELETE FROM renders WHERE key IN (SELECT key FROM renders "
+                       "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)", (RENDER_CACHE_MAX,))
+    except Exception as e:
+        print("⚠️ render cache write failed:", e)
+
+def _render_cache_forget(public_id: str):
+    try:
+        with closing(_render_cache_db()) as db:
+            db.execute("DELETE FROM renders WHERE public_id=?", (public_id,))
+    except Exception as e:
+        print("⚠️ render cache delete failed:", e)
+
+def _render_and_upload(prompt: str, *, model_pref: str = "dall-e-3", album: str = "",
+                       prompt_ctx: str | None = None, tries: int = 3, timeout: int = 90,
+                       no_cache: bool = False):
+    """
+    OpenAI render + Cloudinary upload. Returns (png_bytes, url, upload) or (None, None, None).
+    A render-cache hit returns (None, secure_url, cached_upload).
+    """
+    if not no_cache:
+        hit = _render_cache_get(prompt, model_pref)
+        if hit:
+            return None, hit.get("secure_url"), hit
+
+    def render():
+        png, url = _images_generate_with_retries(prompt, model_pref=model_pref, tries=tries, timeout=timeout)
+        if not (png or url):
+            return None, None, None
+        up = _upload_to_cloudinary(
+            png=png,
+            remote_url=None if png else url,
+            folder=CLOUDINARY_FOLDER,
+            prompt_ctx=prompt if prompt_ctx is None else prompt_ctx,
+            album=album,
+        )
+        _render_cache_put(prompt, model_pref, up)
+        return png, url, up
+
+    # identical concurrent requests share the render *and* the upload
+    key = f"render:{album}:{_render_cache_key(prompt, model_pref)}"
+    return _inflight.do(key, render, timeout=timeout * tries)
+
+# ── Background uploads ──────────────────────────────────────────────────────
+# /generate and /api/vector-sprites already hand the client the base64 image, so
+# with UPLOAD_MODE=background the Cloudinary round-trip leaves the request: the
+# PNG is spooled under DATA_DIR/upload_spool, queued in uploads.sqlite3 and sent
+# by the upload pool with exponential backoff. Queued rows survive restarts (any
+# worker's poller picks up due or stale rows); on success the gallery index and
+# the render cache are filled in. GET /uploads/<id> reports progress.
+UPLOAD_MODE          = (os.getenv("UPLOAD_MODE") or "background").strip().lower()   # background | sync
+UPLOAD_WORKERS       = int(os.getenv("UPLOAD_WORKERS", _pool_default(4, 50)))
+UPLOAD_MAX_ATTEMPTS  = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "8"))
+UPLOAD_RETRY_BASE    = float(os.getenv("UPLOAD_RETRY_BASE", "2"))       # seconds; doubles per attempt
+UPLOAD_RETRY_MAX     = float(os.getenv("UPLOAD_RETRY_MAX", "300"))
+UPLOAD_LEASE_SECONDS = int(os.getenv("UPLOAD_LEASE_SECONDS", "300"))    # 'uploading' rows older than this are retried
+UPLOAD_POLL_SECONDS  = float(os.getenv("UPLOAD_POLL_SECONDS", "5"))
+UPLOAD_SPOOL_DIR     = os.path.join(DATA_DIR, "upload_spool")
+
+_UPLOADS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id           TEXT PRIMARY KEY,
+    status       TEXT NOT NULL,          -- queued | uploading | done | failed
+    spool_path   TEXT NOT NULL,
+    folder       TEXT NOT NULL,
+    prompt_ctx   TEXT NOT NULL DEFAULT '',
+    album        TEXT NOT NULL DEFAULT '',
+    cache_prompt TEXT,                   -- render-cache entry to fill in on success
+    cache_model  TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_at      REAL NOT NULL,
+    error        TEXT,
+    upload       TEXT,                   -- JSON subset of the Cloudinary upload result
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_due ON uploads(status, next_at);
+"""
+
+_upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+_upload_poller_started = False
+_upload_poller_lock = threading.Lock()
+
+def _uploads_db() -> sqlite3.Connection:
+    return _sqlite("uploads.sqlite3", _UPLOADS_SCHEMA)
+
+def _cloudinary_configured() -> bool:
+    return bool(CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET)
+
+def _background_upload(data: dict | None = None) -> bool:
+    """Per-request `upload: background|sync`, defaulting to UPLOAD_MODE."""
+    v = request.args.get("upload") or (data or {}).get("upload") or request.form.get("upload") or UPLOAD_MODE
+    return str(v).strip().lower() == "background" and _cloudinary_configured()
+
+def _upload_record(row: sqlite3.Row) -> dict:
+    up = json.loads(row["upload"]) if row["upload"] else {}
+    return {
+        "ok": True,
+        "upload_id": row["id"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "error": row["error"],
+        "url": up.get("secure_url"),
+        "public_id": up.get("public_id"),
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+def _enqueue_upload(png: bytes, *, folder: str = CLOUDINARY_FOLDER, prompt_ctx: str = "", album: str = "",
+                    cache: tuple | None = None) -> dict:
+    """
+    Spool PNG bytes and queue their Cloudinary upload. `cache` = (prompt, model) adds a
+    render-cache entry once the upload succeeds. Returns {upload_id, status, status_url}.
+    """
+    _check_cancelled()
+    upload_id = uuid.uuid4().hex
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_SPOOL_DIR, upload_id + ".png")
+    with open(path + ".tmp", "wb") as fh:
+        fh.write(png)
+    os.replace(path + ".tmp", path)
+
+    now = time.time()
+    cache_prompt, cache_model = cache or (None, None)
+    with closing(_uploads_db()) as db:
+        db.execute("INSERT INTO uploads(id, status, spool_path, folder, prompt_ctx, album, cache_prompt, cache_model, "
+                   "next_at, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   (upload_id, path, folder, prompt_ctx, album, cache_prompt, cache_model, now, now, now))
+    _upload_poller_start()
+    _upload_kick(upload_id)
+    _job_event("upload", status="queued", upload_id=upload_id, status_url=f"/uploads/{upload_id}")
+    return {"upload_id": upload_id, "status": "queued", "status_url": f"/uploads/{upload_id}"}
+
+def _upload_kick(upload_id: str):
+    """Claim a due (or stale) row and hand it to the upload pool; no-op if another thread has it."""
+    now = time.time()
+    with closing(_uploads_db()) as db:
+        cur = db.execute("UPDATE uploads SET status='uploading', attempts=attempts+1, updated_at=? "
+                         "WHERE id=? AND ((status='queued' AND next_at<=?) OR (status='uploading' AND updated_at<?))",
+                         (now, upload_id, now, now - UPLOAD_LEASE_SECONDS))
+    if cur.rowcount == 1:
+        _upload_pool.submit(_run_upload, upload_id)
+
+def _run_upload(upload_id: str):
+    try:
+        with closing(_uploads_db()) as db:
+            row = db.execute("SELECT * FROM uploads WHERE id=?", (upload_id,)).fetchone()
+        if row is None:
+            return
+        try:
+            with open(row["spool_path"], "rb") as fh:
+                png = fh.read()
+            up = _upload_to_cloudinary(png=png, folder=row["folder"], prompt_ctx=row["prompt_ctx"], album=row["album"])
+        except Exception as e:
+            attempts = row["attempts"]
+            final = attempts >= UPLOAD_MAX_ATTEMPTS or isinstance(e, FileNotFoundError)
+            delay = min(UPLOAD_RETRY_MAX, UPLOAD_RETRY_BASE * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+            print(f"⚠️ upload {upload_id} attempt {attempts} failed{'' if final else f', retrying in {delay:.0f}s'}:", e)
+            now = time.time()
+            with closing(_uploads_db()) as db:
+                db.execute("UPDATE uploads SET status=?, error=?, next_at=?, updated_at=? WHERE id=?",
+                           ("failed" if final else "queued", str(e), now + delay, now, upload_id))
+            if final:
+                _remove_quietly(row["spool_path"])
+            else:
+                _scheduler.call_later(delay, _upload_kick, upload_id)
+            return
+
+        if row["cache_prompt"]:
+            _render_cache_put(row["cache_prompt"], row["cache_model"], up)
+        upload = {k: up.get(k) for k in _UPLOAD_FIELDS}
+        with closing(_uploads_db()) as db:
+            db.execute("UPDATE uploads SET status='done', error=NULL, upload=?, updated_at=? WHERE id=?",
+                       (json.dumps(upload), time.time(), upload_id))
+        _remove_quietly(row["spool_path"])
+    except Exception as e:
+        print(f"❌ upload {upload_id} bookkeeping failed:", repr(e))
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _upload_poller():
+    """Resubmit due/stale rows (retries after a restart, crashed workers) and prune old rows."""
+    while True:
+        try:
+            now = time.time()
+            with closing(_uploads_db()) as db:
+                ids = [r["id"] for r in db.execute(
+                    "SELECT id FROM uploads WHERE (status='queued' AND next_at<=?) OR (status='uploading' AND updated_at<?) "
+                    "ORDER BY next_at LIMIT 100", (now, now - UPLOAD_LEASE_SECONDS))]
+                db.execute("DELETE FROM uploads WHERE status IN ('done', 'failed') AND updated_at<?",
+                           (now - JOB_TTL_SECONDS,))
+            for upload_id in ids:
+                _upload_kick(upload_id)
+        except Exception as e:
+            print("⚠️ upload poller:", e)
+        time.sleep(UPLOAD_POLL_SECONDS)
+
+def _upload_poller_start():
+    global _upload_poller_started
+    if _upload_poller_started:
+        return
+    with _upload_poller_lock:
+        if not _upload_poller_started:
+            threading.Thread(target=_upload_poller, name="upload-poller", daemon=True).start()
+            _upload_poller_started = True
+
+@app.before_request
+def _resume_spooled_uploads():
+    # each gunicorn worker starts its poller on its first request (picks up uploads left by a restart)
+    if not _upload_poller_started and _cloudinary_configured():
+        _upload_poller_start()
+
+# ── Concurrent fan-out (multi-image endpoints) ──────────────────────────────
+# One shared pool for per-piece/per-variant renders; each request additionally
+# caps how many of its own tasks are in flight at once.
+RENDER_POOL_SIZE     = int(os.getenv("RENDER_POOL_SIZE", _pool_default(16, 500)))
+RENDER_MAX_IN_FLIGHT = int(os.getenv("RENDER_MAX_IN_FLIGHT", "6"))   # default + upper bound per request
+
+_render_pool = ThreadPoolExecutor(max_workers=RENDER_POOL_SIZE, thread_name_prefix="render")
+
+def _fan_out(tasks: list, *, max_in_flight: int = RENDER_MAX_IN_FLIGHT, timeout: float = 90):
+    """
+    Run zero-arg callables on the render pool and yield (index, result, error, elapsed_ms)
+    as each one finishes. At most `max_in_flight` run at once and each gets `timeout`
+    seconds from the moment it starts; a task that overruns is reported as a
+    TimeoutError and abandoned. Each task runs under its own cancel token, fired when
+    it is abandoned or the caller is cancelled, so it starts no further retries or
+    uploads (an HTTP call already on the wire finishes in the background). Raises
+    _Cancelled within CANCEL_POLL seconds of the calling context being cancelled.
+    """
+    max_in_flight = max(1, min(int(max_in_flight), RENDER_MAX_IN_FLIGHT))
+    started: dict[int, float] = {}
+    token = _cancel_ctx.get()
+    task_tokens: dict[int, _CancelToken] = {}
+
+    def run(i, fn):
+        started[i] = time.monotonic()
+        _cancel_ctx.set(task_tokens[i])  # this copy of the caller's context only
+        return fn()
+
+    pending = list(enumerate(tasks))[::-1]
+    running: dict = {}
+    while pending or running:
+        while pending and len(running) < max_in_flight:
+            i, fn = pending.pop()
+            task_tokens[i] = task_token = _CancelToken()
+            if token is not None:
+                token.on_cancel(lambda t=task_token: t.cancel(token.reason))
+            running[_render_pool.submit(_in_context(run), i, fn)] = i
+
+        now = time.monotonic()
+        deadlines = [started[i] + timeout for i in running.values() if i in started]
+        # tasks still queued on the shared pool have no deadline yet; poll until they start
+        wait_for = max(0.0, min(deadlines) - now) if deadlines else 0.25
+        if token is not None:
+            wait_for = min(wait_for, CANCEL_POLL)
+        done, _ = futures_wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+        if token is not None and token.cancelled:
+            for fut in running:
+                fut.cancel()  # queued tasks never start; running ones see the token themselves
+            token.check()
+
+        for fut in done:
+            i = running.pop(fut)
+            elapsed = round((time.monotonic() - started.get(i, now)) * 1000)
+            err = fut.exception()
+            yield i, (None if err else fut.result()), err, elapsed
+
+        now = time.monotonic()
+        for fut, i in list(running.items()):
+            if i in started and now - started[i] >= timeout:
+                running.pop(fut)
+                fut.cancel()
+                task_tokens[i].cancel(f"timed out after {timeout:g}s")  # stop its retries and upload
+                yield i, None, TimeoutError(f"timed out after {timeout:g}s"), round((now - started[i]) * 1000)
+
+# ── Rate limiting ───────────────────────────────────────────────────────────
+# Token buckets in SQLite (shared by all gunicorn workers on the host), one per
+# client and one per upstream image model. A client is its API key when the key
+# is one of API_KEYS, else its (proxy-resolved) IP: unknown keys are ignored, so
+# rotating made-up keys cannot mint fresh buckets. A request is priced
+# in images (/api/design-variants = one per target, /api/set-simple = one per
+# piece) and admitted only if both buckets can pay; otherwise 429 + Retry-After.
+# A request costing more than a bucket's burst can never be paid: 413.
+RATE_LIMIT_ENABLED     = _coerce_bool(os.getenv("RATE_LIMIT_ENABLED", "1"))
+RATE_CLIENT_PER_MINUTE = float(os.getenv("RATE_CLIENT_PER_MINUTE", "12"))   # images per client
+RATE_CLIENT_BURST      = float(os.getenv("RATE_CLIENT_BURST", "12"))
+RATE_MODEL_PER_MINUTE  = float(os.getenv("RATE_MODEL_PER_MINUTE", "50"))    # images per model, all clients
+RATE_MODEL_BURST       = float(os.getenv("RATE_MODEL_BURST", "50"))
+TRUST_PROXY_HOPS       = int(os.getenv("TRUST_PROXY_HOPS", "1"))            # X-Forwarded-For entries we trust
+API_KEYS               = {k.strip() for k in os.getenv("API_KEYS", "").split(",") if k.strip()}  # keys with their own bucket
+
+_RATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key        TEXT PRIMARY KEY,         -- client:<id> | model:<name>
+    tokens     REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+def _rate_db() -> sqlite3.Connection:
+    return _sqlite("ratelimit.sqlite3", _RATE_SCHEMA)
+
+def _variant_targets() -> list:
+    # targets can arrive as JSON string or a single value
+    targets_raw = request.form.get("targets", "[]")
+    try:
+        targets = json.loads(targets_raw)
+        if not isinstance(targets, list):
+            targets = [str(targets)]
+    except Exception:
+        targets = [targets_raw] if targets_raw else []
+    return [str(t).strip() for t in targets if str(t).strip()]
+
+def _client_id() -> str:
+    auth = request.headers.get("X-API-Key") or request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if auth and auth in API_KEYS:
+        return "key:" + hashlib.sha256(auth.encode("utf-8")).hexdigest()[:16]
+    route = request.access_route
+    if TRUST_PROXY_HOPS and request.headers.get("X-Forwarded-For") and len(route) >= TRUST_PROXY_HOPS:
+        return "ip:" + route[-TRUST_PROXY_HOPS]
+    return "ip:" + (request.remote_addr or "unknown")
+
+def _image_model(name: str | None) -> str:
+    name = (name or "").strip().lower()
+    return name if name in ("gpt-image-1", "dall-e-3") else "dall-e-3"  # "auto" tries dall-e-3 first
+
+# endpoint → () -> (model, images requested)
+_RATE_PRICES = {
+    "generate": lambda: (_image_model((request.get_json(silent=True) or {}).get("model")), 1),
+    "generate_from_sketch": lambda: ("dall-e-3", 1),
+    "api_vector_sprites": lambda: ("dall-e-3", 1),
+    "api_design_variants": lambda: ("dall-e-3", len(_variant_targets())),
+    "api_set_simple": lambda: ("dall-e-3", len([p for p in request.form.getlist("pieces") if p.strip()])),
+}
+
+def _take_tokens(buckets: list, cost: float) -> tuple[bool, float, float]:
+    """
+    Atomically charge `cost` to every (key, per_minute, burst) bucket, or to none of them.
+    Returns (admitted, retry_after_seconds, tokens left in the first bucket).
+    """
+    now = time.time()
+    with closing(_rate_db()) as db:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, per_minute, burst in buckets:
+                row = db.execute("SELECT tokens, updated_at FROM buckets WHERE key=?", (key,)).fetchone()
+                tokens = burst if row is None else min(burst, row["tokens"] + (now - row["updated_at"]) * per_minute / 60.0)
+                levels.append(tokens)
+            short = [(cost - t) * 60.0 / per_minute
+                     for t, (_, per_minute, _) in zip(levels, buckets) if t < cost]
+            if short:
+                db.execute("ROLLBACK")
+                return False, max(short), levels[0]
+            for t, (key, _, _) in zip(levels, buckets):
+                db.execute("INSERT OR REPLACE INTO buckets(key, tokens, updated_at) VALUES (?, ?, ?)",
+                           (key, t - cost, now))
+            if random.random() < 0.01:  # drop idle client buckets (full again after a day anyway)
+                db.execute("DELETE FROM buckets WHERE updated_at < ?", (now - 86400,))
+            db.execute("COMMIT")
+            return True, 0.0, levels[0] - cost
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+@app.before_request
+def _rate_limit():
+    price = _RATE_PRICES.get(request.endpoint) if RATE_LIMIT_ENABLED and request.method == "POST" else None
+    if price is None:
+        return None
+    try:
+        model, cost = price()
+        if cost <= 0:
+            return None  # the endpoint rejects empty requests itself
+        limit = int(min(RATE_CLIENT_BURST, RATE_MODEL_BURST))
+        if cost > limit:
+            return _err(f"This request asks for {cost} images; at most {limit} can be requested at once. "
+                        "Split it into smaller requests.", 413, f"per-request limit: {limit} image(s)")
+        ok, retry_after, left = _take_tokens([
+            ("client:" + _client_id(), RATE_CLIENT_PER_MINUTE, RATE_CLIENT_BURST),
+            ("model:" + model, RATE_MODEL_PER_MINUTE, RATE_MODEL_BURST),
+        ], cost)
+    except Exception as e:
+        print("⚠️ rate limiter unavailable, allowing request:", e)
+        return None
+    if not ok:
+        wait = max(1, int(retry_after + 0.999))
+        return _err(f"Rate limit exceeded. Please retry in {wait}s.", 429, f"{model}: {cost} image(s) requested",
+                    headers={"Retry-After": str(wait), "X-RateLimit-Remaining": str(max(0, int(left)))})
+    g.rate_remaining = max(0, int(left))
+    return None
+
+@app.after_request
+def _rate_limit_headers(resp):
+    if getattr(g, "rate_remaining", None) is not None:
+        resp.headers["X-RateLimit-Remaining"] = str(g.rate_remaining)
+    return resp
 
 # ── Pages ───────────────────────────────────────────────────────────────────
 @app.get("/")
@@ -428,6 +2433,111 @@ def __ls_static():
 
 
 # ── Generate (text → image) + upload to Cloudinary ──────────────────────────
+def _image_response(data: dict | None = None) -> str:
+    """
+    `response` field: json (default; base64 `image` inline) | url (same JSON without the
+    base64 — the client loads the Cloudinary URL, so the upload is never deferred) | png
+    (the raw image/png body).
+    png falls back to url for async jobs and SSE streams, whose results are JSON.
+    """
+    v = request.args.get("response") or (data or {}).get("response") or request.form.get("response") or "json"
+    v = str(v).strip().lower()
+    if v not in ("json", "url", "png"):
+        raise _JobError("response must be one of: json, url, png", 400)
+    return "url" if v == "png" and (_wants_async(data) or _wants_sse()) else v
+
+def _png_response(png: bytes | None, up: dict, upload: dict | None = None):
+    """Serve rendered bytes directly (303 to the stored copy on a cache hit); URLs go in headers."""
+    url = (up or {}).get("secure_url")
+    if png is None:
+        if not url:
+            raise _JobError("No image available.", 502)
+        return redirect(url, 303)
+    headers = {"X-Cached": "0"}
+    if url:
+        headers["X-Image-Url"] = url
+    if upload:
+        headers["X-Upload-Id"] = upload["upload_id"]
+        headers["X-Upload-Status-Url"] = upload["status_url"]
+    return Response(png, mimetype="image/png", headers=headers)
+
+def _generate_render(prompt: str, model_pref: str, album: str, no_cache: bool = False,
+                     background_upload: bool = False):
+    """
+    Render (or reuse) the image for /generate.
+    Returns (png_bytes | None, upload dict, pending background upload | None); png is None on a cache hit.
+    """
+    import traceback
+    up = None if no_cache else _render_cache_get(prompt, model_pref)
+    if up:
+        return None, up, None
+
+    def render():
+        try:
+            png, url = _images_generate_with_retries(prompt, model_pref=model_pref, tries=3, timeout=90)
+        except _JobError:
+            raise
+        except Exception as e:
+            print("❌ OpenAI call raised:", repr(e))
+            traceback.print_exc()
+            raise _JobError(f"Upstream (OpenAI) error: {e}", 502, str(e))
+
+        if not (png or url):
+            raise _JobError("OpenAI image service temporarily unavailable. Please try again.", 503)
+
+        if background_upload and png:
+            # the client already gets the image; Cloudinary + cache + gallery catch up in the background
+            pending = _enqueue_upload(png, prompt_ctx=prompt, album=album or "index", cache=(prompt, model_pref))
+            return png, {}, pending
+
+        try:
+            up = _upload_to_cloudinary(
+                png=png,
+                remote_url=None if png else url,
+                folder=CLOUDINARY_FOLDER,
+                prompt_ctx=prompt,
+                album=album or "index",
+            )
+        except _JobError:
+            raise
+        except Exception as e:
+            print("❌ Cloudinary upload error:", repr(e))
+            traceback.print_exc()
+            raise _JobError(f"Upload to Cloudinary failed: {e}", 502, str(e))
+
+        _render_cache_put(prompt, model_pref, up)
+        return png, up, None
+
+    # a double-click or a second tab with the same prompt joins the first render + upload
+    return _inflight.do(f"generate:{album}:{_render_cache_key(prompt, model_pref)}", render, timeout=3 * 90)
+
+def _generate_work(prompt: str, model_pref: str, album: str, no_cache: bool = False,
+                   background_upload: bool = False, with_image: bool = True) -> dict:
+    _job_event("prompt", prompt=prompt, model=model_pref)
+    png, up, pending = _generate_render(prompt, model_pref, album, no_cache, background_upload)
+    return _generate_payload(prompt, png if with_image else None, up, upload=pending)
+
+def _generate_payload(prompt: str, png: bytes | None, up: dict, upload: dict | None = None) -> dict:
+    out = {
+        "ok": True,
+        "prompt": prompt,
+        "image": base64.b64encode(png).decode("ascii") if png else None,
+        "cached": bool(up.get("cached")),
+        "file_path": up.get("secure_url"),
+        "cloudinary": {
+            "url": up.get("secure_url"),
+            "public_id": up.get("public_id"),
+            "bytes": up.get("bytes"),
+            "format": up.get("format"),
+            "width": up.get("width"),
+            "height": up.get("height"),
+            "created_at": up.get("created_at"),
+        }
+    }
+    if upload:
+        out["upload"] = upload  # background upload: poll upload.status_url for the URL
+    return out
+
 @app.post("/generate")
 def generate():
     import traceback
@@ -467,45 +2577,19 @@ def generate():
 
         print("🎯 /generate prompt:", prompt.replace("\n", " "))
 
-        try:
-            b64, url = _images_generate_with_retries(prompt, model_pref=model_pref, tries=3, timeout=90)
-        except Exception as e:
-            print("❌ OpenAI call raised:", repr(e))
-            traceback.print_exc()
-            return _err(f"Upstream (OpenAI) error: {e}", 502, str(e))
-
-        if not (b64 or url):
-            return _err("OpenAI image service temporarily unavailable. Please try again.", 503)
-
-        try:
-            up = _upload_to_cloudinary(
-                b64_png=b64,
-                remote_url=None if b64 else url,
-                folder=CLOUDINARY_FOLDER,
-                prompt_ctx=prompt,
-                album=album or "index",
-            )
-        except Exception as e:
-            print("❌ Cloudinary upload error:", repr(e))
-            traceback.print_exc()
-            return _err(f"Upload to Cloudinary failed: {e}", 502, str(e))
-
-        return jsonify({
-            "ok": True,
-            "prompt": prompt,
-            "image": b64,
-            "file_path": up.get("secure_url"),
-            "cloudinary": {
-                "url": up.get("secure_url"),
-                "public_id": up.get("public_id"),
-                "bytes": up.get("bytes"),
-                "format": up.get("format"),
-                "width": up.get("width"),
-                "height": up.get("height"),
-                "created_at": up.get("created_at"),
-            }
-        })
-
+        no_cache = _no_cache(data)
+        image_response = _image_response(data)
+        # url mode returns no image bytes, so it needs the Cloudinary URL before it answers
+        background_upload = _background_upload(data) and image_response != "url"
+        if image_response == "png":
+            return _png_response(*_generate_render(prompt, model_pref, album, no_cache, background_upload))
+        return _respond("generate", lambda: _generate_work(prompt, model_pref, album, no_cache, background_upload,
+                                                           with_image=image_response == "json"),
+                        data=data,
+                        error_message="Failed to generate image (server error). See server logs for details.")
+
+    except _JobError as e:
+        return e.response()
     except Exception as e:
         print("❌ Unhandled error in /generate:", repr(e))
         traceback.print_exc()
@@ -551,7 +2635,7 @@ def generate_prompts():
             attrs=attrs,
         )
 
-        image_b64 = base64.b64encode(image_file.read()).decode("utf-8")
+        image_bytes = _upload_buffer(image_file)
 
         system_instructions = f"""
 You are a professional fine jewelry designer AI.
@@ -563,43 +2647,52 @@ Rules to follow in the prompt:
 {constraint_block}
 """.strip()
 
-        resp = _client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_instructions},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": (
-                            "Analyze the image and write:\n"
-                            "- description: ≤ 50 words (high level, no CAD jargon)\n"
-                            "- prompt: one polished, realistic render prompt that obeys ALL rules above."
-                        )},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}} ,
-                    ],
-                },
-            ],
-            temperature=0.5,
-            max_tokens=650
-        )
+        def analyse():
+            image_url = _vision_data_url(image_bytes)
+            resp = _chat_completion(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": system_instructions},
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": (
+                                "Analyze the image and write:\n"
+                                "- description: ≤ 50 words (high level, no CAD jargon)\n"
+                                "- prompt: one polished, realistic render prompt that obeys ALL rules above."
+                            )},
+                            {"type": "image_url", "image_url": {"url": image_url}},
+                        ],
+                    },
+                ],
+                temperature=0.5,
+                max_tokens=650
+            )
 
-        msg = resp.choices[0].message
-        raw = (msg.content if hasattr(msg, "content") else (msg.get("content") if isinstance(msg, dict) else "")) or ""
-        raw = raw.strip()
-        if raw.startswith("```"):
-            cleaned = raw.strip()
-            if cleaned.startswith("```json"):
-                cleaned = cleaned[7:]
-            elif cleaned.startswith("```"):
-                cleaned = cleaned[3:]
-            if cleaned.endswith("```"):
-                cleaned = cleaned[:-3]
-            raw = cleaned.strip()
+            msg = resp.choices[0].message
+            raw = (msg.content if hasattr(msg, "content") else (msg.get("content") if isinstance(msg, dict) else "")) or ""
+            raw = raw.strip()
+            if raw.startswith("```"):
+                cleaned = raw.strip()
+                if cleaned.startswith("```json"):
+                    cleaned = cleaned[7:]
+                elif cleaned.startswith("```"):
+                    cleaned = cleaned[3:]
+                if cleaned.endswith("```"):
+                    cleaned = cleaned[:-3]
+                raw = cleaned.strip()
 
-        try:
-            parsed = json.loads(raw)
-        except json.JSONDecodeError:
-            return _err("Failed to parse GPT response as JSON", 500, raw)
+            try:
+                return json.loads(raw)
+            except json.JSONDecodeError:
+                raise _JobError("Failed to parse GPT response as JSON", 500, raw)
+
+        parsed = _vision_cached(
+            "generate_prompts", image_bytes,
+            {"use_case": use_case, "attrs": attrs,
+             "allow_solitaires": allow_solitaires, "force_cluster": force_cluster},
+            analyse, refresh=_no_cache(),
+        )
 
         desc = parsed.get("description") or parsed.get("nl_description") or ""
         pr = parsed.get("prompt") or parsed.get("cad_prompt") or ""
@@ -610,6 +2703,8 @@ Rules to follow in the prompt:
 
         return jsonify({"ok": True, "description": desc, "prompt": pr})
 
+    except _JobError as e:
+        return e.response()
     except Exception as e:
         return _err("Error during motif analysis", 500, str(e))
 
@@ -630,8 +2725,6 @@ def generate_from_sketch():
             return _err("No sketch uploaded", 400)
 
         jt = (request.form.get("type") or "jewelry").strip()
-        raw = f.read()
-        sketch_b64 = base64.b64encode(raw).decode("utf-8")
 
         positive = (
             f"High-quality photorealistic render of a lightweight {jt}, "
@@ -645,29 +2738,26 @@ def generate_from_sketch():
             "paper, technical sheet, environment, props, mannequin, hand, shadow"
         )
 
-        b64, url = _images_generate_with_retries(
-            f"{positive}\n\nAvoid: {negative}",
-            model_pref="dall-e-3",
-            tries=3, timeout=90
-        )
-        if not (b64 or url):
-            return _err("Image generation failed.", 502)
-
-        up = _upload_to_cloudinary(
-            b64_png=b64,
-            remote_url=None if b64 else url,
-            folder=CLOUDINARY_FOLDER,
-            prompt_ctx=positive,
-            album="inspiration",
-        )
+        def work():
+            _, _, up = _render_and_upload(
+                f"{positive}\n\nAvoid: {negative}",
+                model_pref="dall-e-3",
+                album="inspiration",
+                prompt_ctx=positive,
+            )
+            if up is None:
+                raise _JobError("Image generation failed.", 502)
+            return {
+                "ok": True,
+                "url": up.get("secure_url"),
+                "prompt": positive,
+                "public_id": up.get("public_id")
+            }
 
-        return jsonify({
-            "ok": True,
-            "url": up.get("secure_url"),
-            "prompt": positive,
-            "public_id": up.get("public_id")
-        })
+        return _respond("sketch", work, error_message="Failed to generate from sketch")
 
+    except _JobError as e:
+        return e.response()
     except Exception as e:
         import traceback; traceback.print_exc()
         return _err("Failed to generate from sketch", 500, str(e))
@@ -689,95 +2779,264 @@ from datetime import datetime
 def inject_current_year():
     return {"current_year": datetime.now().year}
 
+# ── Gallery index ───────────────────────────────────────────────────────────
+# /images is served from a local SQLite index instead of a Cloudinary Search per
+# page. Uploads made by this app are added as they happen, /delete removes rows
+# immediately, and a background full sync from Search runs every
+# GALLERY_REFRESH_SECONDS to pick up changes made elsewhere.
+GALLERY_REFRESH_SECONDS = int(os.getenv("GALLERY_REFRESH_SECONDS", "300"))
+GALLERY_SYNC_MAX_PAGES  = int(os.getenv("GALLERY_SYNC_MAX_PAGES", "40"))   # × 500 resources
+GALLERY_LIVE_MAX_PAGES  = int(os.getenv("GALLERY_LIVE_MAX_PAGES", "5"))    # Search calls per live page
+GALLERY_ALBUMS = {"index", "set", "variants", "vector", "inspiration", "motif", "unknown"}
+
+_GALLERY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    public_id  TEXT PRIMARY KEY,
+    url        TEXT,
+    prompt     TEXT NOT NULL DEFAULT '',
+    album      TEXT NOT NULL DEFAULT 'unknown',
+    created_at TEXT NOT NULL,               -- Cloudinary ISO-8601, sorts lexically
+    seen_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_created ON images(created_at DESC, public_id DESC);
+CREATE INDEX IF NOT EXISTS images_album_created ON images(album, created_at DESC, public_id DESC);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+"""
+
+_gallery_sync_lock = threading.Lock()
+
+def _gallery_db() -> sqlite3.Connection:
+    return _sqlite("gallery.sqlite3", _GALLERY_SCHEMA)
+
+def _gallery_item(r: dict) -> dict:
+    """Normalize one Cloudinary Search resource into a gallery item."""
+    # --- pull prompt robustly ---
+    ctx = r.get("context") or {}
+    meta = r.get("metadata") or {}
+    tags = r.get("tags") or []
+
+    prompt = ""
+    album = ""
+
+    # context.custom (most common)
+    if isinstance(ctx, dict):
+        custom = ctx.get("custom") if isinstance(ctx.get("custom"), dict) else None
+        if custom:
+            prompt = custom.get("prompt") or prompt
+            album = custom.get("album") or album
+        # flat context (some SDK responses)
+        prompt = ctx.get("prompt") or prompt
+        album = ctx.get("album") or album
+
+    # structured metadata fallback
+    if not prompt and isinstance(meta, dict):
+        prompt = meta.get("prompt") or prompt
+        if not album:
+            album = meta.get("album") or album
+
+    # tag fallback: prompt:xyz / album:xyz
+    if tags:
+        for t in tags:
+            if not prompt and t.lower().startswith("prompt:"):
+                prompt = t.split(":", 1)[1].strip()
+            if not album and t.lower().startswith("album:"):
+                album = t.split(":", 1)[1].strip()
+
+    # normalize album
+    if not album:
+        # last fallback to recognized tags
+        for t in tags:
+            tl = t.lower()
+            if tl in GALLERY_ALBUMS:
+                album = tl
+                break
+
+    return {
+        "url": r.get("secure_url"),
+        "prompt": prompt or "",
+        "album": (album or "unknown").lower(),
+        "public_id": r.get("public_id"),
+        "created_at": r.get("created_at"),
+    }
+
+def _gallery_upsert(db: sqlite3.Connection, items: list[dict], seen_at: float):
+    db.executemany(
+        "INSERT INTO images(public_id, url, prompt, album, created_at, seen_at) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(public_id) DO UPDATE SET url=excluded.url, prompt=excluded.prompt, "
+        "album=excluded.album, created_at=excluded.created_at, seen_at=excluded.seen_at",
+        [(it["public_id"], it["url"], it["prompt"], it["album"], it["created_at"] or "", seen_at)
+         for it in items if it.get("public_id")],
+    )
+
+def _gallery_add(up: dict, *, prompt: str = "", album: str = ""):
+    """Index a fresh upload result. Never raises."""
+    try:
+        item = {
+            "url": up.get("secure_url"),
+            "prompt": prompt or "",
+            "album": (album or "unknown").lower(),
+            "public_id": up.get("public_id"),
+            "created_at": up.get("created_at") or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        with closing(_gallery_db()) as db:
+            _gallery_upsert(db, [item], time.time())
+    except Exception as e:
+        print("⚠️ gallery index add failed:", e)
+
+def _gallery_remove(public_id: str):
+    try:
+        with closing(_gallery_db()) as db:
+            db.execute("DELETE FROM images WHERE public_id=?", (public_id,))
+    except Exception as e:
+        print("⚠️ gallery index delete failed:", e)
+
+def _gallery_search(expr: str, limit: int, cursor: str | None = None) -> dict:
+    search = (
+        cloudinary.search.Search()
+        .expression(expr)
+        .sort_by("created_at", "desc")
+        .max_results(limit)
+        .with_field("context")   # include context
+        .with_field("tags")      # include tags (fallback)
+        .with_field("metadata")  # include structured metadata (fallback)
+    )
+    if cursor:
+        search = search.next_cursor(cursor)
+    return search.execute()
+
+def _gallery_sync():
+    """
+    Full refresh from Cloudinary Search. Rows not returned by a complete
+    traversal were deleted elsewhere and are dropped. One worker at a time.
+    """
+    if not _gallery_sync_lock.acquire(blocking=False):
+        return
+    try:
+        started = time.time()
+        with closing(_gallery_db()) as db:
+            # cross-worker lease: only one process syncs per refresh window
+            db.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('sync_lease', 0)")
+            claimed = db.execute("UPDATE meta SET value=? WHERE key='sync_lease' AND value < ?",
+                                 (started, started - GALLERY_REFRESH_SECONDS)).rowcount
+            if not claimed:
+                return
+
+            expr = f'resource_type:image AND folder="{CLOUDINARY_FOLDER}"'
+            cursor, complete = None, False
+            for _ in range(GALLERY_SYNC_MAX_PAGES):
+                res = _gallery_search(expr, 500, cursor)
+                _gallery_upsert(db, [_gallery_item(r) for r in res.get("resources", [])], started)
+                cursor = res.get("next_cursor")
+                if not cursor:
+                    complete = True
+                    break
+            if complete:
+                db.execute("DELETE FROM images WHERE seen_at < ?", (started,))
+            db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('synced_at', ?)", (time.time(),))
+    except Exception as e:
+        print("⚠️ gallery sync failed:", e)
+        try:
+            with closing(_gallery_db()) as db:
+                db.execute("UPDATE meta SET value=0 WHERE key='sync_lease'")
+        except Exception:
+            pass
+    finally:
+        _gallery_sync_lock.release()
+
+def _gallery_synced_at() -> float:
+    with closing(_gallery_db()) as db:
+        row = db.execute("SELECT value FROM meta WHERE key='synced_at'").fetchone()
+    return row["value"] if row else 0.0
+
+def _gallery_ensure_fresh() -> bool:
+    """
+    Whether the index can serve pages. The first time (never synced) this syncs inline;
+    if another thread or worker holds that first sync, or it fails, returns False and the
+    caller queries Cloudinary Search instead. Later, a stale index refreshes in the background.
+    """
+    synced_at = _gallery_synced_at()
+    if not synced_at:
+        _gallery_sync()
+        return bool(_gallery_synced_at())
+    if time.time() - synced_at > GALLERY_REFRESH_SECONDS:
+        threading.Thread(target=_gallery_sync, name="gallery-sync", daemon=True).start()
+    return True
+
+def _gallery_cursor(created_at: str, public_id: str) -> str:
+    raw = json.dumps([created_at, public_id]).encode("utf-8")
+    return "ix:" + base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _gallery_page(limit: int, cursor: str | None, album: str) -> dict:
+    where, args = [], []
+    if album:
+        where.append("album = ?"); args.append(album)
+    if cursor:
+        created_at, public_id = json.loads(base64.urlsafe_b64decode(cursor[3:].encode("ascii")))
+        where.append("(created_at < ? OR (created_at = ? AND public_id < ?))")
+        args += [created_at, created_at, public_id]
+    sql = ("SELECT url, prompt, album, public_id, created_at FROM images"
+           + (" WHERE " + " AND ".join(where) if where else "")
+           + " ORDER BY created_at DESC, public_id DESC LIMIT ?")
+    with closing(_gallery_db()) as db:
+        rows = [dict(r) for r in db.execute(sql, (*args, limit + 1))]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _gallery_cursor(rows[-1]["created_at"], rows[-1]["public_id"])
+    return {"items": rows, "next_cursor": next_cursor}
+
+def _gallery_page_live(limit: int, cursor: str | None, album: str) -> dict:
+    """
+    Query Cloudinary Search directly. The album filter is part of the expression
+    (uploads are tagged with their album) and we keep fetching until the page is
+    full, asking only for the rows still missing so the returned cursor never
+    skips anything. At most GALLERY_LIVE_MAX_PAGES Search calls per request.
+    """
+    expr = f'resource_type:image AND folder="{CLOUDINARY_FOLDER}"'
+    if album and album != "unknown" and '"' not in album:
+        expr += f' AND tags="{album}"'
+
+    items: list[dict] = []
+    for _ in range(GALLERY_LIVE_MAX_PAGES):
+        res = _gallery_search(expr, limit - len(items), cursor)
+        # context still wins over tags, so re-check the normalized album
+        items += [it for it in map(_gallery_item, res.get("resources", []))
+                  if not album or it["album"] == album]
+        cursor = res.get("next_cursor")
+        if len(items) >= limit or not cursor:
+            break
+    return {"items": items, "next_cursor": cursor}
+
 # ── Gallery APIs ────────────────────────────────────────────────────────────
 @app.get("/images")
 def list_images():
     """
-    Returns paginated images from Cloudinary.
+    Returns paginated images (from the local gallery index).
     Query params:
       album   = filter by album (optional)
-      cursor  = Cloudinary next_cursor (optional)
+      cursor  = next_cursor from the previous page (optional)
       limit   = page size (default 30, max 100)
+      source  = "live" to bypass the index and query Cloudinary Search directly
     """
     try:
         limit = min(max(int(request.args.get("limit") or 30), 10), 100)
         cursor = request.args.get("cursor")
         album_filter = (request.args.get("album") or "").strip().lower()
 
-        expr = f'resource_type:image AND folder="{CLOUDINARY_FOLDER}"'
-
-        search = (
-            cloudinary.search.Search()
-            .expression(expr)
-            .sort_by("created_at", "desc")
-            .max_results(limit)
-            .with_field("context")   # include context
-            .with_field("tags")      # include tags (fallback)
-            .with_field("metadata")  # include structured metadata (fallback)
-        )
-        if cursor:
-            search = search.next_cursor(cursor)
-
-        res = search.execute()
-        resources = res.get("resources", [])
-
-        items = []
-        for r in resources:
-            # --- pull prompt robustly ---
-            ctx = r.get("context") or {}
-            meta = r.get("metadata") or {}
-            tags = r.get("tags") or []
-
-            prompt = ""
-            album = ""
-
-            # context.custom (most common)
-            if isinstance(ctx, dict):
-                custom = ctx.get("custom") if isinstance(ctx.get("custom"), dict) else None
-                if custom:
-                    prompt = custom.get("prompt") or prompt
-                    album = custom.get("album") or album
-                # flat context (some SDK responses)
-                prompt = ctx.get("prompt") or prompt
-                album = ctx.get("album") or album
-
-            # structured metadata fallback
-            if not prompt and isinstance(meta, dict):
-                prompt = meta.get("prompt") or prompt
-                if not album:
-                    album = meta.get("album") or album
-
-            # tag fallback: prompt:xyz / album:xyz
-            if tags:
-                for t in tags:
-                    if not prompt and t.lower().startswith("prompt:"):
-                        prompt = t.split(":", 1)[1].strip()
-                    if not album and t.lower().startswith("album:"):
-                        album = t.split(":", 1)[1].strip()
-
-            # normalize album
-            if not album:
-                # last fallback to recognized tags
-                for t in tags:
-                    tl = t.lower()
-                    if tl in {"index", "set", "variants", "vector", "inspiration", "motif", "unknown"}:
-                        album = tl
-                        break
-
-            # filter
-            album_norm = (album or "unknown").lower()
-            if album_filter and album_norm != album_filter:
-                continue
-
-            items.append({
-                "url": r.get("secure_url"),
-                "prompt": prompt or "",
-                "album": album_norm or "unknown",
-                "public_id": r.get("public_id"),
-                "created_at": r.get("created_at"),
-            })
-
-        return jsonify({"items": items, "next_cursor": res.get("next_cursor")})
+        live = (request.args.get("source") or "").strip().lower() == "live"
+        if cursor and not cursor.startswith("ix:"):
+            live = True  # a Cloudinary cursor from a live page
+        if not live:
+            try:
+                if _gallery_ensure_fresh():
+                    return jsonify(_gallery_page(limit, cursor, album_filter))
+                print("⚠️ gallery index not synced yet, serving from Cloudinary Search")
+            except Exception as e:
+                print("⚠️ gallery index unavailable, falling back to Cloudinary Search:", e)
+            if cursor:
+                cursor = None  # index cursors mean nothing to Search
+
+        return jsonify(_gallery_page_live(limit, cursor, album_filter))
     except Exception as e:
         import traceback; traceback.print_exc()
         return jsonify({"ok": False, "error": str(e)}), 500
@@ -805,6 +3064,18 @@ import traceback
 
 @app.route("/api/design-variants", methods=["POST"])
 def api_design_variants():
+    """
+    Expect multipart/form-data:
+      - base_type, base_motif, metal, stone, weight_target (text)
+      - targets (JSON list of variant names)
+      - base_image (file, optional)
+      - max_in_flight (optional) / variant_timeout (optional seconds, 10–120)
+    Returns: { ok, variants: [{label, url, ok, elapsed_ms}] } in target order.
+    With `stream=ndjson` (or Accept: application/x-ndjson) the response is NDJSON:
+    {"type": "start", "count", "labels"} for the targets actually rendered, one
+    {"type": "variant", "index", ...} line per variant as it finishes, then
+    {"type": "done", "variants": [...]}.
+    """
     try:
         # -------- read form --------
         base_type     = (request.form.get("base_type") or "").strip()
@@ -813,15 +3084,9 @@ def api_design_variants():
         stone         = (request.form.get("stone") or "").strip()
         weight_target = (request.form.get("weight_target") or "").strip()
 
-        # targets can arrive as JSON string or a single value
-        targets_raw = request.form.get("targets", "[]")
-        try:
-            targets = json.loads(targets_raw)
-            if not isinstance(targets, list):
-                targets = [str(targets)]
-        except Exception:
-            targets = [targets_raw] if targets_raw else []
-        targets = [str(t).strip() for t in targets if str(t).strip()]
+        targets = _variant_targets()
+        if targets:
+            _guard("image:dall-e-3").check()  # shed the whole batch up front while the breaker is open
 
         # -------- upload (optional) base image to Cloudinary --------
         ref_image_url = None
@@ -849,45 +3114,74 @@ def api_design_variants():
             ref_image_url = "/static/placeholder.png"
 
         # -------- generate a prompt per target and upload results --------
-        variants: list[dict] = []
         if not targets:
             return jsonify({"ok": True, "variants": []})
 
-        for t in targets:
-            prompt = (
-                f"Jewelry design variant: {t} derived from base type {base_type}. "
-                f"Motif/style: {base_motif or 'clean minimal'}. Metal: {metal or '18k Yellow'}, "
-                f"Stone: {stone or 'Diamond'}. Target weight: {weight_target or 'lightweight'} grams. "
-                f"Inspired by (do not copy exactly): {ref_image_url}. "
-                f"{LIGHT_RULES}"
-            )
-
-            try:
-                b64, url = _images_generate_with_retries(prompt, model_pref="dall-e-3", tries=3, timeout=120)
-                if not (b64 or url):
-                    # If upstream failed, still return a tile with the reference/placeholder
-                    variants.append({"label": f"{t.capitalize()} variant ({metal}, {stone})", "url": ref_image_url})
-                    continue
-
-                # upload the generated image (b64 preferred; url as fallback)
-                up = _upload_to_cloudinary(
-                    b64_png=b64,
-                    remote_url=None if b64 else url,
-                    folder=CLOUDINARY_FOLDER,
-                    prompt_ctx=prompt,
-                    album="variants",
-                )
-                variants.append({
-                    "label": f"{t.capitalize()} variant ({metal}, {stone})",
-                    "url": up.get("secure_url") or url or ref_image_url,
-                })
-
-            except Exception as ge:
-                print("⚠️ Variant generation/upload failed:", ge)
-                variants.append({"label": f"{t.capitalize()} variant ({metal}, {stone})", "url": ref_image_url})
-
-        return jsonify({"ok": True, "variants": variants})
+        try:
+            max_in_flight = int(request.form.get("max_in_flight") or RENDER_MAX_IN_FLIGHT)
+            variant_timeout = min(max(float(request.form.get("variant_timeout") or 120), 10.0), 120.0)
+        except ValueError:
+            return _err("max_in_flight and variant_timeout must be numbers.", 400)
+
+        labels = [f"{t.capitalize()} variant ({metal}, {stone})" for t in targets]
+        prompts = [
+            f"Jewelry design variant: {t} derived from base type {base_type}. "
+            f"Motif/style: {base_motif or 'clean minimal'}. Metal: {metal or '18k Yellow'}, "
+            f"Stone: {stone or 'Diamond'}. Target weight: {weight_target or 'lightweight'} grams. "
+            f"Inspired by (do not copy exactly): {ref_image_url}. "
+            f"{LIGHT_RULES}"
+            for t in targets
+        ]
 
+        no_cache = _no_cache()
+
+        def render_variant(prompt):
+            # render + upload the generated image (b64 preferred; url as fallback)
+            _, url, up = _render_and_upload(prompt, model_pref="dall-e-3", album="variants",
+                                            tries=3, timeout=variant_timeout, no_cache=no_cache)
+            return (up.get("secure_url") or url) if up else None
+
+        def variants_as_completed(errors: list | None = None):
+            tasks = [lambda p=p: render_variant(p) for p in prompts]
+            for i, url, err, elapsed in _fan_out(tasks, max_in_flight=max_in_flight, timeout=variant_timeout):
+                if errors is not None:
+                    errors.append(err)
+                if err is not None:
+                    print("⚠️ Variant generation/upload failed:", err)
+                # If upstream failed, still return a tile with the reference/placeholder
+                yield i, {"label": labels[i], "url": url or ref_image_url, "ok": bool(url), "elapsed_ms": elapsed}
+
+        def work():
+            variants: list = [None] * len(targets)
+            errors: list = []
+            for i, v in variants_as_completed(errors):
+                variants[i] = v
+                _job_event("variant", index=i, **v)
+            _all_shed(errors)
+            return {"ok": True, "variants": variants}
+
+        if _wants_ndjson() and not _wants_async():
+            sock = _client_socket()
+
+            def stream():
+                # one line per finished variant, then the full ordered list
+                variants: list = [None] * len(targets)
+                yield json.dumps({"type": "start", "count": len(targets), "labels": labels}) + "\n"
+                try:
+                    with _cancel_scope(sock=sock):
+                        for i, v in variants_as_completed():
+                            variants[i] = v
+                            yield json.dumps({"type": "variant", "index": i, **v}) + "\n"
+                except _Cancelled:
+                    return  # nobody is reading any more
+                yield json.dumps({"type": "done", "ok": True, "variants": variants}) + "\n"
+            return Response(stream(), mimetype="application/x-ndjson",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+        return _respond("design-variants", work, error_message="Design variant generation failed")
+
+    except _JobError as e:
+        return e.response()
     except Exception as e:
         traceback.print_exc()
         return jsonify({"ok": False, "error": f"{type(e).__name__}: {e}"}), 500
@@ -900,6 +3194,9 @@ def api_set_simple():
       - theme (text)
       - ref_image (file, optional)
       - pieces[] (checkbox values: necklace, earrings, ring, bangle, bracelet, pendant)
+      - max_in_flight (optional, default RENDER_MAX_IN_FLIGHT) pieces rendered at once
+      - piece_timeout (optional seconds, 10–120, default 90)
+    Returns: { ok, results: [{piece, url, prompt, elapsed_ms}], pieces: [{piece, ok, elapsed_ms, error?}], elapsed_ms }
     """
     try:
         theme = (request.form.get("theme") or "").strip()
@@ -907,10 +3204,7 @@ def api_set_simple():
         if not pieces:
             return _err("No pieces selected.", 400)
 
-        has_ref = False
-        if "ref_image" in request.files and request.files["ref_image"]:
-            _ = request.files["ref_image"].read()
-            has_ref = True
+        has_ref = bool(request.files.get("ref_image"))
 
         piece_notes = {
             "necklace": "balanced centerpiece, chain anchors cropped minimally; front elevation; no mannequin.",
@@ -921,34 +3215,65 @@ def api_set_simple():
             "pendant":  "bail aligned; minimal chain crop; centered; front elevation."
         }
 
-        results = []
+        try:
+            max_in_flight = int(request.form.get("max_in_flight") or RENDER_MAX_IN_FLIGHT)
+            piece_timeout = min(max(float(request.form.get("piece_timeout") or 90), 10.0), 120.0)
+        except ValueError:
+            return _err("max_in_flight and piece_timeout must be numbers.", 400)
+
+        img_hint = " Use the uploaded reference image as styling inspiration only (do not copy exactly)." if has_ref else ""
+        theme_hint = f"Theme/motif: {theme}. " if theme else ""
+        prompts = []
         for piece in pieces:
             note = piece_notes.get(piece, "front elevation, centered.")
-            img_hint = " Use the uploaded reference image as styling inspiration only (do not copy exactly)." if has_ref else ""
-            theme_hint = f"Theme/motif: {theme}. " if theme else ""
-
-            prompt = (
+            prompts.append(
                 f"Photoreal, catalog-style CAD render of a lightweight {piece}. "
                 f"{theme_hint}{img_hint}"
                 f"Pure white seamless background, soft studio lighting, crisp reflections. "
                 f"No text, no watermark, no grids, no props. {note}"
             )
 
-            b64, url = _images_generate_with_retries(prompt, model_pref="dall-e-3", tries=3, timeout=90)
-            if not (b64 or url):
-                continue
-
-            up = _upload_to_cloudinary(
-                b64_png=b64,
-                remote_url=None if b64 else url,
-                folder=CLOUDINARY_FOLDER,
-                prompt_ctx=prompt,
-                album="set"
-            )
-
-            results.append({"piece": piece, "url": up.get("secure_url"), "prompt": prompt})
+        _guard("image:dall-e-3").check()  # shed the whole set up front while the breaker is open
+        no_cache = _no_cache()
+
+        def render_piece(prompt):
+            _, _, up = _render_and_upload(prompt, model_pref="dall-e-3", album="set",
+                                          tries=3, timeout=piece_timeout, no_cache=no_cache)
+            return up
+
+        def work():
+            # pieces render concurrently; report them back in the order they were requested
+            t0 = time.monotonic()
+            report = [None] * len(pieces)
+            errors = []
+            tasks = [lambda p=p: render_piece(p) for p in prompts]
+            for i, up, err, elapsed in _fan_out(tasks, max_in_flight=max_in_flight, timeout=piece_timeout):
+                errors.append(err)
+                entry = {"piece": pieces[i], "ok": bool(up), "cached": bool(up and up.get("cached")),
+                         "elapsed_ms": elapsed}
+                if err is not None:
+                    print(f"⚠️ set piece {pieces[i]} failed:", repr(err))
+                    entry["error"] = f"{type(err).__name__}: {err}"
+                elif not up:
+                    entry["error"] = "Image generation failed upstream."
+                else:
+                    entry.update(url=up.get("secure_url"), prompt=prompts[i])
+                report[i] = entry
+                _job_event("piece", index=i, **entry)
+
+            _all_shed(errors)
+            results = [{"piece": e["piece"], "url": e["url"], "prompt": e["prompt"], "elapsed_ms": e["elapsed_ms"]}
+                       for e in report if e["ok"]]
+            return {
+                "ok": True,
+                "results": results,
+                "pieces": [{k: v for k, v in e.items() if k not in ("url", "prompt")} for e in report],
+                "elapsed_ms": round((time.monotonic() - t0) * 1000),
+            }
 
-        return jsonify({"ok": True, "results": results})
+        return _respond("set", work, error_message="Failed to generate set")
+    except _JobError as e:
+        return e.response()
     except Exception as e:
         return _err("Failed to generate set", 500, str(e))
 
@@ -956,6 +3281,271 @@ def api_set_simple():
 # --- Vectorize motif ---
 # --- Vectorize motif (badges + banners aware) ---
 # --- Vectorize motif (photo-aware, badges+banners, nicer output) ---
+# Working-resolution cap: JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale and
+# anything still larger is pyramided down; paths are scaled back so the SVG keeps
+# the original viewBox. 0 = trace at full resolution.
+VECTORIZE_MAX_SIDE = int(os.getenv("VECTORIZE_MAX_SIDE", "2048"))
+
+_REDUCED_GRAYSCALE = ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                      (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                      (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+
+@_timed("decode")
+def _decode_gray(data, max_side: int = VECTORIZE_MAX_SIDE):
+    """
+    Decode image bytes to grayscale with the long side at most ~max_side.
+    Returns (gray, W, H) where W, H are the original dimensions, or (None, 0, 0).
+    """
+    W = H = 0
+    try:
+        W, H = Image.open(_buffer_file(data)).size  # header only, no pixel decode
+    except Exception:
+        pass
+
+    flag = cv2.IMREAD_GRAYSCALE
+    if max_side and W and H:
+        for factor, reduced in _REDUCED_GRAYSCALE:
+            if max(W, H) / factor >= max_side:
+                flag = reduced
+                break
+
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if gray is None:
+        return None, 0, 0
+    h, w = gray.shape[:2]
+    if not (W and H):
+        W, H = w, h
+    elif W != H and (W > H) != (w > h):
+        W, H = H, W  # EXIF rotation applied by OpenCV
+
+    if max_side:
+        while max(gray.shape[:2]) >= 2 * max_side:
+            gray = cv2.pyrDown(gray)
+        h, w = gray.shape[:2]
+        if max(h, w) > max_side:
+            k = max_side / float(max(h, w))
+            gray = cv2.resize(gray, (max(1, round(w * k)), max(1, round(h * k))), interpolation=cv2.INTER_AREA)
+    return gray, W, H
+
+VECTORIZE_PRECISION = int(os.getenv("VECTORIZE_PRECISION", "1"))
+
+# relative segment templates, indexed by kind: 0 = h, 1 = v, 2 = l with dy < 0, 3 = l
+_SEG_TEMPLATES = {}
+
+def _seg_templates(num: str) -> np.ndarray:
+    t = _SEG_TEMPLATES.get(num)
+    if t is None:
+        t = _SEG_TEMPLATES[num] = np.array(
+            ["h" + num, "v" + num, "l" + num + num, "l" + num + "," + num], dtype=object)
+    return t
+
+def _svg_path_data(polys, *, precision: int = VECTORIZE_PRECISION, relative: bool = True) -> str:
+    """
+    Serialize closed polygons ((N, 2) arrays) into one SVG path "d" string.
+    Coordinates are rounded to `precision` decimals once, as integers, so relative
+    deltas never drift. relative=True emits "Mx,y" then compact l/h/v deltas
+    (no comma before a negative number); relative=False emits "Mx,yLx,y…Z".
+    Zero-length segments are dropped; all numbers go through a single % format.
+    """
+    k = 10 ** max(0, precision)
+    num = "%d" if precision <= 0 else "%%.%dg" % (precision + 6)
+    frags, vals = [], []
+    for pts in polys:
+        q = np.rint(np.asarray(pts, np.float64).reshape(-1, 2) * k).astype(np.int64)
+        d = np.diff(q, axis=0)
+        moved = (d != 0).any(axis=1)
+        if not moved.any():
+            continue
+        if relative:
+            d = d[moved]
+            dx, dy = d[:, 0], d[:, 1]
+            kind = np.where(dy == 0, 0, np.where(dx == 0, 1, np.where(dy < 0, 2, 3)))
+            frags.append("M" + num + "," + num)
+            frags.extend(_seg_templates(num)[kind].tolist())
+            frags.append("z")
+            vals.append(q[0])
+            vals.append(d[np.column_stack([kind != 1, kind != 0])])
+        else:
+            q = q[np.concatenate(([True], moved))]
+            frags.append("M" + num + "," + num + ("L" + num + "," + num) * (len(q) - 1) + "Z")
+            vals.append(q.ravel())
+    if not frags:
+        return ""
+    flat = np.concatenate(vals)
+    return "".join(frags) % tuple((flat / k if precision > 0 else flat).tolist())
+
+@_timed("vectorize")
+def _vectorize_gray(gray: np.ndarray, W: int, H: int, *, layout: str = "badges_banners",
+                    preset: str = "solid", precision: int = VECTORIZE_PRECISION,
+                    relative: bool = True) -> dict:
+    """
+    Trace a grayscale image into SVG path elements (pure function: no I/O).
+    `gray` may be a downscaled working copy of a W×H original; paths are emitted
+    in original pixel coordinates.
+    Returns { width, height, outline_mode, badges: [<path…/>], banners: [<path…/>] }.
+    """
+    h_work, w_work = gray.shape[:2]
+    scale = np.array([W / float(w_work), H / float(h_work)])
+    canvas_area = float(w_work * h_work)
+
+    # gentle denoise
+    gray = cv2.GaussianBlur(gray, (3, 3), 0)
+
+    # --- decide: photo vs motif ---
+    # Heuristic: photos have high gray-level variance & texture
+    var = float(gray.var())
+    is_photo_like = var > 500.0  # tweakable
+
+    # let user force outline if they asked
+    force_outline = (preset == "outline")
+    force_detailed = (preset == "detailed")
+
+    # choose path mode
+    outline_mode = force_outline or (is_photo_like and not force_detailed)
+
+    # --- build a binary/edge mask ---
+    if outline_mode:
+        # Edges → thin strokes only
+        edges = cv2.Canny(gray, 80, 200)
+        # thicken a bit so we get continuous paths
+        edges = cv2.dilate(edges, np.ones((2, 2), np.uint8), iterations=1)
+        bw = edges
+    else:
+        # Solid shapes
+        # Otsu OR slightly biased threshold
+        _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # invert so shapes = white on black? we want contours of shapes:
+        bw = 255 - bw
+        # clean speckles
+        bw = cv2.morphologyEx(bw, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8), iterations=1)
+
+    # --- find contours with hierarchy to support holes ---
+    contours, hierarchy = cv2.findContours(bw, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    # hierarchy format: [Next, Prev, FirstChild, Parent]
+    parents = hierarchy[0][:, 3] if hierarchy is not None else np.empty(0, np.int32)
+
+    # holes grouped by their outer contour in one pass (RETR_CCOMP is two-level)
+    holes = {}
+    kids = np.flatnonzero(parents >= 0)
+    if kids.size:
+        kids = kids[np.argsort(parents[kids], kind="stable")]
+        for grp in np.split(kids, np.flatnonzero(np.diff(parents[kids])) + 1):
+            holes[int(parents[grp[0]])] = grp
+
+    def touches_border(cnt):
+        x, y, w, h = cv2.boundingRect(cnt)
+        touch = (x <= 1) + (y <= 1) + (x + w >= w_work - 2) + (y + h >= h_work - 2)
+        return touch >= 2  # touching two or more borders is likely a frame
+
+    # filters
+    MIN_AREA = max(12.0, 0.00015 * canvas_area)  # drop tiny dust
+    MAX_KEEP_RATIO = 0.93                         # drop huge frame-like regions
+
+    # path approx
+    # epsilon relative to perimeter (smoother in solid mode, tighter in detailed)
+    def approx_cnt(cnt):
+        per = cv2.arcLength(cnt, True)
+        if force_detailed:
+            eps = 0.005 * per
+        elif outline_mode:
+            eps = 0.02 * per
+        else:
+            eps = 0.01 * per
+        return cv2.approxPolyDP(cnt, max(0.5, eps), True)
+
+    # convert contour (+holes) to SVG path using evenodd fill rule
+    def contour_with_holes_to_path(idx):
+        polys = [approx_cnt(contours[idx]).reshape(-1, 2) * scale]
+        for j in holes.get(idx, ()):
+            cnt = contours[j]
+            if float(cv2.contourArea(cnt)) >= MIN_AREA:
+                polys.append(approx_cnt(cnt).reshape(-1, 2) * scale)
+        return _svg_path_data(polys, precision=precision, relative=relative)
+
+    badges_paths, banners_paths = [], []
+
+    if outline_mode:
+        fill = "none"
+        stroke = "#000"
+        stroke_w = 1.2 if force_detailed else 1.0
+    else:
+        fill = "#000"
+        stroke = "#000"
+        stroke_w = 0.8 if force_detailed else 1.0
+
+    # iterate only top-level components (parent == -1); holes come from `holes`
+    for i in np.flatnonzero(parents == -1).tolist():
+        cnt = contours[i]
+        area = float(abs(cv2.contourArea(cnt)))
+        if area < MIN_AREA:
+            continue
+        if area / canvas_area > MAX_KEEP_RATIO:
+            continue
+        if touches_border(cnt):
+            continue
+
+        path_d = contour_with_holes_to_path(i)
+        if not path_d:
+            continue
+        el = f'<path d="{path_d}" fill="{fill}" stroke="{stroke}" stroke-width="{stroke_w}" fill-rule="evenodd"/>'
+
+        # classify banner vs badge
+        ratio = area / canvas_area
+        x, y, ww, hh = cv2.boundingRect(cnt)
+        ar = ww / float(hh or 1)
+        # banners: bigger OR very wide/tall strips
+        is_banner = (ratio >= 0.02) or (ar >= 3.0) or (ar <= (1/3.0))
+        if is_banner:
+            banners_paths.append(el)
+        else:
+            badges_paths.append(el)
+
+    if layout == "flat":
+        badges_paths = badges_paths + banners_paths
+        banners_paths = []
+
+    return {"width": W, "height": H, "outline_mode": outline_mode,
+            "badges": badges_paths, "banners": banners_paths}
+
+def _vectorize_svg_chunks(result: dict):
+    """Yield the combined SVG document piece by piece (no full-string joins)."""
+    W, H = result["width"], result["height"]
+    yield f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {W} {H}" width="{W}" height="{H}">\n'
+    empty = True
+    for gid in ("badges", "banners"):
+        paths = result[gid]
+        if not paths:
+            continue
+        empty = False
+        yield f'<g id="{gid}">'
+        for n, el in enumerate(paths):
+            yield el if n == 0 else "\n" + el
+        yield "</g>\n"
+    if empty:
+        yield '<!-- no usable contours (try different image or outline preset) -->\n'
+    yield "</svg>"
+
+def _vectorize_opts():
+    """
+    Read the trace options shared by /api/vectorize and /api/vectorize/batch.
+    Returns (max_side, kwargs for _vectorize_gray); raises _JobError on bad input.
+    """
+    form = request.form
+    try:
+        max_side = max(0, int(form.get("max_side") or VECTORIZE_MAX_SIDE))
+    except ValueError:
+        raise _JobError("max_side must be an integer", 400)
+    try:
+        precision = min(3, max(0, int(form.get("precision") or VECTORIZE_PRECISION)))
+    except ValueError:
+        raise _JobError("precision must be an integer", 400)
+    return max_side, {
+        "layout": (form.get("layout") or "badges_banners").strip().lower(),
+        "preset": (form.get("trace_preset") or "solid").strip().lower(),
+        "precision": precision,
+        "relative": _coerce_bool(form.get("relative", "1")),
+    }
+
 @app.route("/api/vectorize", methods=["POST"])
 def api_vectorize():
     """
@@ -963,6 +3553,11 @@ def api_vectorize():
       - image or motif (file)
       - layout: badges_banners | flat
       - trace_preset: solid | outline | detailed   (auto-switches to outline for photos)
+      - max_side: working resolution cap in px (default VECTORIZE_MAX_SIDE; 0 = full size)
+      - format: json (default) | svg   svg streams the document as image/svg+xml (no upload)
+      - paths: 1 (default) | 0         0 drops the badges/banners arrays from the JSON
+      - precision: decimals kept in path coordinates, 0–3 (default VECTORIZE_PRECISION)
+      - relative: 1 (default) | 0      0 writes absolute M/L commands instead of compact l/h/v
     Returns:
       { ok, svg, badges, banners, download_url }
     """
@@ -971,193 +3566,250 @@ def api_vectorize():
         if not f:
             return _err("No image/motif uploaded", 400)
 
-        layout = (request.form.get("layout") or "badges_banners").strip().lower()
-        preset = (request.form.get("trace_preset") or "solid").strip().lower()
+        fmt = (request.form.get("format") or "json").strip().lower()
+        max_side, trace = _vectorize_opts()
 
-        # --- load grayscale ---
-        file_bytes = np.frombuffer(f.read(), np.uint8)
-        gray = cv2.imdecode(file_bytes, cv2.IMREAD_GRAYSCALE)
+        # --- load grayscale (capped working resolution) ---
+        gray, W, H = _offload_cpu(_decode_gray, _upload_buffer(f), max_side)
         if gray is None:
             return _err("Failed to read image", 400)
 
-        H, W = gray.shape[:2]
-        canvas_area = float(W * H)
+        result = _offload_cpu(_vectorize_gray, gray, W, H, **trace)
+        del gray
 
-        # gentle denoise
-        gray = cv2.GaussianBlur(gray, (3, 3), 0)
+        if fmt == "svg":
+            return Response(_vectorize_svg_chunks(result), mimetype="image/svg+xml",
+                            headers={"Content-Disposition": 'inline; filename="motif.svg"'})
 
-        # --- decide: photo vs motif ---
-        # Heuristic: photos have high gray-level variance & texture
-        var = float(gray.var())
-        is_photo_like = var > 500.0  # tweakable
-
-        # let user force outline if they asked
-        force_outline = (preset == "outline")
-        force_detailed = (preset == "detailed")
-
-        # choose path mode
-        outline_mode = force_outline or (is_photo_like and not force_detailed)
-
-        # --- build a binary/edge mask ---
-        if outline_mode:
-            # Edges → thin strokes only
-            edges = cv2.Canny(gray, 80, 200)
-            # thicken a bit so we get continuous paths
-            edges = cv2.dilate(edges, np.ones((2, 2), np.uint8), iterations=1)
-            bw = edges
-        else:
-            # Solid shapes
-            # Otsu OR slightly biased threshold
-            _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            # invert so shapes = white on black? we want contours of shapes:
-            bw = 255 - bw
-            # clean speckles
-            bw = cv2.morphologyEx(bw, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8), iterations=1)
-
-        # --- find contours with hierarchy to support holes ---
-        contours, hierarchy = cv2.findContours(bw, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
-        if hierarchy is None:
-            hierarchy = []
-
-        def touches_border(cnt):
-            x, y, w, h = cv2.boundingRect(cnt)
-            touch = (x <= 1) + (y <= 1) + (x + w >= W - 2) + (y + h >= H - 2)
-            return touch >= 2  # touching two or more borders is likely a frame
-
-        # filters
-        MIN_AREA = max(12.0, 0.00015 * canvas_area)  # drop tiny dust
-        MAX_KEEP_RATIO = 0.93                         # drop huge frame-like regions
-
-        # path approx
-        # epsilon relative to perimeter (smoother in solid mode, tighter in detailed)
-        def approx_cnt(cnt):
-            per = cv2.arcLength(cnt, True)
-            if force_detailed:
-                eps = 0.005 * per
-            elif outline_mode:
-                eps = 0.02 * per
-            else:
-                eps = 0.01 * per
-            return cv2.approxPolyDP(cnt, max(0.5, eps), True)
-
-        # convert contour (+holes) to SVG path using evenodd fill rule
-        def contour_with_holes_to_path(idx):
-            # hierarchy format: [Next, Prev, FirstChild, Parent]
-            path_cmds = []
-            i = idx
-            while i != -1:
-                cnt = contours[i]
-                a = float(cv2.contourArea(cnt))
-                if a < MIN_AREA:
-                    i = hierarchy[0][i][0] if len(hierarchy) else -1
-                    continue
-                ap = approx_cnt(cnt)
-                pts = ap.reshape(-1, 2).astype(float)
-                if len(pts) >= 2:
-                    path_cmds.append("M" + " ".join([f"{pts[0,0]},{pts[0,1]}"]))
-                    for p in pts[1:]:
-                        path_cmds.append(f"L{p[0]},{p[1]}")
-                    path_cmds.append("Z")
-                # next sibling
-                i = hierarchy[0][i][0] if len(hierarchy) else -1
-            return " ".join(path_cmds)
-
-        badges_paths, banners_paths = [], []
-
-        # iterate only top-level components (parent == -1)
-        if len(hierarchy):
-            for i, h in enumerate(hierarchy[0]):
-                parent = h[3]
-                if parent != -1:
-                    continue  # only outer components; children handled when building path
-
-                cnt = contours[i]
-                area = float(abs(cv2.contourArea(cnt)))
-                if area < MIN_AREA:
-                    continue
-                if area / canvas_area > MAX_KEEP_RATIO:
-                    continue
-                if touches_border(cnt):
-                    continue
-
-                path_d = contour_with_holes_to_path(i)
-
-                if outline_mode:
-                    fill = "none"
-                    stroke = "#000"
-                    stroke_w = 1.2 if force_detailed else 1.0
-                else:
-                    fill = "#000"
-                    stroke = "#000"
-                    stroke_w = 0.8 if force_detailed else 1.0
-
-                el = f'<path d="{path_d}" fill="{fill}" stroke="{stroke}" stroke-width="{stroke_w}" fill-rule="evenodd"/>'
-
-                # classify banner vs badge
-                ratio = area / canvas_area
-                ar_w, ar_h, ar = 0, 0, 0
-                x, y, ww, hh = cv2.boundingRect(cnt)
-                ar = ww / float(hh or 1)
-                # banners: bigger OR very wide/tall strips
-                is_banner = (ratio >= 0.02) or (ar >= 3.0) or (ar <= (1/3.0))
-                if is_banner:
-                    banners_paths.append(el)
-                else:
-                    badges_paths.append(el)
-        else:
-            # fallback: single contour run
-            pass
-
-        if layout == "flat":
-            badges_paths = badges_paths + banners_paths
-            banners_paths = []
-
-        # build combined svg
-        groups = []
-        if badges_paths:
-            groups.append('<g id="badges">' + "\n".join(badges_paths) + "</g>")
-        if banners_paths:
-            groups.append('<g id="banners">' + "\n".join(banners_paths) + "</g>")
-        if not groups:
-            groups.append('<!-- no usable contours (try different image or outline preset) -->')
-
-        svg_text = (
-            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {W} {H}" width="{W}" height="{H}">\n'
-            + "\n".join(groups) + "\n</svg>"
-        )
+        svg_text = "".join(_vectorize_svg_chunks(result))
 
         # optional Cloudinary upload
         download_url = None
         try:
             if CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET:
-                payload = "data:image/svg+xml;base64," + base64.b64encode(svg_text.encode("utf-8")).decode("utf-8")
                 up = cloudinary.uploader.upload(
-                    payload,
+                    io.BytesIO(svg_text.encode("utf-8")),
                     resource_type="image",
                     format="svg",
                     folder=CLOUDINARY_FOLDER,
-                    tags=["vectorized", "vector", "outline" if outline_mode else "solid"],
+                    tags=["vectorized", "vector", "outline" if result["outline_mode"] else "solid"],
                     context={"album": "vector"},
                     unique_filename=True,
                     overwrite=False,
                 )
                 download_url = up.get("secure_url")
+                _gallery_add(up, album="vector")
         except Exception as e:
             print("Cloudinary upload failed:", e)
 
-        return jsonify({
-            "ok": True,
-            "svg": svg_text,
-            "badges": badges_paths,
-            "banners": banners_paths,
-            "download_url": download_url
-        })
+        out = {"ok": True, "svg": svg_text, "download_url": download_url}
+        if _coerce_bool(request.form.get("paths", "1")):
+            out["badges"] = result["badges"]
+            out["banners"] = result["banners"]
+        return jsonify(out)
 
+    except _JobError as e:
+        return e.response()
     except Exception as e:
         import traceback; traceback.print_exc()
         return _err("Vectorization failed", 500, str(e))
 
 
+# ── Batch vectorize (process pool) ──────────────────────────────────────────
+# Tracing is CPU-bound, so batches run on a process pool sized to the cores
+# instead of tying up request threads. Each gunicorn worker starts its own pool
+# on first use ("spawn", so no locks or sockets are inherited from the worker).
+VECTORIZE_PROCS          = int(os.getenv("VECTORIZE_PROCS", str(os.cpu_count() or 2)))
+VECTORIZE_BATCH_MAX      = int(os.getenv("VECTORIZE_BATCH_MAX", "500"))          # files per request
+VECTORIZE_BATCH_BYTES    = int(os.getenv("VECTORIZE_BATCH_BYTES", str(200 * 1024 * 1024)))
+VECTORIZE_UNZIPPED_BYTES = int(os.getenv("VECTORIZE_UNZIPPED_BYTES", str(500 * 1024 * 1024)))  # all zip entries
+VECTORIZE_FILE_TIMEOUT   = float(os.getenv("VECTORIZE_FILE_TIMEOUT", "60"))    # seconds of CPU per file
+_VECTORIZE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+
+_vectorize_pool = None
+_vectorize_pool_lock = threading.Lock()
+
+def _vectorize_proc_init():
+    cv2.setNumThreads(1)  # the pool is the parallelism; don't oversubscribe cores
+
+def _vectorize_procs() -> ProcessPoolExecutor:
+    global _vectorize_pool
+    with _vectorize_pool_lock:
+        if _vectorize_pool is None:
+            _vectorize_pool = ProcessPoolExecutor(
+                max_workers=max(1, VECTORIZE_PROCS),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_vectorize_proc_init,
+            )
+        return _vectorize_pool
+
+def _vectorize_pool_broken(pool):
+    global _vectorize_pool
+    with _vectorize_pool_lock:
+        if _vectorize_pool is pool:
+            _vectorize_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _vectorize_file(data: bytes, max_side: int, trace: dict) -> dict:
+    """Image bytes → SVG document (runs in a pool process; pure, no I/O)."""
+    t0 = time.monotonic()
+    gray, W, H = _decode_gray(data, max_side)
+    if gray is None:
+        raise ValueError("Failed to read image")
+    result = _vectorize_gray(gray, W, H, **trace)
+    return {
+        "svg": "".join(_vectorize_svg_chunks(result)),
+        "width": W, "height": H,
+        "outline_mode": result["outline_mode"],
+        "paths": len(result["badges"]) + len(result["banners"]),
+        "ms": round((time.monotonic() - t0) * 1000),
+    }
+
+def _safe_entry_name(name: str) -> str:
+    """Relative POSIX path with no `..`, `.`, drive or leading `/` (names end up in the output zip)."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    if parts and parts[0].endswith(":"):
+        parts = parts[1:]  # C:/...
+    return "/".join(parts) or "image"
+
+def _batch_inputs() -> list:
+    """
+    [(name, bytes | error message)] for every uploaded image, in upload order.
+    Fields: images / image / motif (repeatable) and zip; .zip uploads are expanded.
+    Raises _JobError past VECTORIZE_BATCH_MAX images or VECTORIZE_UNZIPPED_BYTES unzipped.
+    """
+    items = []
+    unzipped = 0
+    files = [f for key in ("images", "image", "motif", "zip") for f in request.files.getlist(key)]
+    for f in files:
+        if not f or not f.filename:
+            continue
+        name = _safe_entry_name(os.path.basename(f.filename.replace("\\", "/")))
+        if not name.lower().endswith(".zip"):
+            items.append((name, f.read()))
+            continue
+        try:
+            with zipfile.ZipFile(f.stream) as zf:
+                for info in zf.infolist():
+                    entry = _safe_entry_name(info.filename)
+                    if info.is_dir() or entry.startswith("__MACOSX/") or not entry.lower().endswith(_VECTORIZE_EXTS):
+                        continue
+                    if len(items) >= VECTORIZE_BATCH_MAX:
+                        raise _JobError(f"Too many files; the limit is {VECTORIZE_BATCH_MAX}", 400)
+                    if info.file_size > app.config["MAX_CONTENT_LENGTH"]:
+                        items.append((entry, f"{entry} is larger than {app.config['MAX_CONTENT_LENGTH']} bytes"))
+                        continue
+                    # file_size is what ZipExtFile will inflate at most, so the header total bounds memory
+                    unzipped += info.file_size
+                    if unzipped > VECTORIZE_UNZIPPED_BYTES:
+                        raise _JobError(f"Zip contents exceed {VECTORIZE_UNZIPPED_BYTES} bytes uncompressed", 413)
+                    items.append((entry, zf.read(info)))
+        except zipfile.BadZipFile as e:
+            items.append((name, f"Bad zip file: {e}"))
+    return items
+
+def _vectorize_batch(items: list, max_side: int, trace: dict):
+    """
+    Vectorize (name, bytes) items on the process pool and yield one result per item
+    as it finishes: {index, name, ok, ms, svg, width, height, paths} or {index, name, ok: False, error}.
+    Each file gets VECTORIZE_FILE_TIMEOUT seconds of pool time; files still queued or
+    running past the batch deadline are reported as timed out.
+    """
+    pool = _vectorize_procs()
+    running = {}
+    for i, (name, data) in enumerate(items):
+        if isinstance(data, str):
+            yield {"index": i, "name": name, "ok": False, "error": data}
+            continue
+        running[pool.submit(_vectorize_file, data, max_side, trace)] = i
+
+    rounds = -(-len(running) // max(1, VECTORIZE_PROCS))
+    deadline = time.monotonic() + VECTORIZE_FILE_TIMEOUT * max(1, rounds)
+    while running:
+        done, _ = futures_wait(list(running), timeout=max(0.0, deadline - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+        if not done:
+            for fut, i in running.items():
+                fut.cancel()
+                yield {"index": i, "name": items[i][0], "ok": False,
+                       "error": f"timed out after {VECTORIZE_FILE_TIMEOUT:g}s per file"}
+            return
+        for fut in done:
+            i = running.pop(fut)
+            err = fut.exception()
+            if isinstance(err, BrokenProcessPool):
+                _vectorize_pool_broken(pool)
+            if err is not None:
+                yield {"index": i, "name": items[i][0], "ok": False, "error": f"{type(err).__name__}: {err}"}
+            else:
+                yield {"index": i, "name": items[i][0], "ok": True, **fut.result()}
+
+@app.post("/api/vectorize/batch")
+def api_vectorize_batch():
+    """
+    Multipart form:
+      - images (repeatable file field; image/motif also accepted) and/or zip (a .zip of images)
+      - layout, trace_preset, max_side, precision, relative — as /api/vectorize
+    Returns a zip of <name>.svg files plus manifest.json
+      { ok, files, failed, elapsed_ms, results: [{name, svg_name, ok, ms, width, height, paths, error}] }
+    With `stream=ndjson` (or Accept: application/x-ndjson) the response is NDJSON:
+    one {"type": "file", "index", "name", "ok", "ms", "svg" | "error"} line per file as
+    it finishes, then {"type": "done", "files", "failed", "elapsed_ms"}.
+    """
+    try:
+        request.max_content_length = VECTORIZE_BATCH_BYTES
+        max_side, trace = _vectorize_opts()
+        items = _batch_inputs()
+        if not items:
+            return _err("No images uploaded", 400)
+        if len(items) > VECTORIZE_BATCH_MAX:
+            return _err(f"Too many files ({len(items)}); the limit is {VECTORIZE_BATCH_MAX}", 400)
+
+        t0 = time.monotonic()
+        if _wants_ndjson():
+            def stream():
+                failed = 0
+                for r in _vectorize_batch(items, max_side, trace):
+                    failed += not r["ok"]
+                    yield json.dumps({"type": "file", **r}) + "\n"
+                yield json.dumps({"type": "done", "ok": True, "files": len(items), "failed": failed,
+                                  "elapsed_ms": round((time.monotonic() - t0) * 1000)}) + "\n"
+            return Response(stream(), mimetype="application/x-ndjson",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+        results: list = [None] * len(items)
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            used = set()
+            for r in _vectorize_batch(items, max_side, trace):
+                svg = r.pop("svg", None)
+                if svg is not None:
+                    stem = os.path.splitext(r["name"])[0]
+                    svg_name, n = f"{stem}.svg", 1
+                    while svg_name in used:
+                        n += 1
+                        svg_name = f"{stem}-{n}.svg"
+                    used.add(svg_name)
+                    zf.writestr(svg_name, svg)
+                    r["svg_name"] = svg_name
+                results[r.pop("index")] = r
+            failed = sum(not r["ok"] for r in results)
+            zf.writestr("manifest.json", json.dumps({
+                "ok": True, "files": len(items), "failed": failed,
+                "elapsed_ms": round((time.monotonic() - t0) * 1000), "results": results,
+            }, indent=2))
+        buf.seek(0)
+        resp = send_file(buf, mimetype="application/zip", as_attachment=True, download_name="vectorized.zip")
+        resp.headers["X-Vectorize-Failed"] = str(failed)
+        return resp
+
+    except _JobError as e:
+        return e.response()
+    except Exception as e:
+        import traceback; traceback.print_exc()
+        return _err("Batch vectorization failed", 500, str(e))
+
+
 # --- Motif → 6-up flat "vector-style" sprite sheet (one PNG) ---
 @app.post("/api/vector-sprites")
 def api_vector_sprites():
@@ -1166,7 +3818,10 @@ def api_vector_sprites():
       - image (file) or motif (file)
       - style: mono | duotone | color
       - background: transparent | white
-    Returns: { ok, url, b64, description, prompt }
+      - no_cache (optional) skip the render cache
+      - upload (optional) background | sync   (default UPLOAD_MODE)
+      - response (optional) json | url | png   (url omits `b64` and uploads in the request; png returns the image body)
+    Returns: { ok, url, b64, cached, description, prompt[, upload: {upload_id, status, status_url}] }
     """
     try:
         if not (_client or _legacy):
@@ -1179,68 +3834,117 @@ def api_vector_sprites():
         style = (request.form.get("style") or "mono").strip().lower()
         bg    = (request.form.get("background") or "white").strip().lower()
 
-        # 1) brief description with GPT-4o
-        raw = f.read()
-        img_b64 = base64.b64encode(raw).decode("utf-8")
-        desc = "simple subject"
+        # only the normalized (small) image and the upload's digest outlive the request (`async: true`)
+        raw = _upload_buffer(f)
+        image_digest = hashlib.sha256(raw).hexdigest()
         try:
-            sys = ("You are an expert iconographer. Describe the uploaded image in 2–3 short sentences, "
-                   "focusing on silhouette and key visual cues. No extra commentary.")
-            r = _client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role":"system","content":sys},
-                    {"role":"user","content":[
-                        {"type":"text","text":"Describe this image briefly for flat vector icons."},
-                        {"type":"image_url","image_url":{"url": f"data:image/jpeg;base64,{img_b64}"}}
-                    ]}
-                ],
-                temperature=0.3, max_tokens=160
+            vision_img = _vision_image(raw)
+        except _JobError as e:
+            print("⚠️ unreadable sprite reference, using a generic description:", e.detail)
+            vision_img = None
+        no_cache = _no_cache()
+        image_response = _image_response()
+        background_upload = _background_upload() and image_response != "url"  # url mode needs the URL now
+
+        def sheet():
+            # 1) brief description with GPT-4o
+            desc = "simple subject"
+            try:
+                sys = ("You are an expert iconographer. Describe the uploaded image in 2–3 short sentences, "
+                       "focusing on silhouette and key visual cues. No extra commentary.")
+
+                def describe():
+                    image_url = _data_url(*vision_img)
+                    r = _chat_completion(
+                        model="gpt-4o",
+                        messages=[
+                            {"role":"system","content":sys},
+                            {"role":"user","content":[
+                                {"type":"text","text":"Describe this image briefly for flat vector icons."},
+                                {"type":"image_url","image_url":{"url": image_url}}
+                            ]}
+                        ],
+                        temperature=0.3, max_tokens=160
+                    )
+                    return (r.choices[0].message.content or "").strip()
+
+                if vision_img is not None:
+                    desc = _vision_cached("vector_sprites", image_digest, None, describe, refresh=no_cache)
+            except Exception as e:
+                print("⚠️ description fallback:", e)
+            _job_event("description", description=desc)
+
+            # 2) build sprite sheet prompt (3x2 grid → one 1024x1024 image)
+            palette = {
+                "mono":     "solid single-color fill (use black on light background), minimal negative space",
+                "duotone":  "two-color palette, harmonious tones, clean contrast",
+                "color":    "limited 3–4 color palette, bold and flat fills",
+            }.get(style, "solid single-color fill (use black on light background), minimal negative space")
+            bg_line = "transparent background" if bg == "transparent" else "clean white background"
+            prompt = (
+                "Create a single 1024x1024 sprite sheet with six flat 2D vector-style icon variations "
+                f"(arranged in a 3x2 grid) derived from this description: {desc}. "
+                "Icon style: crisp silhouettes, smooth contours, no gradients, no textures, no shadows, no text, no watermark. "
+                "All icons centered within consistent tiles, equal padding, same stroke weight if any; "
+                f"{palette}; {bg_line}. Each tile must be a distinct variation of the same motif."
             )
-            desc = (r.choices[0].message.content or "").strip()
-        except Exception as e:
-            print("⚠️ description fallback:", e)
-
-        # 2) build sprite sheet prompt (3x2 grid → one 1024x1024 image)
-        palette = {
-            "mono":     "solid single-color fill (use black on light background), minimal negative space",
-            "duotone":  "two-color palette, harmonious tones, clean contrast",
-            "color":    "limited 3–4 color palette, bold and flat fills",
-        }.get(style, "solid single-color fill (use black on light background), minimal negative space")
-        bg_line = "transparent background" if bg == "transparent" else "clean white background"
-        prompt = (
-            "Create a single 1024x1024 sprite sheet with six flat 2D vector-style icon variations "
-            f"(arranged in a 3x2 grid) derived from this description: {desc}. "
-            "Icon style: crisp silhouettes, smooth contours, no gradients, no textures, no shadows, no text, no watermark. "
-            "All icons centered within consistent tiles, equal padding, same stroke weight if any; "
-            f"{palette}; {bg_line}. Each tile must be a distinct variation of the same motif."
-        )
-
-        # 3) generate image (DALL·E / gpt-image-1)
-        b64, url = _images_generate_with_retries(prompt, model_pref="dall-e-3", tries=3, timeout=90)
-        if not (b64 or url):
-            return _err("Image generation failed upstream.", 502)
+            _job_event("prompt", prompt=prompt, model="dall-e-3")
+
+            # 3) generate image (DALL·E / gpt-image-1), unless this exact sheet was rendered before
+            def render():
+                png, url = _images_generate_with_retries(prompt, model_pref="dall-e-3", tries=3, timeout=90)
+                if not (png or url):
+                    raise _JobError("Image generation failed upstream.", 502)
+
+                # 4) upload to Cloudinary (optional; queued when the client already has the PNG)
+                if background_upload and png:
+                    return png, url, {"pending": _enqueue_upload(
+                        png, prompt_ctx=_safe_prompt_for_context(prompt), album="vector",
+                        cache=(prompt, "dall-e-3"))}
+                uploaded = {}
+                try:
+                    uploaded = _upload_to_cloudinary(
+                        png=png,
+                        remote_url=None if png else url,
+                        folder=CLOUDINARY_FOLDER,
+                        prompt_ctx=_safe_prompt_for_context(prompt),
+                        album="vector",
+                    )
+                    _render_cache_put(prompt, "dall-e-3", uploaded)
+                except Exception as e:
+                    print("Cloudinary upload failed (non-fatal):", e)
+                return png, url, uploaded
 
-        # 4) upload to Cloudinary (optional)
-        uploaded = {}
-        try:
-            uploaded = _upload_to_cloudinary(
-                b64_png=b64,
-                remote_url=None if b64 else url,
-                folder=CLOUDINARY_FOLDER,
-                prompt_ctx=_safe_prompt_for_context(prompt),
-                album="vector",
-            )
-        except Exception as e:
-            print("Cloudinary upload failed (non-fatal):", e)
-
-        return jsonify({
-            "ok": True,
-            "url": uploaded.get("secure_url") or url,
-            "b64": b64,
-            "description": desc,
-            "prompt": prompt,
-        })
+            uploaded = None if no_cache else _render_cache_get(prompt, "dall-e-3")
+            if uploaded:
+                png, url = None, uploaded.get("secure_url")
+            else:
+                png, url, uploaded = _inflight.do(f"sprites:{_render_cache_key(prompt, 'dall-e-3')}",
+                                                  render, timeout=3 * 90)
+            return png, url, uploaded, desc, prompt
+
+        def work():
+            png, url, uploaded, desc, prompt = sheet()
+            url = uploaded.get("secure_url") or url
+            out = {
+                "ok": True,
+                "url": url,
+                # url mode still inlines the sheet when the (non-fatal) upload left no URL
+                "b64": base64.b64encode(png).decode("ascii") if png and (image_response == "json" or not url) else None,
+                "cached": bool(uploaded.get("cached")),
+                "description": desc,
+                "prompt": prompt,
+            }
+            if uploaded.get("pending"):
+                out["upload"] = uploaded["pending"]
+            return out
+
+        if image_response == "png":
+            png, url, uploaded, _, _ = sheet()
+            return _png_response(png, {"secure_url": uploaded.get("secure_url") or url}, uploaded.get("pending"))
+        return _respond("vector-sprites", work, error_message="Sprite generation failed")
+    except _JobError as e:
+        return e.response()
     except Exception as e:
         import traceback; traceback.print_exc()
         return _err("Sprite generation failed", 500, str(e))
@@ -1267,7 +3971,7 @@ def api_text_from_image():
         if not f:
             return _err("No image uploaded", 400)
 
-        image_b64 = base64.b64encode(f.read()).decode("utf-8")
+        image_bytes = _upload_buffer(f)
 
         sys = (
             "You are a jewelry copywriter. Produce:\n"
@@ -1275,24 +3979,30 @@ def api_text_from_image():
             "2) CATALOG: 120–180 words; materials, setting, motif, wearability, care cues; SEO-friendly.\n"
             "Adapt tone = professional|catalog|luxury. Language is specified by the user."
         )
-        user = [
-            {"type":"text","text":f"Tone={tone}; Language={lang}. Return JSON with keys ppt and catalog."},
-            {"type":"image_url","image_url":{"url": f"data:image/jpeg;base64,{image_b64}"}}
-        ]
+        def analyse():
+            user = [
+                {"type":"text","text":f"Tone={tone}; Language={lang}. Return JSON with keys ppt and catalog."},
+                {"type":"image_url","image_url":{"url": _vision_data_url(image_bytes)}}
+            ]
 
-        r = _client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role":"system","content":sys},{"role":"user","content":user}],
-            temperature=0.6, max_tokens=700
-        )
-        raw = (r.choices[0].message.content or "").strip()
-        if raw.startswith("```"):
-            if raw.startswith("```json"): raw = raw[7:]
-            else: raw = raw[3:]
-            if raw.endswith("```"): raw = raw[:-3]
-            raw = raw.strip()
-        data = json.loads(raw)
+            r = _chat_completion(
+                model="gpt-4o",
+                messages=[{"role":"system","content":sys},{"role":"user","content":user}],
+                temperature=0.6, max_tokens=700
+            )
+            raw = (r.choices[0].message.content or "").strip()
+            if raw.startswith("```"):
+                if raw.startswith("```json"): raw = raw[7:]
+                else: raw = raw[3:]
+                if raw.endswith("```"): raw = raw[:-3]
+                raw = raw.strip()
+            return json.loads(raw)
+
+        data = _vision_cached("text_from_image", image_bytes, {"tone": tone, "lang": lang},
+                              analyse, refresh=_no_cache())
         return jsonify({"ok": True, "ppt": data.get("ppt",""), "catalog": data.get("catalog","")})
+    except _JobError as e:
+        return e.response()
     except Exception as e:
         return _err("Failed to generate text", 500, str(e))
 
@@ -1313,11 +4023,118 @@ def delete_image():
         result = (resp or {}).get("result")
         if result not in ("ok", "not found", "queued"):
             return _err(f"Cloudinary destroy failed: {resp}", 500)
+        _render_cache_forget(public_id)
+        _gallery_remove(public_id)
 
         return jsonify({"ok": True, "result": resp})
     except Exception as e:
         return _err("Failed to delete image", 500, str(e))
 
+# ── Jobs (async mode of the image endpoints) ────────────────────────────────
+@app.get("/jobs/<job_id>")
+def job_status(job_id):
+    """
+    Poll a job created by an image endpoint called with `async`.
+    Response: { ok, job_id, kind, status, created_at, updated_at[, status_code, result] }
+    `result` is exactly the JSON the endpoint returns in sync mode.
+    """
+    try:
+        with closing(_jobs_db()) as db:
+            row = db.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            return _err("Unknown or expired job id.", 404)
+        return jsonify(_job_record(row))
+    except Exception as e:
+        return _err("Failed to read job", 500, str(e))
+
+@app.get("/jobs/<job_id>/events")
+def job_events(job_id):
+    """
+    Server-Sent Events for a job: `queued`, `running`, then stage events as they
+    happen (`prompt`, `description`, `cache_hit`, `attempt` {step, attempt, tries},
+    `retry` {error, delay_s}, `fallback` {step, to, reason}, `image`, `upload`,
+    `variant` / `piece`), and finally `done` with the /jobs/<id> record. A comment
+    line goes out every JOB_EVENTS_HEARTBEAT idle seconds. Reconnects resume after
+    Last-Event-ID. Each open stream holds a worker thread (a greenlet with
+    JEWELGEN_SERVE_MODE=async).
+    """
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.args.get("after") or 0)
+    except ValueError:
+        return _err("Last-Event-ID must be an integer.", 400)
+    try:
+        with closing(_jobs_db()) as db:
+            row = db.execute("SELECT 1 FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            return _err("Unknown or expired job id.", 404)
+    except Exception as e:
+        return _err("Failed to read job", 500, str(e))
+    return _job_events_response(job_id, after)
+
+@app.post("/jobs/<job_id>/cancel")
+def job_cancel(job_id):
+    """
+    Stop a queued or running job from any worker. Within about a second it stops
+    starting upstream calls, skips their Cloudinary uploads and ends as `cancelled`
+    (status_code 499). Responds 202 { ok, job_id, status: "cancelling", status_url },
+    or 409 if the job already finished.
+    """
+    try:
+        with closing(_jobs_db()) as db:
+            row = db.execute("SELECT status FROM jobs WHERE id=?", (job_id,)).fetchone()
+            if row is None:
+                return _err("Unknown or expired job id.", 404)
+            if row["status"] in _JOB_DONE:
+                return _err(f"Job already {row['status']}.", 409)
+            db.execute("INSERT OR IGNORE INTO job_cancels(job_id, reason, created_at) VALUES (?, ?, ?)",
+                       (job_id, "cancelled by client", time.time()))
+        status_url = f"/jobs/{job_id}"
+        return jsonify({"ok": True, "job_id": job_id, "status": "cancelling", "status_url": status_url}), 202
+    except Exception as e:
+        return _err("Failed to cancel job", 500, str(e))
+
+@app.get("/upstream")
+def upstream_status():
+    """Circuit-breaker and concurrency-limiter state per upstream model, for this worker."""
+    with _guards_lock:
+        guards = dict(_guards)
+    return jsonify({"ok": True, "pid": os.getpid(), "upstreams": {k: guard.snapshot() for k, guard in sorted(guards.items())}})
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: latency histograms per route / stage / upstream, retries, failure classes."""
+    try:
+        _metrics_flush()  # this worker's latest numbers; the others flush every METRICS_FLUSH_SECONDS
+        return Response(_metrics_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
+    except Exception as e:
+        return _err("Metrics unavailable", 500, str(e))
+
+@app.get("/http-pools")
+def http_pools():
+    """Connection-pool metrics for this worker: { ok, pid, openai: {...}, cloudinary: {...} }."""
+    return jsonify({
+        "ok": True,
+        "pid": os.getpid(),
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "openai": _openai_pool_snapshot(),
+        "cloudinary": _cloudinary_pool_snapshot(),
+    })
+
+@app.get("/uploads/<upload_id>")
+def upload_status(upload_id):
+    """
+    Poll a background Cloudinary upload (see `upload` in /generate and /api/vector-sprites).
+    Response: { ok, upload_id, status, attempts, error, url, public_id, created_at, updated_at }
+    """
+    try:
+        with closing(_uploads_db()) as db:
+            row = db.execute("SELECT * FROM uploads WHERE id=?", (upload_id,)).fetchone()
+        if row is None:
+            return _err("Unknown or expired upload id.", 404)
+        return jsonify(_upload_record(row))
+    except Exception as e:
+        return _err("Failed to read upload", 500, str(e))
+
 # ── Routes Inspector / Debug ────────────────────────────────────────────────
 @app.get("/__routes__")
 def __routes__():
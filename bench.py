@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+bench.py — offline micro-benchmarks for the heavy code paths in app.py.
+
+Usage:
+  python bench.py vectorize [--sizes 4096 8192] [--formats png jpg] [--repeat 1]
+  python bench.py upload [--side 1024] [--repeat 5]
+
+Each case runs in a fresh process so "peak RSS" is that request's own high-water
+mark (ru_maxrss after the run, and the growth over the process baseline after
+importing app.py). No network access is needed: `upload` swaps in an in-memory
+OpenAI client and Cloudinary uploader.
+"""
+
+import argparse
+import base64
+import io
+import multiprocessing as mp
+import os
+import queue
+import resource
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024 * 1024) if sys.platform == "darwin" else r / 1024
+
+
+def synthetic_motif(side: int, seed: int = 0) -> np.ndarray:
+    """White canvas with ring-shaped blobs and thin polylines — roughly a scanned motif sheet."""
+    rng = np.random.default_rng(seed)
+    img = np.full((side, side), 255, np.uint8)
+    for _ in range(400):
+        c = tuple(int(v) for v in rng.integers(0, side, 2))
+        r = int(rng.integers(max(2, side // 200), max(3, side // 40)))
+        cv2.circle(img, c, r, 0, -1)
+        cv2.circle(img, c, max(1, r // 2), 255, -1)
+    for _ in range(150):
+        pts = rng.integers(0, side, (6, 2)).astype(np.int32)
+        cv2.polylines(img, [pts], True, 0, max(1, side // 800))
+    return img
+
+
+def _child_result(p, q, timeout: float) -> dict:
+    """The child's result dict; exits with an error if the child dies or runs past `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return q.get(timeout=1)
+        except queue.Empty:
+            if not p.is_alive():
+                raise SystemExit(f"benchmark child exited with code {p.exitcode} and no result")
+            if time.monotonic() > deadline:
+                p.terminate()
+                raise SystemExit(f"benchmark child gave no result within {timeout:g}s")
+
+
+# ── vectorize ───────────────────────────────────────────────────────────────
+def _vectorize_child(path: str, form: dict, repeat: int, out):
+    sys.path.insert(0, HERE)
+    os.environ.setdefault("JEWELGEN_DATA_DIR", tempfile.mkdtemp())
+    os.environ["CLOUDINARY_CLOUD_NAME"] = ""  # never upload from a benchmark
+    import app as jewelgen
+
+    with open(path, "rb") as f:
+        data = f.read()
+    client = jewelgen.app.test_client()
+    base = _rss_mb()
+    times, size = [], 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        r = client.post("/api/vectorize", data={"image": (io.BytesIO(data), os.path.basename(path)), **form})
+        body = r.get_data()
+        times.append(time.perf_counter() - t0)
+        size = len(body)
+        if r.status_code != 200:
+            raise SystemExit(f"vectorize failed: {r.status_code} {body[:200]!r}")
+    out.put({"ms": min(times) * 1000, "peak_mb": _rss_mb(), "delta_mb": _rss_mb() - base, "bytes": size})
+
+
+def bench_vectorize(args):
+    modes = [
+        ("full-res json", {"max_side": "0"}),
+        ("capped json", {}),
+        ("capped svg stream", {"format": "svg"}),
+    ]
+    ctx = mp.get_context("spawn")
+    tmp = tempfile.mkdtemp()
+    print(f"{'input':<14} {'mode':<20} {'latency ms':>11} {'peak RSS MB':>12} {'Δ RSS MB':>9} {'response':>10}")
+    for side in args.sizes:
+        img = synthetic_motif(side)
+        for ext in args.formats:
+            path = os.path.join(tmp, f"motif_{side}.{ext}")
+            cv2.imwrite(path, img)
+            for label, form in modes:
+                q = ctx.Queue()
+                p = ctx.Process(target=_vectorize_child, args=(path, form, args.repeat, q))
+                p.start()
+                res = _child_result(p, q, args.timeout)
+                p.join()
+                print(f"{side}px {ext:<8} {label:<20} {res['ms']:>11.0f} {res['peak_mb']:>12.0f} "
+                      f"{res['delta_mb']:>9.0f} {res['bytes'] / 1024:>8.0f}KB")
+        del img
+
+# ── upload ──────────────────────────────────────────────────────────────────
+class _FakeImages:
+    def __init__(self, b64):
+        self.b64 = b64
+
+    def generate(self, **kwargs):
+        item = type("Image", (), {"b64_json": self.b64, "url": None})()
+        return type("ImagesResponse", (), {"data": [item]})()
+
+
+class _FakeOpenAI:
+    def __init__(self, b64):
+        self.images = _FakeImages(b64)
+
+    def with_options(self, **kwargs):
+        return self
+
+
+def _upload_child(b64: str, body: dict, repeat: int, out):
+    sys.path.insert(0, HERE)
+    os.environ.setdefault("JEWELGEN_DATA_DIR", tempfile.mkdtemp())
+    os.environ.update(CLOUDINARY_CLOUD_NAME="bench", CLOUDINARY_API_KEY="k", CLOUDINARY_API_SECRET="s")
+    import app as jewelgen
+
+    def fake_upload(file, **kwargs):
+        n = len(file.read())  # what the HTTP client would stream
+        return {"secure_url": f"https://example.invalid/{n}.png", "public_id": f"bench/{n}", "bytes": n}
+
+    jewelgen._client = _FakeOpenAI(b64)
+    jewelgen.cloudinary.uploader.upload = fake_upload
+    client = jewelgen.app.test_client()
+    base = _rss_mb()
+    times, size = [], 0
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        r = client.post("/generate", json={"prompt": f"bench ring {i}", "no_cache": True, **body})
+        payload = r.get_data()
+        times.append(time.perf_counter() - t0)
+        size = len(payload)
+        if r.status_code != 200:
+            raise SystemExit(f"generate failed: {r.status_code} {payload[:200]!r}")
+    out.put({"ms": sorted(times)[len(times) // 2] * 1000, "peak_mb": _rss_mb(), "delta_mb": _rss_mb() - base,
+             "bytes": size})
+
+
+def bench_upload(args):
+    modes = [
+        ("json + base64", {"response": "json", "upload": "sync"}),
+        ("json url only", {"response": "url", "upload": "sync"}),
+        ("png body", {"response": "png", "upload": "sync"}),
+        ("png body, bg upload", {"response": "png", "upload": "background"}),
+    ]
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (args.side, args.side, 3), dtype=np.uint8)  # incompressible ≈ worst case
+    b64 = base64.b64encode(cv2.imencode(".png", noise)[1].tobytes()).decode("ascii")
+    ctx = mp.get_context("spawn")
+    print(f"PNG {args.side}px, {len(b64) / 1024:.0f} KB as base64")
+    print(f"{'mode':<22} {'median ms':>10} {'peak RSS MB':>12} {'Δ RSS MB':>9} {'response':>10}")
+    for label, body in modes:
+        q = ctx.Queue()
+        p = ctx.Process(target=_upload_child, args=(b64, body, args.repeat, q))
+        p.start()
+        res = _child_result(p, q, args.timeout)
+        p.join()
+        print(f"{label:<22} {res['ms']:>10.1f} {res['peak_mb']:>12.0f} {res['delta_mb']:>9.0f} "
+              f"{res['bytes'] / 1024:>8.0f}KB")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline benchmarks for JewelGen hot paths.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    v = sub.add_parser("vectorize", help="Latency and peak RSS of /api/vectorize on large motifs.")
+    v.add_argument("--sizes", type=int, nargs="+", default=[4096, 8192])
+    v.add_argument("--formats", nargs="+", default=["png", "jpg"])
+    v.add_argument("--repeat", type=int, default=1)
+    v.add_argument("--timeout", type=float, default=600, help="seconds to wait for each case")
+    v.set_defaults(fn=bench_vectorize)
+
+    u = sub.add_parser("upload", help="/generate response/upload modes with a fake upstream.")
+    u.add_argument("--side", type=int, default=1024)
+    u.add_argument("--repeat", type=int, default=5)
+    u.add_argument("--timeout", type=float, default=600, help="seconds to wait for each case")
+    u.set_defaults(fn=bench_upload)
+
+    args = ap.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+gunicorn.conf.py — picked up automatically by `gunicorn app:app`.
+
+JEWELGEN_SERVE_MODE=sync (default)  threaded workers, WEB_CONCURRENCY × GUNICORN_THREADS requests.
+JEWELGEN_SERVE_MODE=async           gevent workers; each holds GUNICORN_WORKER_CONNECTIONS requests
+                                    that mostly wait on OpenAI/Cloudinary. Same routes and JSON.
+"""
+
+import os
+
+SERVE_MODE = os.getenv("JEWELGEN_SERVE_MODE", "sync").strip().lower()
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+if SERVE_MODE == "async":
+    # httpcore probes for trio at import time, and trio needs select.epoll, which gevent's
+    # patching removes; import it in the master so forked workers inherit the loaded module
+    import httpcore  # noqa: F401
+
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+else:
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", "2"))
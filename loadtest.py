@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+loadtest.py — end-to-end load tests against a real gunicorn with a fake upstream.
+
+Usage:
+  python loadtest.py endpoints [--scenarios generate set-simple design-variants vectorize images]
+                               [--concurrency 10 50] [--requests 100] [--mode sync|async]
+                               [--latency 2.0] [--jitter 0.3] [--error-rate 0.05] [--json out.json]
+  python loadtest.py serve-modes [--concurrency 50 200] [--requests 400] [--latency 2.0]
+
+A local HTTP server stands in for OpenAI (images, chat) and Cloudinary (upload,
+search, destroy). It answers after a configurable latency, which is lognormal
+around the median when --jitter > 0, and fails a configurable share of calls
+(--error-rate with --error-status). So the numbers measure the app's own
+overhead and how much concurrency it holds, not the network. Each run gets a
+fresh JEWELGEN_DATA_DIR. `endpoints` reports throughput, tail latency and the
+peak RSS of the gunicorn master plus workers for each scenario × concurrency.
+--json writes the same rows for comparing runs.
+"""
+
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from bench import synthetic_motif
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else float("nan")
+
+
+# ── fake upstream ───────────────────────────────────────────────────────────
+class _Upstream(ThreadingHTTPServer):
+    """
+    OpenAI + Cloudinary stand-in. `latency` maps a call kind (image, chat, cloudinary)
+    to its median seconds; `error_rate` maps a kind to the share of calls answered
+    with `error_status` (429s carry Retry-After: 1).
+    """
+    daemon_threads = True
+    request_queue_size = 2048
+
+    def __init__(self, latency: dict, *, jitter: float = 0.0, error_rate: dict | None = None,
+                 error_status: int = 503, gallery_size: int = 200):
+        super().__init__(("127.0.0.1", 0), _UpstreamHandler)
+        self.latency, self.jitter = latency, jitter
+        self.error_rate, self.error_status = error_rate or {}, error_status
+        png = cv2.imencode(".png", np.full((64, 64, 3), 200, np.uint8))[1].tobytes()
+        self.b64 = base64.b64encode(png).decode("ascii")
+        self.gallery = [{
+            "public_id": f"ImageGeneration/load-{i}", "secure_url": f"https://example.invalid/load/{i}.png",
+            "created_at": f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z",
+            "context": {"custom": {"prompt": f"load ring {i}", "album": "index"}}, "tags": ["jewelgen"],
+        } for i in range(gallery_size)]
+        self.calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def delay(self, kind: str) -> float:
+        median = self.latency.get(kind, 0.0)
+        return median * math.exp(random.gauss(0.0, self.jitter)) if self.jitter else median
+
+    def count(self, kind: str) -> bool:
+        """Record one call; True if it should fail."""
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        return random.random() < self.error_rate.get(kind, 0.0)
+
+    def reset_counts(self) -> dict:
+        with self._lock:
+            calls, self.calls = self.calls, {}
+        return calls
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send({"resources": []})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        srv = self.server
+        if self.path.endswith("/images/generations"):
+            kind = "image"
+        elif self.path.endswith("/chat/completions"):
+            kind = "chat"
+        elif "/v1_1/" in self.path:
+            kind = "cloudinary"
+        else:
+            return self._send({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+        failed = srv.count(kind)
+        time.sleep(srv.delay(kind))
+        if failed:
+            return self._send({"error": {"message": "injected upstream failure"}}, srv.error_status)
+
+        if kind == "image":
+            self._send({"created": int(time.time()), "data": [{"b64_json": srv.b64}]})
+        elif kind == "chat":
+            self._send({"id": "x", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "A lightweight ring."}}]})
+        elif self.path.endswith("/resources/search"):
+            self._send({"resources": srv.gallery, "total_count": len(srv.gallery)})
+        elif self.path.endswith("/destroy"):
+            self._send({"result": "ok"})
+        else:
+            n = uuid.uuid4().hex[:12]
+            self._send({"secure_url": f"https://example.invalid/load/{n}.png", "public_id": f"load/{n}",
+                        "bytes": 1000, "format": "png", "width": 64, "height": 64,
+                        "created_at": "2026-01-01T00:00:00Z"})
+
+
+def _upstream_from_args(args) -> _Upstream:
+    upstream = _Upstream(
+        {"image": args.latency, "chat": args.chat_latency, "cloudinary": args.cloudinary_latency},
+        jitter=args.jitter, error_status=args.error_status,
+        error_rate={"image": args.error_rate, "chat": args.error_rate, "cloudinary": args.cloudinary_error_rate},
+    )
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    return upstream
+
+
+# ── gunicorn under test ─────────────────────────────────────────────────────
+def _start_app(mode: str, upstream: _Upstream, workers: int, **env_overrides):
+    port = _free_port()
+    env = dict(os.environ,
+               JEWELGEN_SERVE_MODE=mode, WEB_CONCURRENCY=str(workers), PORT=str(port),
+               JEWELGEN_DATA_DIR=tempfile.mkdtemp(prefix=f"loadtest-{mode}-"),
+               OPENAI_API_KEY="sk-load", OPENAI_BASE_URL=upstream.url + "/v1",
+               CLOUDINARY_CLOUD_NAME="load", CLOUDINARY_API_KEY="k", CLOUDINARY_API_SECRET="s",
+               CLOUDINARY_UPLOAD_PREFIX=upstream.url,
+               RATE_LIMIT_ENABLED="0", LIMIT_INITIAL="1000", LIMIT_MAX="1000", UPLOAD_MODE="sync")
+    env.update(env_overrides)
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}"],
+                            cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base + "/upstream", timeout=2).read()
+            return proc, base, log
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.3)
+    log.seek(0)
+    proc.kill()
+    raise SystemExit(f"gunicorn ({mode}) did not start:\n{log.read().decode(errors='replace')[-2000:]}")
+
+
+def _rss_mb(pid: int) -> float:
+    """RSS of a gunicorn master plus its workers (Linux /proc)."""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+class _RssSampler:
+    """Peak RSS of the gunicorn tree while a block runs (sampled every 100 ms)."""
+    def __init__(self, pid: int):
+        self.pid, self.peak = pid, 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(0.1):
+            self.peak = max(self.peak, _rss_mb(self.pid))
+
+    def __enter__(self):
+        self.peak = _rss_mb(self.pid)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_mb(self.pid))
+
+
+# ── client side ─────────────────────────────────────────────────────────────
+def _multipart(fields: list, files: list) -> tuple[bytes, str]:
+    """fields = [(name, value)], files = [(name, filename, bytes, content_type)] → (body, content type)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data, ctype in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f"Content-Type: {ctype}\r\n\r\n".encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _scenarios(motif_side: int) -> dict:
+    """name → fn(i) returning (method, path, body bytes | None, headers)."""
+    motif_png = cv2.imencode(".png", synthetic_motif(motif_side))[1].tobytes()
+
+    def as_json(body):
+        return json.dumps(body).encode(), {"Content-Type": "application/json"}
+
+    def as_form(fields, files=()):
+        body, ctype = _multipart(fields, list(files))
+        return body, {"Content-Type": ctype}
+
+    return {
+        "generate": lambda i: ("POST", "/generate",
+                               *as_json({"prompt": f"load ring {i}", "no_cache": True, "response": "url"})),
+        "set-simple": lambda i: ("POST", "/api/set-simple",
+                                 *as_form([("theme", f"load theme {i}"), ("pieces", "ring"), ("pieces", "earrings"),
+                                           ("pieces", "pendant"), ("no_cache", "1")])),
+        "design-variants": lambda i: ("POST", "/api/design-variants",
+                                      *as_form([("base_type", "ring"), ("base_motif", f"load motif {i}"),
+                                                ("metal", "18k Yellow"), ("stone", "Diamond"),
+                                                ("targets", '["pendant", "earrings", "bangle"]'),
+                                                ("no_cache", "1")])),
+        "vectorize": lambda i: ("POST", "/api/vectorize",
+                                *as_form([], [("image", f"motif_{i}.png", motif_png, "image/png")])),
+        "images": lambda i: ("GET", "/images?limit=30", None, {}),
+    }
+
+
+def _fire(base: str, method: str, path: str, body: bytes | None, headers: dict, timeout: float):
+    req = urllib.request.Request(base + path, data=body, method=method, headers=headers)
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - t0
+
+
+def _run(base: str, concurrency: int, total: int, timeout: float, make=None):
+    make = make or (lambda i: ("POST", "/generate", json.dumps(
+        {"prompt": f"load ring {i}", "no_cache": True, "response": "url"}).encode(),
+        {"Content-Type": "application/json"}))
+
+    def one(i):
+        return _fire(base, *make(i), timeout)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - t0
+    lat = [t for s, t in results if s == 200]
+    return {"rps": len(lat) / wall, "p50": _pct(lat, 0.50), "p95": _pct(lat, 0.95), "p99": _pct(lat, 0.99),
+            "errors": sum(1 for s, _ in results if s != 200), "wall": wall}
+
+
+# ── commands ────────────────────────────────────────────────────────────────
+def endpoints(args):
+    upstream = _upstream_from_args(args)
+    scenarios = _scenarios(args.motif_side)
+    unknown = set(args.scenarios) - set(scenarios)
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))} (have: {', '.join(scenarios)})")
+
+    print(f"fake upstream: image {args.latency:g}s, chat {args.chat_latency:g}s, cloudinary "
+          f"{args.cloudinary_latency:g}s median, jitter σ={args.jitter:g}, OpenAI errors {args.error_rate:.0%}, "
+          f"Cloudinary errors {args.cloudinary_error_rate:.0%} (HTTP {args.error_status})")
+    print(f"gunicorn: {args.mode} mode, {args.workers} workers, {args.requests} requests per row")
+    print(f"{'scenario':<16} {'conc':>5} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>7} "
+          f"{'peak RSS MB':>12} {'upstream calls':>15}")
+    rows = []
+    proc, base, log = _start_app(args.mode, upstream, args.workers, UPLOAD_MODE=args.upload_mode)
+    try:
+        for name in args.scenarios:
+            for conc in args.concurrency:
+                upstream.reset_counts()
+                with _RssSampler(proc.pid) as rss:
+                    res = _run(base, conc, args.requests, args.timeout, scenarios[name])
+                calls = upstream.reset_counts()
+                row = {"scenario": name, "concurrency": conc, **res, "peak_rss_mb": rss.peak, "upstream_calls": calls}
+                rows.append(row)
+                print(f"{name:<16} {conc:>5} {res['rps']:>7.1f} {res['p50']:>7.2f} {res['p95']:>7.2f} "
+                      f"{res['p99']:>7.2f} {res['errors']:>7} {rss.peak:>12.0f} {sum(calls.values()):>15}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        log.close()
+        upstream.shutdown()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "fn"}, "rows": rows}, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+def serve_modes(args):
+    upstream = _upstream_from_args(args)
+    print(f"fake upstream {upstream.url}: {args.latency:.1f}s per OpenAI call, {args.cloudinary_latency:.1f}s per "
+          f"Cloudinary call, {args.workers} gunicorn workers, {args.requests} × /generate per row")
+    print(f"{'mode':<7} {'conc':>5} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>7} {'RSS MB':>7}")
+    for mode in args.modes:
+        proc, base, log = _start_app(mode, upstream, args.workers)
+        try:
+            for conc in args.concurrency:
+                res = _run(base, conc, args.requests, args.timeout)
+                print(f"{mode:<7} {conc:>5} {res['rps']:>7.1f} {res['p50']:>7.2f} {res['p95']:>7.2f} "
+                      f"{res['p99']:>7.2f} {res['errors']:>7} {_rss_mb(proc.pid):>7.0f}")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+            log.close()
+    upstream.shutdown()
+
+
+def _upstream_options(p, *, latency: float, cloudinary_latency: float):
+    p.add_argument("--latency", type=float, default=latency, help="median seconds per image generation call")
+    p.add_argument("--chat-latency", type=float, default=1.0, help="median seconds per chat completion")
+    p.add_argument("--cloudinary-latency", type=float, default=cloudinary_latency,
+                   help="median seconds per Cloudinary call")
+    p.add_argument("--jitter", type=float, default=0.0, help="lognormal σ around each median (0 = fixed)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="share of OpenAI calls that fail")
+    p.add_argument("--cloudinary-error-rate", type=float, default=0.0, help="share of Cloudinary calls that fail")
+    p.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures")
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--timeout", type=float, default=120.0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load tests for JewelGen against a fake upstream.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    e = sub.add_parser("endpoints", help="Throughput, tail latency and RSS per endpoint scenario.")
+    e.add_argument("--scenarios", nargs="+", default=["generate", "set-simple", "design-variants", "vectorize", "images"])
+    e.add_argument("--concurrency", type=int, nargs="+", default=[10, 50])
+    e.add_argument("--requests", type=int, default=100)
+    e.add_argument("--mode", choices=["sync", "async"], default="sync")
+    e.add_argument("--upload-mode", choices=["sync", "background"], default="sync")
+    e.add_argument("--motif-side", type=int, default=1024, help="side of the synthetic motif for `vectorize`")
+    e.add_argument("--json", help="also write the rows to this file")
+    _upstream_options(e, latency=2.0, cloudinary_latency=0.3)
+    e.set_defaults(fn=endpoints)
+
+    s = sub.add_parser("serve-modes", help="/generate throughput and tail latency: sync vs async workers.")
+    s.add_argument("--modes", nargs="+", default=["sync", "async"])
+    s.add_argument("--concurrency", type=int, nargs="+", default=[50, 200])
+    s.add_argument("--requests", type=int, default=400)
+    _upstream_options(s, latency=2.0, cloudinary_latency=2.0)
+    s.set_defaults(fn=serve_modes)
+
+    args = ap.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
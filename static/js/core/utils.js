@@ -41,10 +41,41 @@ export async function fetchJSON(url, options = {}) {
   return await res.json();
 }
 
+// Shrink a photo before uploading it for image analysis. The vision model only looks at
+// ~2048px (long side) / 768px (short side), so larger uploads just cost upload time.
+// Returns a JPEG File when that is smaller, otherwise the original file.
+export async function downscaleImage(file, { longSide = 2048, shortSide = 768, quality = 0.85 } = {}) {
+  if (!file || !/^image\/(jpeg|png|webp)$/.test(file.type) || typeof createImageBitmap !== "function") return file;
+  let bmp;
+  try {
+    bmp = await createImageBitmap(file, { imageOrientation: "from-image" });
+  } catch {
+    return file; // let the server deal with formats the browser can't decode
+  }
+  const scale = Math.min(1, longSide / Math.max(bmp.width, bmp.height), shortSide / Math.min(bmp.width, bmp.height));
+  if (scale >= 1 && file.size <= 256 * 1024) {
+    bmp.close?.();
+    return file;
+  }
+  const canvas = document.createElement("canvas");
+  canvas.width = Math.max(1, Math.round(bmp.width * scale));
+  canvas.height = Math.max(1, Math.round(bmp.height * scale));
+  const ctx = canvas.getContext("2d");
+  ctx.fillStyle = "#fff"; // flatten transparency onto white, like the server does
+  ctx.fillRect(0, 0, canvas.width, canvas.height);
+  ctx.imageSmoothingQuality = "high";
+  ctx.drawImage(bmp, 0, 0, canvas.width, canvas.height);
+  bmp.close?.();
+  const blob = await new Promise(resolve => canvas.toBlob(resolve, "image/jpeg", quality));
+  if (!blob || blob.size >= file.size) return file;
+  return new File([blob], file.name.replace(/\.[^.]+$/, "") + ".jpg", { type: "image/jpeg" });
+}
+
 export default {
   byId,
   getValue,
   fillSelect,
   convertLabelToId,
-  fetchJSON
+  fetchJSON,
+  downscaleImage
 };
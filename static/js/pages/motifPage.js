@@ -1,5 +1,5 @@
 // static/js/pages/motifPage.js
-import { byId, fetchJSON } from "../core/utils.js";
+import { byId, fetchJSON, downscaleImage } from "../core/utils.js";
 
 (function initMotif() {
   const page = document.body?.dataset?.page || "";
@@ -96,17 +96,16 @@ import { byId, fetchJSON } from "../core/utils.js";
     const file = fileInput?.files?.[0];
     if (!file) return alert("Please upload a motif image first.");
 
-    const fd = new FormData();
-    fd.append("image", file);  // our backend supports "image" or "motif"
-    fd.append("motif", file);
-    const jt = (typeSel?.value || "").trim();
-    if (jt) fd.append("use_case", jt); // tell backend what jewelry to design
-
     setBusy(genBtn, true, "Generating...", "Generate Description & Prompt");
     descBox && (descBox.value = "");
     promptBox && (promptBox.value = "");
 
     try {
+      const fd = new FormData();
+      fd.append("image", await downscaleImage(file));  // backend reads "image" (or "motif")
+      const jt = (typeSel?.value || "").trim();
+      if (jt) fd.append("use_case", jt); // tell backend what jewelry to design
+
       const data = await fetchJSON(API_PROMPTS, { method: "POST", body: fd });
       descBox && (descBox.value   = data.description || "(no description)");
       promptBox && (promptBox.value = data.prompt || "(no prompt)");
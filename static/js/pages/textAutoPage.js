@@ -4,6 +4,8 @@
 // - Supports local transforms and image → text via /api/text-from-image
 // - Exports: initTextAutomation()
 
+import { downscaleImage } from "../core/utils.js";
+
 let booted = false;
 
 // ------------- Utilities -------------
@@ -29,7 +31,7 @@ function toPromptPreview({ mode, tone, length, text }) {
 
 async function extractFromImage(file) {
   const fd = new FormData();
-  fd.append("image", file);
+  fd.append("image", await downscaleImage(file));
   const res = await fetch("/api/text-from-image", { method: "POST", body: fd });
   // Server returns JSON; handle errors gracefully
   if (!res.ok) throw new Error(`Server ${res.status}`);
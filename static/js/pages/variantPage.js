@@ -98,14 +98,58 @@ import { byId } from "../core/utils.js";
       resultsGrid.innerHTML = `<p class="vx-subtle">No variants returned.</p>`;
       return;
     }
-    resultsGrid.innerHTML = list.map((v) => `
-      <figure>
-        <img src="${v.url}" alt="${v.label}">
-        <figcaption>${v.label}</figcaption>
+    resultsGrid.replaceChildren(...list.map((v) => variantFigure(v)));
+  }
+
+  // server values go through src/textContent, never innerHTML
+  function variantFigure(v, fig = document.createElement("figure")) {
+    const img = document.createElement("img");
+    img.src = v.url || "";
+    img.alt = v.label || "";
+    const caption = document.createElement("figcaption");
+    caption.textContent = v.label || "";
+    fig.replaceChildren(img, caption);
+    return fig;
+  }
+
+  // streaming: one tile per variant the server accepted, filled in as each one finishes
+  function renderPending(count) {
+    resultsGrid.innerHTML = Array.from({ length: count }, (_, i) => `
+      <figure data-index="${i}">
+        <div class="spinner"></div>
+        <figcaption>Generating…</figcaption>
       </figure>
     `).join("");
   }
 
+  function fillTile(i, v) {
+    const fig = resultsGrid.querySelector(`figure[data-index="${i}"]`);
+    if (fig) variantFigure(v, fig);
+  }
+
+  async function readVariantStream(res) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "";
+    let done = null;
+    for (;;) {
+      const { value, done: eof } = await reader.read();
+      if (value) buf += decoder.decode(value, { stream: true });
+      let nl;
+      while ((nl = buf.indexOf("\n")) >= 0) {
+        const line = buf.slice(0, nl).trim();
+        buf = buf.slice(nl + 1);
+        if (!line) continue;
+        const msg = JSON.parse(line);
+        if (msg.type === "start") renderPending(msg.count);
+        else if (msg.type === "variant") fillTile(msg.index, msg);
+        else if (msg.type === "done") done = msg;
+      }
+      if (eof) break;
+    }
+    if (done) renderResults(done.variants || []);
+  }
+
   // request builder
   function buildFormData() {
     const fd = new FormData();
@@ -131,11 +175,19 @@ import { byId } from "../core/utils.js";
       generateBtn.disabled = true;
       generateBtn.textContent = "Generating…";
 
-      const res = await fetch("/api/design-variants", { method: "POST", body: formData });
+      const res = await fetch("/api/design-variants", {
+        method: "POST",
+        body: formData,
+        headers: { "Accept": "application/x-ndjson" },
+      });
       if (!res.ok) throw new Error(`Server error (${res.status})`);
-      const data = await res.json();
 
-      renderResults(data?.variants || []);
+      if ((res.headers.get("Content-Type") || "").includes("ndjson") && res.body) {
+        await readVariantStream(res);
+      } else {
+        const data = await res.json();
+        renderResults(data?.variants || []);
+      }
     } catch (err) {
       resultsGrid.innerHTML = `<p style="color:#c0392b;">${err?.message || "Failed to generate variants."}</p>`;
     } finally {
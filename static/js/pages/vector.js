@@ -1,5 +1,6 @@
 // /static/js/pages/vector.js
 // Upload + Preview + API Vectorize (badges/banners aware)
+import { downscaleImage } from "../core/utils.js";
 
 (function () {
   let booted = false;
@@ -80,6 +81,7 @@
     const fd = new FormData();
     fd.append("image", file);
     fd.append("layout", "badges_banners");     // ← your requirement
+    fd.append("paths", "0");                   // only `svg` is used; skip the badges/banners arrays
     // Optional knobs (uncomment if your API supports them)
     // fd.append("max_width", "1200");
     // fd.append("colors", "1");               // 1-bit
@@ -133,7 +135,7 @@
 
   try {
     const fd = new FormData();
-    fd.append("image", currentFile);
+    fd.append("image", await downscaleImage(currentFile)); // only described by GPT-4o; full size not needed
     fd.append("style", "mono");        // mono | duotone | color
     fd.append("background", "white");  // white | transparent
     const res = await fetch("/api/vector-sprites", { method: "POST", body: fd });
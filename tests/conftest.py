@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# offline, throwaway state: no Cloudinary, no OpenAI key, no rate limiting
+os.environ["JEWELGEN_DATA_DIR"] = tempfile.mkdtemp(prefix="jewelgen-test-")
+os.environ["CLOUDINARY_CLOUD_NAME"] = ""
+os.environ["OPENAI_API_KEY"] = ""
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+
+@pytest.fixture(scope="session")
+def jewelgen():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(jewelgen):
+    return jewelgen.app.test_client()
+
+
+def png_bytes(side: int = 64, value: int = 255) -> bytes:
+    import cv2
+    import numpy as np
+    img = np.full((side, side), value, np.uint8)
+    img[side // 4: 3 * side // 4, side // 4: 3 * side // 4] = 0
+    return cv2.imencode(".png", img)[1].tobytes()
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+
+def test_results_arrive_as_each_task_finishes(jewelgen):
+    tasks = [lambda: (time.sleep(0.2), "slow")[1], lambda: "fast"]
+    out = list(jewelgen._fan_out(tasks, timeout=5))
+    assert [(i, r, e) for i, r, e, _ in out] == [(1, "fast", None), (0, "slow", None)]
+
+
+def test_errors_are_reported_per_task(jewelgen):
+    def boom():
+        raise ValueError("bad piece")
+    out = {i: (r, e) for i, r, e, _ in jewelgen._fan_out([boom, lambda: "ok"], timeout=5)}
+    assert out[1] == ("ok", None)
+    assert out[0][0] is None and isinstance(out[0][1], ValueError)
+
+
+def test_overrunning_task_times_out_without_holding_the_others(jewelgen):
+    release = threading.Event()
+    t0 = time.monotonic()
+    out = {i: (r, e) for i, r, e, _ in jewelgen._fan_out([lambda: release.wait(5), lambda: "ok"], timeout=0.2)}
+    release.set()
+    assert time.monotonic() - t0 < 2
+    assert out[1] == ("ok", None)
+    assert isinstance(out[0][1], TimeoutError)
+
+
+def test_timeout_counts_from_when_a_task_starts(jewelgen):
+    # with one task in flight at a time, the second waits for the first but still gets its own 0.3s
+    tasks = [lambda: (time.sleep(0.2), "a")[1], lambda: (time.sleep(0.2), "b")[1]]
+    out = {i: (r, e) for i, r, e, _ in jewelgen._fan_out(tasks, max_in_flight=1, timeout=0.3)}
+    assert out == {0: ("a", None), 1: ("b", None)}
+
+
+def test_max_in_flight_is_respected(jewelgen):
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def task():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return True
+    out = list(jewelgen._fan_out([task] * 8, max_in_flight=2, timeout=5))
+    assert len(out) == 8 and peak[0] <= 2
+
+
+def test_cancel_stops_the_fan_out(jewelgen):
+    token = jewelgen._CancelToken()
+    reset = jewelgen._cancel_ctx.set(token)
+    started = []
+
+    def task():
+        started.append(1)
+        time.sleep(0.3)
+        return True
+    threading.Timer(0.1, token.cancel, ("client disconnected",)).start()
+    try:
+        with pytest.raises(jewelgen._Cancelled):
+            list(jewelgen._fan_out([task] * 6, max_in_flight=2, timeout=5))
+    finally:
+        jewelgen._cancel_ctx.reset(reset)
+    assert len(started) == 2
+
+
+def test_abandoned_task_is_cancelled(jewelgen):
+    stopped = threading.Event()
+
+    def render():
+        for _ in range(250):  # stands in for retries/upload, which check the token between steps
+            time.sleep(0.02)
+            try:
+                jewelgen._check_cancelled()
+            except jewelgen._Cancelled:
+                stopped.set()
+                raise
+        return "png"
+    out = list(jewelgen._fan_out([render], timeout=0.2))
+    assert isinstance(out[0][2], TimeoutError)
+    assert stopped.wait(1)
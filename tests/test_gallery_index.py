@@ -0,0 +1,39 @@
+import time
+from contextlib import closing
+
+import pytest
+
+
+@pytest.fixture
+def gallery(jewelgen, monkeypatch):
+    """Empty, never-synced index and a fake Cloudinary Search with one image."""
+    with closing(jewelgen._gallery_db()) as db:
+        db.execute("DELETE FROM images")
+        db.execute("DELETE FROM meta")
+    searches = []
+
+    def search(expr, limit, cursor=None):
+        searches.append(expr)
+        return {"resources": [{"public_id": "ImageGeneration/ring", "secure_url": "https://example.invalid/ring.png",
+                               "created_at": "2026-01-01T00:00:00Z", "context": {"album": "index"}}]}
+    monkeypatch.setattr(jewelgen, "_gallery_search", search)
+    return searches
+
+
+def _ids(r):
+    return [it["public_id"] for it in r.get_json()["items"]]
+
+
+def test_first_request_syncs_the_index(jewelgen, gallery, client):
+    assert _ids(client.get("/images")) == ["ImageGeneration/ring"]
+    assert jewelgen._gallery_synced_at() > 0
+    assert _ids(client.get("/images")) == ["ImageGeneration/ring"]
+    assert len(gallery) == 1  # the second page came from the index
+
+
+def test_worker_without_the_first_sync_lease_serves_search(jewelgen, gallery, client):
+    with closing(jewelgen._gallery_db()) as db:  # another worker is mid-way through the first sync
+        db.execute("INSERT INTO meta(key, value) VALUES ('sync_lease', ?)", (time.time(),))
+    assert _ids(client.get("/images")) == ["ImageGeneration/ring"]
+    assert jewelgen._gallery_synced_at() == 0
+    assert len(gallery) == 1  # a live Search, not an empty index page
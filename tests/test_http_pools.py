@@ -0,0 +1,25 @@
+import time
+
+import pytest
+import urllib3
+
+
+def test_cloudinary_pool_has_finite_timeouts(jewelgen):
+    timeout = jewelgen._cloudinary_http.connection_pool_kw["timeout"]
+    assert timeout.connect_timeout == jewelgen.HTTP_CONNECT_TIMEOUT
+    assert timeout.read_timeout == jewelgen.HTTP_READ_TIMEOUT
+
+
+def test_exhausted_cloudinary_pool_gives_up_after_the_pool_timeout(jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "HTTP_MAX_CONNECTIONS", 1)
+    monkeypatch.setattr(jewelgen, "HTTP_POOL_TIMEOUT", 0.2)
+    mgr = jewelgen._cloudinary_pool_manager()
+    pool = mgr.connection_from_url("http://127.0.0.1:9/")
+    held = pool._get_conn()  # the only connection is busy elsewhere
+    t0 = time.monotonic()
+    try:
+        with pytest.raises(urllib3.exceptions.EmptyPoolError):
+            mgr.urlopen("POST", "http://127.0.0.1:9/v1_1/test/image/upload", retries=False)
+    finally:
+        pool._put_conn(held)
+    assert time.monotonic() - t0 < 2
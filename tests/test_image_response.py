@@ -0,0 +1,65 @@
+import base64
+import io
+import uuid
+
+import pytest
+
+from conftest import png_bytes
+
+
+class _FakeImages:
+    def generate(self, **kwargs):
+        item = type("Image", (), {"b64_json": base64.b64encode(png_bytes()).decode("ascii"), "url": None})()
+        return type("ImagesResponse", (), {"data": [item]})()
+
+
+class _FakeOpenAI:
+    images = _FakeImages()
+
+    def with_options(self, **kwargs):
+        return self
+
+
+@pytest.fixture
+def upstream(jewelgen, monkeypatch):
+    """Fake OpenAI + Cloudinary with background uploads on; records synchronous uploads."""
+    uploads = []
+
+    def upload(file, **kwargs):
+        public_id = "test/" + uuid.uuid4().hex
+        uploads.append(public_id)
+        return {"secure_url": f"https://example.invalid/{public_id}.png", "public_id": public_id, "bytes": 1}
+    monkeypatch.setattr(jewelgen, "_client", _FakeOpenAI())
+    monkeypatch.setattr(jewelgen, "_guards", {})
+    for name, value in (("CLOUDINARY_CLOUD_NAME", "test"), ("CLOUDINARY_API_KEY", "k"),
+                        ("CLOUDINARY_API_SECRET", "s"), ("UPLOAD_MODE", "background")):
+        monkeypatch.setattr(jewelgen, name, value)
+    monkeypatch.setattr(jewelgen, "_enqueue_upload", lambda png, **kw: {"upload_id": "queued", "status": "queued",
+                                                                        "status_url": "/uploads/queued"})
+    monkeypatch.setattr(jewelgen.cloudinary.uploader, "upload", upload)
+    return uploads
+
+
+def test_generate_url_mode_uploads_in_the_request(upstream, client):
+    r = client.post("/generate", json={"prompt": "ring " + uuid.uuid4().hex, "no_cache": True, "response": "url"})
+    body = r.get_json()
+    assert r.status_code == 200, body
+    assert body["image"] is None
+    assert body["cloudinary"]["url"] and body["file_path"] == body["cloudinary"]["url"]
+    assert "upload" not in body and len(upstream) == 1
+
+
+def test_generate_json_mode_keeps_the_background_upload(upstream, client):
+    r = client.post("/generate", json={"prompt": "ring " + uuid.uuid4().hex, "no_cache": True})
+    body = r.get_json()
+    assert body["image"] and body["upload"]["upload_id"] == "queued"
+    assert upstream == []
+
+
+def test_vector_sprites_url_mode_returns_a_url(upstream, client):
+    r = client.post("/api/vector-sprites", data={
+        "image": (io.BytesIO(png_bytes()), "m.png"), "no_cache": "1", "response": "url"})
+    body = r.get_json()
+    assert r.status_code == 200, body
+    assert body["url"].startswith("https://example.invalid/") and body["b64"] is None
+    assert "upload" not in body
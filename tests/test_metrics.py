@@ -0,0 +1,33 @@
+import json
+import time
+from contextlib import closing
+
+
+def _write_proc(jewelgen, proc, seen_at, retries):
+    with closing(jewelgen._metrics_db()) as db:
+        db.execute("INSERT OR REPLACE INTO metrics_procs (proc, pid, seen_at) VALUES (?, ?, ?)", (proc, 1, seen_at))
+        db.execute("INSERT OR REPLACE INTO metrics (proc, name, labels, value, updated_at) VALUES (?, ?, ?, ?, ?)",
+                   (proc, "jewelgen_upstream_retries_total", json.dumps({"step": "metrics-test"}),
+                    json.dumps(retries), seen_at))
+
+
+def test_metrics_sum_live_workers_and_drop_gone_ones(jewelgen, client):
+    now = time.time()
+    _write_proc(jewelgen, "live-worker", now, 2.0)
+    _write_proc(jewelgen, "gone-worker", now - jewelgen.METRICS_STALE_SECONDS - 1, 40.0)
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'jewelgen_upstream_retries_total{step="metrics-test"} 2' in body.splitlines()
+    with closing(jewelgen._metrics_db()) as db:
+        procs = {r["proc"] for r in db.execute("SELECT proc FROM metrics_procs")}
+        gone = db.execute("SELECT COUNT(*) FROM metrics WHERE proc='gone-worker'").fetchone()[0]
+    assert "gone-worker" not in procs and gone == 0
+    assert {"live-worker", jewelgen._metrics_proc_id} <= procs  # scraping also heartbeats this worker
+
+
+def test_idle_flush_still_heartbeats(jewelgen):
+    jewelgen._metrics_flush()
+    jewelgen._metrics_flush()  # nothing new recorded in between
+    with closing(jewelgen._metrics_db()) as db:
+        seen = db.execute("SELECT seen_at FROM metrics_procs WHERE proc=?", (jewelgen._metrics_proc_id,)).fetchone()
+    assert seen and time.time() - seen[0] < 5
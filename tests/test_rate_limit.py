@@ -0,0 +1,64 @@
+import hashlib
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def limited(jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(jewelgen, "RATE_CLIENT_BURST", 3.0)
+    monkeypatch.setattr(jewelgen, "RATE_CLIENT_PER_MINUTE", 0.6)
+    monkeypatch.setattr(jewelgen, "RATE_MODEL_BURST", 50.0)
+    return jewelgen
+
+
+def _key():
+    return "test:" + uuid.uuid4().hex
+
+
+def test_take_tokens_charges_until_empty(jewelgen):
+    key = _key()
+    assert jewelgen._take_tokens([(key, 60.0, 2.0)], 1) == (True, 0.0, pytest.approx(1.0, abs=0.01))
+    assert jewelgen._take_tokens([(key, 60.0, 2.0)], 1)[0]
+    ok, retry_after, left = jewelgen._take_tokens([(key, 60.0, 2.0)], 1)
+    assert not ok
+    assert 0.9 < retry_after <= 1.0  # one token at 1/s
+    assert left < 1
+
+
+def test_take_tokens_is_all_or_nothing(jewelgen):
+    full, empty = _key(), _key()
+    assert jewelgen._take_tokens([(empty, 60.0, 1.0)], 1)[0]
+    ok, _, _ = jewelgen._take_tokens([(full, 60.0, 5.0), (empty, 1.0, 1.0)], 1)
+    assert not ok
+    ok, _, left = jewelgen._take_tokens([(full, 60.0, 5.0)], 5)
+    assert ok and left == pytest.approx(0.0, abs=0.1)  # the rejected call charged nothing
+
+
+def test_rate_limited_request_gets_retry_after(limited, client, monkeypatch):
+    api_key = _key()
+    monkeypatch.setattr(limited, "API_KEYS", {api_key})
+    bucket = "client:key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    assert limited._take_tokens([(bucket, 0.6, 3.0)], 2)[0]  # earlier requests used 2 of 3
+    r = client.post("/api/set-simple", data={"pieces": ["ring", "pendant"]}, headers={"X-API-Key": api_key})
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 60  # one token at 0.6/min
+
+
+def test_request_above_burst_is_413_not_429(limited, client):
+    pieces = ["necklace", "earrings", "ring", "bangle"]
+    r = client.post("/api/set-simple", data={"pieces": pieces}, headers={"X-API-Key": _key()})
+    assert r.status_code == 413
+    assert "at most 3" in r.get_json()["error"]["message"]
+    assert "Retry-After" not in r.headers
+
+
+def test_unknown_api_keys_share_the_ip_bucket(limited, client):
+    ip = "203.0.113.%d" % (uuid.uuid4().int % 250)
+    env = {"REMOTE_ADDR": ip}
+    assert limited._take_tokens([("client:ip:" + ip, 0.6, 3.0)], 2)[0]
+    for _ in range(2):  # a fresh made-up key per request still pays from the same bucket
+        r = client.post("/api/set-simple", data={"pieces": ["ring", "pendant"]},
+                        headers={"X-API-Key": _key()}, environ_base=env)
+        assert r.status_code == 429
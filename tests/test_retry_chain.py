@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def fast_retries(jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "RETRY_BASE_DELAY", 0.05)
+    monkeypatch.setattr(jewelgen, "RETRY_MAX_DELAY", 0.2)
+
+
+def _flaky(fails, exc=TimeoutError("timed out"), result="ok"):
+    calls = []
+
+    def fn(left):
+        calls.append(threading.current_thread().name)
+        if len(calls) <= fails:
+            raise exc
+        return result
+    return fn, calls
+
+
+def test_transient_errors_back_off_on_the_calling_thread(jewelgen, fast_retries):
+    fn, calls = _flaky(2)
+    t0 = time.monotonic()
+    assert jewelgen._retry_chain([("step", fn, 3)], budget=5) == "ok"
+    assert len(calls) == 3
+    assert set(calls) == {threading.current_thread().name}
+    assert time.monotonic() - t0 >= 0.05 / 2 + 0.1 / 2  # two jittered backoffs
+
+
+def test_non_transient_error_falls_back_to_next_step(jewelgen, fast_retries):
+    first, first_calls = _flaky(5, exc=ValueError("bad prompt"))
+    second, _ = _flaky(0, result="fallback")
+    assert jewelgen._retry_chain([("a", first, 3), ("b", second, 1)], budget=5) == "fallback"
+    assert len(first_calls) == 1
+
+
+def test_budget_too_short_for_the_backoff_gives_up(jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "RETRY_BASE_DELAY", 5)
+    fn, calls = _flaky(1)
+    t0 = time.monotonic()
+    assert jewelgen._retry_chain([("step", fn, 3)], budget=1) is None
+    assert len(calls) == 1
+    assert time.monotonic() - t0 < 0.5
+
+
+def test_every_step_short_circuited_raises_circuit_open(jewelgen):
+    err = jewelgen._CircuitOpen("image:test", 7)
+
+    def rejected(left):
+        raise err
+    with pytest.raises(jewelgen._CircuitOpen):
+        jewelgen._retry_chain([("a", rejected, 2), ("b", rejected, 2)], budget=5)
+
+
+def test_cancel_ends_the_backoff_wait(jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "RETRY_BASE_DELAY", 10)
+    monkeypatch.setattr(jewelgen, "RETRY_MAX_DELAY", 10)
+    token = jewelgen._CancelToken()
+    reset = jewelgen._cancel_ctx.set(token)
+    fn, calls = _flaky(5)
+    threading.Timer(0.1, token.cancel, ("client disconnected",)).start()
+    t0 = time.monotonic()
+    try:
+        with pytest.raises(jewelgen._Cancelled):
+            jewelgen._retry_chain([("step", fn, 3)], budget=60)
+    finally:
+        jewelgen._cancel_ctx.reset(reset)
+    assert len(calls) == 1
+    assert time.monotonic() - t0 < 2
+
+
+def test_renders_are_not_capped_by_the_retry_pool(jewelgen):
+    n = jewelgen.RETRY_WORKERS + 4
+    barrier = threading.Barrier(n, timeout=5)
+
+    def render(left):
+        barrier.wait()  # only passes once all n attempts are in flight together
+        return "png"
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(jewelgen._retry_chain([("s", render, 1)], budget=10)))
+               for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert results == ["png"] * n
+
+
+def test_images_client_follows_a_replaced_client(jewelgen, monkeypatch):
+    class Fake:
+        def with_options(self, **kwargs):
+            assert kwargs == {"max_retries": 0}
+            return self
+    fake = Fake()
+    monkeypatch.setattr(jewelgen, "_client", fake)
+    assert jewelgen._images_client() is fake
+    monkeypatch.setattr(jewelgen, "_client", None)
+    assert jewelgen._images_client() is None
+
+
+def test_webhook_retries_are_scheduled_not_slept(jewelgen, fast_retries, monkeypatch):
+    calls, done = [], threading.Event()
+
+    class Response:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def read(self):
+            return b""
+
+    def urlopen(req, timeout):
+        calls.append(threading.current_thread().name)
+        if len(calls) < 3:
+            raise ConnectionError("connection reset")
+        done.set()
+        return Response()
+    delays = []
+    call_later = jewelgen._scheduler.call_later
+    monkeypatch.setattr(jewelgen.urllib.request, "urlopen", urlopen)
+    monkeypatch.setattr(jewelgen._scheduler, "call_later", lambda d, fn, *a: (delays.append(d), call_later(d, fn, *a)))
+
+    t0 = time.monotonic()
+    assert jewelgen._post_callback("http://example.invalid/hook", {"ok": True}) is None
+    assert time.monotonic() - t0 < 0.05
+    assert done.wait(5)
+    assert len(calls) == 3 and len(delays) == 2
+    assert all(name.startswith("retry") for name in calls)
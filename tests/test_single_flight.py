@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+
+def _start(target, n):
+    threads = [threading.Thread(target=target) for _ in range(n)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def test_identical_calls_share_one_run(jewelgen):
+    sf, calls, results = jewelgen._SingleFlight(), [], []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "png"
+    threads = _start(lambda: results.append(sf.do("k", fn, timeout=5)), 5)
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert calls == [1]
+    assert results == ["png"] * 5
+
+
+def test_followers_get_the_leaders_error(jewelgen):
+    sf, errors = jewelgen._SingleFlight(), []
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise ValueError("upstream said no")
+
+    def call():
+        try:
+            sf.do("k", fn, timeout=5)
+        except ValueError as e:
+            errors.append(e)
+    threads = _start(call, 3)
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(errors) == 3 and len({id(e) for e in errors}) == 1
+
+
+def test_follower_times_out_waiting(jewelgen):
+    sf = jewelgen._SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: sf.do("k", lambda: release.wait(5)))
+    leader.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(TimeoutError):
+            sf.do("k", lambda: "never", timeout=0.1)
+    finally:
+        release.set()
+        leader.join(5)
+
+
+def test_follower_leads_when_the_leader_is_cancelled(jewelgen):
+    sf, results = jewelgen._SingleFlight(), []
+    release = threading.Event()
+
+    def cancelled():
+        release.wait(5)
+        raise jewelgen._Cancelled("client disconnected")
+
+    def leader():
+        with pytest.raises(jewelgen._Cancelled):
+            sf.do("k", cancelled)
+    t = threading.Thread(target=leader)
+    t.start()
+    time.sleep(0.05)
+    follower = threading.Thread(target=lambda: results.append(sf.do("k", lambda: "mine", timeout=5)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    t.join(5)
+    follower.join(5)
+    assert results == ["mine"]
+
+
+def test_keys_are_released_after_each_flight(jewelgen):
+    sf = jewelgen._SingleFlight()
+    assert sf.do("k", lambda: 1) == 1
+    assert sf.do("k", lambda: 2) == 2
+    assert sf._flights == {}
@@ -0,0 +1,55 @@
+import re
+
+import numpy as np
+
+
+def _absolute_points(d):
+    """Vertices of every subpath in a relative (M/l/h/v/z) path string."""
+    out = []
+    for sub in re.findall(r"M[^M]*", d):
+        tokens = re.findall(r"[Mlhvz]|-?[\d.]+", sub)
+        x = y = 0.0
+        pts, i = [], 0
+        while i < len(tokens):
+            t = tokens[i]
+            if t == "M":
+                x, y = float(tokens[i + 1]), float(tokens[i + 2])
+                i += 3
+            elif t == "l":
+                x, y = x + float(tokens[i + 1]), y + float(tokens[i + 2])
+                i += 3
+            elif t == "h":
+                x += float(tokens[i + 1])
+                i += 2
+            elif t == "v":
+                y += float(tokens[i + 1])
+                i += 2
+            else:
+                i += 1
+                continue
+            pts.append((round(x, 6), round(y, 6)))
+        out.append(pts)
+    return out
+
+
+def test_relative_path_uses_compact_commands(jewelgen):
+    square = np.array([[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+    assert jewelgen._svg_path_data([square]) == "M0,0h10v10h-10v-10z"
+    assert jewelgen._svg_path_data([square], relative=False) == "M0,0L10,0L10,10L0,10L0,0Z"
+
+
+def test_negative_deltas_need_no_separator(jewelgen):
+    assert jewelgen._svg_path_data([np.array([[1.26, 2.5], [3.1, -4.04]])], precision=1) == "M1.3,2.5l1.8-6.5z"
+
+
+def test_relative_deltas_do_not_drift(jewelgen):
+    rng = np.random.default_rng(0)
+    pts = rng.uniform(0, 1000, (500, 2))
+    d = jewelgen._svg_path_data([pts], precision=1)
+    expected = [tuple(p) for p in np.round(np.rint(pts * 10) / 10, 6)]
+    assert _absolute_points(d) == [expected]
+
+
+def test_zero_length_segments_and_empty_polygons_are_dropped(jewelgen):
+    assert jewelgen._svg_path_data([np.array([[1, 1], [1, 1]])]) == ""
+    assert jewelgen._svg_path_data([np.array([[0, 0], [0, 0], [5, 0], [5, 0]])]) == "M0,0h5z"
@@ -0,0 +1,46 @@
+import io
+import mmap
+
+import numpy as np
+import pytest
+from werkzeug.datastructures import FileStorage
+
+
+def _upload(jewelgen, size):
+    data = bytes(range(256)) * (size // 256)
+    return jewelgen.app.test_request_context(
+        "/api/vectorize", method="POST", data={"image": (io.BytesIO(data), "m.png")}), data
+
+
+def test_small_upload_is_a_memoryview_released_at_teardown(jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "INGEST_SPOOL_BYTES", 1 << 20)
+    ctx, data = _upload(jewelgen, 4096)
+    with ctx:
+        view = jewelgen._upload_buffer(jewelgen.request.files["image"])
+        assert isinstance(view, memoryview) and bytes(view) == data
+    with pytest.raises(ValueError):
+        view.tobytes()  # released
+
+
+def test_spooled_upload_is_an_mmap_closed_at_teardown(jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "INGEST_SPOOL_BYTES", 1024)
+    ctx, data = _upload(jewelgen, 64 * 1024)
+    with ctx:
+        view = jewelgen._upload_buffer(jewelgen.request.files["image"])
+        assert isinstance(view, mmap.mmap) and view[:] == data
+        assert jewelgen._buffer_file(view).read() == data
+    assert view.closed
+
+
+def test_teardown_tolerates_views_still_exported(jewelgen):
+    with jewelgen.app.test_request_context("/"):
+        view = jewelgen._upload_buffer(FileStorage(io.BytesIO(b"\x01\x02\x03\x04"), "m.png"))
+        arr = np.frombuffer(view, np.uint8)  # keeps the buffer exported past teardown
+    assert arr.tolist() == [1, 2, 3, 4]
+
+
+def test_streams_without_a_file_descriptor_are_read(jewelgen):
+    stream = io.BufferedReader(io.BytesIO(b"abc"))  # no fileno(), not a BytesIO
+    stream.read()
+    with jewelgen.app.test_request_context("/"):
+        assert jewelgen._upload_buffer(stream) == b"abc"
@@ -0,0 +1,105 @@
+import json
+import time
+
+import pytest
+
+
+@pytest.fixture
+def guard(jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "_guards", {})
+    monkeypatch.setattr(jewelgen, "BREAKER_FAILURES", 3)
+    monkeypatch.setattr(jewelgen, "BREAKER_COOLDOWN", 0.2)
+    monkeypatch.setattr(jewelgen, "LIMIT_INITIAL", 4)
+    return jewelgen._guard("image:test")
+
+
+def _fail(g, n=1):
+    for _ in range(n):
+        probe = g.acquire()
+        g.release(False, 0.1, probe)
+
+
+def test_breaker_opens_after_consecutive_failures(jewelgen, guard):
+    _fail(guard, 2)
+    assert guard.state == "closed"
+    _fail(guard)
+    assert guard.state == "open"
+    with pytest.raises(jewelgen._CircuitOpen) as exc:
+        guard.acquire()
+    assert exc.value.status == 503
+    assert int(exc.value.headers["Retry-After"]) >= 1
+
+
+def test_half_open_probe_closes_or_reopens(jewelgen, guard):
+    _fail(guard, 3)
+    time.sleep(0.25)
+    assert guard.acquire() is True  # the single probe
+    with pytest.raises(jewelgen._CircuitOpen):
+        guard.acquire()  # a second caller while the probe is in flight
+    guard.release(False, 0.1, True)
+    assert guard.state == "open"
+
+    time.sleep(0.25)
+    guard.release(True, 0.1, guard.acquire())
+    assert guard.state == "closed"
+    guard.release(True, 0.1, guard.acquire())
+
+
+def test_check_does_not_take_the_probe(jewelgen, guard):
+    _fail(guard, 3)
+    with pytest.raises(jewelgen._CircuitOpen):
+        guard.check()
+    time.sleep(0.25)
+    guard.check()  # cooldown over: no error, and the probe is still available
+    assert guard.acquire() is True
+
+
+def test_aimd_additive_increase_and_multiplicative_decrease(guard):
+    guard.release(True, 0.1, guard.acquire())
+    assert guard.limit == pytest.approx(4.25)
+    guard.last_decrease = 0.0
+    _fail(guard)
+    assert guard.limit == pytest.approx(2.125)
+    _fail(guard)
+    assert guard.limit == pytest.approx(2.125)  # at most one decrease per second
+
+
+def test_aimd_decreases_on_latency_above_baseline(guard):
+    guard.release(True, 0.1, guard.acquire())
+    before = guard.limit
+    guard.last_decrease = 0.0
+    guard.release(True, 1.0, guard.acquire())  # 10x the baseline
+    assert guard.limit == pytest.approx(before / 2)
+
+
+def test_all_shed(jewelgen):
+    shed = [jewelgen._CircuitOpen("image:x", 3), jewelgen._CircuitOpen("image:x", 9)]
+    with pytest.raises(jewelgen._CircuitOpen) as exc:
+        jewelgen._all_shed(shed)
+    assert exc.value.headers["Retry-After"] == "9"
+    jewelgen._all_shed(shed + [None])  # one item worked: a normal 200
+    jewelgen._all_shed([])
+
+
+def test_batch_endpoints_return_503_while_the_breaker_is_open(jewelgen, client, monkeypatch):
+    monkeypatch.setattr(jewelgen, "_guards", {})
+    g = jewelgen._guard("image:dall-e-3")
+    g.state, g.opened_at = "open", time.monotonic()
+    r = client.post("/api/set-simple", data={"pieces": ["ring", "pendant"]})
+    assert r.status_code == 503 and "Retry-After" in r.headers
+    r = client.post("/api/design-variants", data={"targets": json.dumps(["ring"])})
+    assert r.status_code == 503 and "Retry-After" in r.headers
+
+
+def test_set_shed_mid_batch_is_503(jewelgen, client, monkeypatch):
+    monkeypatch.setattr(jewelgen, "_guards", {})
+
+    def shed(*args, **kwargs):
+        raise jewelgen._CircuitOpen("image:dall-e-3", 5)
+
+    monkeypatch.setattr(jewelgen, "_render_and_upload", shed)
+    r = client.post("/api/set-simple", data={"pieces": ["ring", "pendant"]})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "5"
+    r = client.post("/api/design-variants", data={"targets": json.dumps(["ring", "pendant"])})
+    assert r.status_code == 503
@@ -0,0 +1,62 @@
+import re
+
+import cv2
+import numpy as np
+
+
+def _motif(w=400, h=200):
+    img = np.full((h, w), 255, np.uint8)
+    cv2.circle(img, (w // 4, h // 2), h // 4, 0, -1)
+    cv2.circle(img, (w // 4, h // 2), h // 10, 255, -1)
+    cv2.rectangle(img, (w // 2, h // 3), (w - w // 8, h // 3 + h // 10), 0, -1)
+    return img
+
+
+def _coords(paths):
+    xs, ys = [], []
+    for el in paths:
+        for x, y in re.findall(r"M(-?[\d.]+),(-?[\d.]+)", el):
+            xs.append(float(x))
+            ys.append(float(y))
+    return xs, ys
+
+
+def test_decode_caps_the_working_resolution(jewelgen):
+    data = cv2.imencode(".png", _motif(1600, 800))[1].tobytes()
+    gray, W, H = jewelgen._decode_gray(data, 300)
+    assert (W, H) == (1600, 800)
+    assert max(gray.shape) <= 300
+    full, W, H = jewelgen._decode_gray(data, 0)
+    assert full.shape == (800, 1600) and (W, H) == (1600, 800)
+
+
+def test_undecodable_bytes(jewelgen):
+    assert jewelgen._decode_gray(b"not an image") == (None, 0, 0)
+
+
+def test_paths_are_emitted_in_original_coordinates(jewelgen):
+    gray = _motif(400, 200)
+    small = jewelgen._vectorize_gray(gray, 400, 200, preset="detailed")
+    big = jewelgen._vectorize_gray(gray, 1600, 800, preset="detailed")
+    assert (big["width"], big["height"]) == (1600, 800)
+    xs, ys = _coords(big["badges"] + big["banners"])
+    sx, sy = _coords(small["badges"] + small["banners"])
+    assert xs and max(xs) > 400 and max(xs) <= 1600 and max(ys) <= 800
+    assert np.allclose(sorted(xs), sorted(4 * x for x in sx), atol=4)
+
+
+def test_solid_and_outline_modes(jewelgen):
+    gray = _motif()
+    solid = jewelgen._vectorize_gray(gray, 400, 200, preset="detailed")
+    outline = jewelgen._vectorize_gray(gray, 400, 200, preset="outline")
+    assert not solid["outline_mode"] and 'fill="#000"' in (solid["badges"] + solid["banners"])[0]
+    assert outline["outline_mode"] and 'fill="none"' in (outline["badges"] + outline["banners"])[0]
+    flat = jewelgen._vectorize_gray(gray, 400, 200, preset="detailed", layout="flat")
+    assert flat["banners"] == [] and len(flat["badges"]) == len(solid["badges"]) + len(solid["banners"])
+
+
+def test_svg_document_keeps_the_original_view_box(jewelgen):
+    data = cv2.imencode(".png", _motif(1600, 800))[1].tobytes()
+    doc = jewelgen._vectorize_file(data, 300, {"preset": "detailed"})
+    assert doc["svg"].startswith('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1600 800"')
+    assert doc["svg"].endswith("</svg>") and doc["paths"] > 0
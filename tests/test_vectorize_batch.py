@@ -0,0 +1,58 @@
+import io
+import json
+import zipfile
+
+from conftest import png_bytes
+
+
+def _zip(entries: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def test_safe_entry_name(jewelgen):
+    safe = jewelgen._safe_entry_name
+    assert safe("../evil.png") == "evil.png"
+    assert safe("/etc/x.png") == "etc/x.png"
+    assert safe("a/./b/../c.png") == "a/b/c.png"
+    assert safe("C:\\Users\\me\\m.png") == "Users/me/m.png"
+    assert safe("..") == "image"
+
+
+def test_batch_output_names_stay_inside_the_archive(client):
+    data = png_bytes()
+    r = client.post("/api/vectorize/batch", data={
+        "zip": (_zip({"../evil.png": data, "/abs/motif.png": data, "ok.png": data}), "in.zip"),
+    })
+    assert r.status_code == 200, r.get_data(as_text=True)
+    with zipfile.ZipFile(io.BytesIO(r.get_data())) as zf:
+        names = zf.namelist()
+        manifest = json.loads(zf.read("manifest.json"))
+    assert sorted(names) == ["abs/motif.svg", "evil.svg", "manifest.json", "ok.svg"]
+    assert all(".." not in n and not n.startswith("/") for n in names)
+    assert manifest["failed"] == 0
+
+
+def test_batch_rejects_too_many_zip_entries(client, jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "VECTORIZE_BATCH_MAX", 2)
+    data = png_bytes(8)
+    r = client.post("/api/vectorize/batch", data={
+        "zip": (_zip({f"{i}.png": data for i in range(3)}), "in.zip"),
+    })
+    assert r.status_code == 400
+    assert "Too many files" in r.get_json()["error"]["message"]
+
+
+def test_batch_caps_total_unzipped_size(client, jewelgen, monkeypatch):
+    monkeypatch.setattr(jewelgen, "VECTORIZE_UNZIPPED_BYTES", 1000)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(2):
+            zf.writestr(f"{i}.png", b"\0" * 800)  # compresses to almost nothing
+    buf.seek(0)
+    r = client.post("/api/vectorize/batch", data={"zip": (buf, "bomb.zip")})
+    assert r.status_code == 413
@@ -0,0 +1,69 @@
+import hashlib
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import png_bytes
+
+
+def _encode(img: Image.Image, fmt: str, **kwargs) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def _noise(w: int, h: int, mode: str = "RGB") -> Image.Image:
+    channels = {"RGB": 3, "RGBA": 4}[mode]
+    arr = np.random.default_rng(0).integers(0, 256, (h, w, channels), dtype=np.uint8)
+    return Image.fromarray(arr, mode)
+
+
+def test_large_upload_is_downscaled_to_vision_bounds(jewelgen):
+    body, mime = jewelgen._vision_image(_encode(_noise(3000, 1500), "PNG"))
+    assert mime == "image/jpeg"
+    w, h = Image.open(io.BytesIO(body)).size
+    assert (w, h) == (1536, 768)  # short side 768, long side within 2048
+
+
+def test_small_sendable_upload_passes_through(jewelgen):
+    data = _encode(_noise(200, 100), "JPEG", quality=80)
+    assert jewelgen._vision_image(data) == (data, "image/jpeg")
+    view = memoryview(data)  # upload buffers work too, and come back as bytes
+    assert jewelgen._vision_image(view) == (data, "image/jpeg")
+
+
+def test_exif_rotation_is_applied(jewelgen):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90° CW on display
+    data = _encode(_noise(400, 200), "JPEG", exif=exif)
+    body, _ = jewelgen._vision_image(data)
+    assert Image.open(io.BytesIO(body)).size == (200, 400)
+
+
+def test_alpha_is_flattened_on_white(jewelgen):
+    img = _noise(1000, 1000, "RGBA")
+    img.paste((0, 0, 0, 0), (0, 0, 500, 500))  # fully transparent (black) corner
+    body, mime = jewelgen._vision_image(_encode(img, "PNG"))
+    assert mime == "image/jpeg"
+    r, g, b = Image.open(io.BytesIO(body)).getpixel((100, 100))
+    assert min(r, g, b) > 245
+
+    flat = Image.new("RGBA", (300, 300), (0, 0, 0, 0))
+    data = _encode(flat, "PNG")
+    assert jewelgen._vision_image(data) == (data, "image/png")  # already tiny: sent as-is
+
+
+def test_undecodable_upload_is_400(jewelgen):
+    with pytest.raises(jewelgen._JobError) as exc:
+        jewelgen._vision_image(b"not an image")
+    assert exc.value.status == 400
+
+
+def test_cache_key_accepts_the_upload_digest(jewelgen):
+    data = png_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    assert (jewelgen._vision_cache_key("vector_sprites", data, None)
+            == jewelgen._vision_cache_key("vector_sprites", digest, None)
+            == jewelgen._vision_cache_key("vector_sprites", memoryview(data), None))